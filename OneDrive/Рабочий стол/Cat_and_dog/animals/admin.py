@@ -1,6 +1,19 @@
-from django.db import models
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db.models import Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.template.response import TemplateResponse
 from .models import Shelter, Animal, AdoptionApplication, UserProfile
+from .pagination import EstimatedCountPaginator
+
+# Обратный подбор: сколько анкет показать и для скольких животных за раз
+TOP_ADOPTERS_COUNT = 20
+TOP_ADOPTERS_ANIMALS = 10
+
+
+def related_aggregate(queryset, group_by, aggregate):
+    # Агрегат по связанным строкам как коррелированный подзапрос: он считается
+    # для строк страницы и не превращает список в GROUP BY по всей таблице
+    return Subquery(queryset.order_by().values(group_by).annotate(value=aggregate).values('value'))
 
 
 @admin.register(Shelter)
@@ -9,10 +22,17 @@ class ShelterAdmin(admin.ModelAdmin):
     search_fields = ('name', 'address', 'phone')
     list_filter = ('name',)
 
+    def get_queryset(self, request):
+        animals = Animal.objects.filter(shelter=OuterRef('pk'))
+        return super().get_queryset(request).annotate(
+            animal_count=Coalesce(related_aggregate(animals, 'shelter', Count('id')), 0)
+        )
+
     def animal_count(self, obj):
-        return obj.animal_set.count()
+        return obj.animal_count
 
     animal_count.short_description = 'Животных в приюте'
+    animal_count.admin_order_field = 'animal_count'
 
 
 @admin.register(Animal)
@@ -30,6 +50,11 @@ class AnimalAdmin(admin.ModelAdmin):
     list_filter = ('species', 'is_available', 'shelter', 'size_category')
     search_fields = ('name', 'breed', 'description')
     list_editable = ('is_available',)
+    list_select_related = ('shelter',)
+    autocomplete_fields = ('shelter',)
+    actions = ('show_top_adopters',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         ('Основная информация', {
             'fields': ('name', 'shelter', 'species', 'breed', 'age', 'description')
@@ -39,7 +64,7 @@ class AnimalAdmin(admin.ModelAdmin):
                        'other_pet_friendly', 'activity_level')
         }),
         ('Системные', {
-            'fields': ('is_available', 'arrival_date')
+            'fields': ('is_available', 'arrival_date', 'external_id')
         }),
     )
 
@@ -48,19 +73,44 @@ class AnimalAdmin(admin.ModelAdmin):
 
     species_display.short_description = 'Вид'
 
+    def get_queryset(self, request):
+        applications = AdoptionApplication.objects.filter(animal=OuterRef('pk'))
+        return super().get_queryset(request).annotate(
+            avg_compatibility=related_aggregate(applications, 'animal', Avg('compatibility_score'))
+        )
+
     def compatibility_score_display(self, obj):
-        avg_score = obj.applications.aggregate(models.Avg('compatibility_score'))
-        if avg_score['compatibility_score__avg']:
-            return f"{avg_score['compatibility_score__avg']:.1f}%"
+        if obj.avg_compatibility:
+            return f"{obj.avg_compatibility:.1f}%"
         return "—"
 
     compatibility_score_display.short_description = 'Совместимость'
+    compatibility_score_display.admin_order_field = 'avg_compatibility'
+
+    def show_top_adopters(self, request, queryset):
+        from .matching import top_adopters
+
+        animals = list(queryset.select_related('shelter')[:TOP_ADOPTERS_ANIMALS + 1])
+        if len(animals) > TOP_ADOPTERS_ANIMALS:
+            animals = animals[:TOP_ADOPTERS_ANIMALS]
+            self.message_user(
+                request, f'Кандидаты подобраны для первых {TOP_ADOPTERS_ANIMALS} животных', messages.WARNING
+            )
+        return TemplateResponse(request, 'admin/animals/animal/top_adopters.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Лучшие кандидаты в усыновители',
+            'results': [(animal, top_adopters(animal, k=TOP_ADOPTERS_COUNT)) for animal in animals],
+        })
+
+    show_top_adopters.short_description = 'Подобрать лучших кандидатов в усыновители'
 
 
 @admin.register(AdoptionApplication)
 class AdoptionApplicationAdmin(admin.ModelAdmin):
     list_display = (
         'full_name',
+        'user',
         'animal',
         'status',
         'compatibility_score',
@@ -71,6 +121,11 @@ class AdoptionApplicationAdmin(admin.ModelAdmin):
     search_fields = ('full_name', 'email', 'phone', 'animal__name')
     list_editable = ('status',)
     date_hierarchy = 'created_at'
+    list_select_related = ('animal', 'user')
+    autocomplete_fields = ('animal',)
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def contact_info(self, obj):
         return f"{obj.email} | {obj.phone}"
@@ -90,6 +145,10 @@ class UserProfileAdmin(admin.ModelAdmin):
     )
     list_filter = ('home_type', 'has_children', 'has_other_pets', 'created_at')
     search_fields = ('user__username', 'user__email', 'phone')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = (
         ('Пользователь', {
             'fields': ('user', 'phone')
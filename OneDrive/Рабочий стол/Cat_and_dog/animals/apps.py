@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class AnimalsConfig(AppConfig):
     name = 'animals'
+
+    def ready(self):
+        from . import checks
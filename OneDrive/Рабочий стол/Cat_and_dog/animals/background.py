@@ -0,0 +1,64 @@
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_cpu_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_WORKERS,
+            thread_name_prefix='animals-background'
+        )
+    return _executor
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Фоновая задача %s завершилась с ошибкой', func.__name__)
+    finally:
+        connections.close_all()
+
+
+def submit_background(func, *args):
+    # Запуск сразу, без ожидания коммита: для задач, которым не нужны
+    # данные текущей транзакции
+    if settings.BACKGROUND_TASKS_SYNC:
+        func(*args)
+    else:
+        _get_executor().submit(_run, func, args)
+
+
+def run_in_background(func, *args):
+    # Задача запускается только после коммита транзакции, чтобы фоновый
+    # поток увидел сохраненные данные
+    transaction.on_commit(functools.partial(submit_background, func, *args))
+
+
+def _get_cpu_executor():
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = ThreadPoolExecutor(
+            max_workers=settings.CPU_WORKERS,
+            thread_name_prefix='animals-cpu'
+        )
+    return _cpu_executor
+
+
+async def run_cpu_bound(func, *args):
+    # Расчеты на NumPy не должны блокировать цикл событий ASGI-воркера:
+    # они уходят в ограниченный пул потоков, а остальные запросы идут дальше.
+    # В пул передаются только готовые данные - без обращений к базе
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_cpu_executor(), functools.partial(func, *args))
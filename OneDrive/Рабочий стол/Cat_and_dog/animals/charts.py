@@ -0,0 +1,128 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+
+from .models import AdoptionApplication
+
+SIZE_SCALE = {'small': 5, 'medium': 7, 'large': 9}
+
+
+def fingerprint(payload):
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def chart_response(request, payload, private=False):
+    # Данные графика отдаются с ETag по отпечатку содержимого, поэтому
+    # браузер получает 304, пока данные не изменились
+    etag = quote_etag(fingerprint(payload))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(payload, json_dumps_params={'ensure_ascii': False})
+    response['ETag'] = etag
+    if private:
+        # Личные данные меняются от действий самого пользователя (анкета,
+        # заявка): браузер хранит ответ, но каждый раз сверяет ETag
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=settings.CHART_DATA_MAX_AGE)
+    return response
+
+
+def animal_chart(animal, profile=None, compatibility=None):
+    if profile is None:
+        return {
+            'type': 'bar',
+            'title': 'Характеристики животного',
+            'labels': ['Дети', 'Животные', 'Активность'],
+            'series': [{
+                'values': [animal.child_friendly, animal.other_pet_friendly, animal.activity_level],
+                'color': '#4361ee',
+            }],
+            'y_title': 'Оценка (1-10)',
+            'y_max': 10,
+            'height': 300,
+        }
+
+    pref_size = profile.pref_size if profile.pref_size in ('small', 'medium') else 'large'
+    return {
+        'type': 'bar',
+        'title': f'Совместимость: {compatibility}%',
+        'labels': ['Дружелюбие к детям', 'Отношение к животным', 'Активность', 'Размер', 'Опыт'],
+        'series': [
+            {
+                'name': 'Ваши предпочтения',
+                'values': [
+                    profile.pref_child_friendly,
+                    profile.pref_pet_friendly,
+                    profile.pref_activity_level,
+                    SIZE_SCALE[pref_size],
+                    min(profile.experience_years * 2, 10),
+                ],
+                'color': '#4361ee',
+            },
+            {
+                'name': 'Характеристики животного',
+                'values': [
+                    animal.child_friendly,
+                    animal.other_pet_friendly,
+                    animal.activity_level,
+                    SIZE_SCALE.get(animal.size_category, SIZE_SCALE['large']),
+                    5,
+                ],
+                'color': '#4cc9f0',
+            },
+        ],
+        'y_title': 'Оценка (1-10)',
+        'y_max': 10,
+        'height': 400,
+    }
+
+
+def shelter_chart(stats_data):
+    return {
+        'type': 'bar',
+        'title': 'Количество животных по приютам',
+        'labels': [item['name'] for item in stats_data],
+        'series': [{
+            'values': [item['animal_count'] for item in stats_data],
+            'color': '#4361ee',
+        }],
+        'x_title': 'Приюты',
+        'y_title': 'Количество животных',
+        'show_values': True,
+        'height': 500,
+    }
+
+
+def recommendations_chart(top_scores):
+    return {
+        'type': 'bar',
+        'title': 'Топ-10 рекомендаций по совместимости',
+        'labels': [name or "Безымянный" for name, _ in top_scores],
+        'series': [{
+            'name': 'Совместимость (%)',
+            'values': [score for _, score in top_scores],
+            'colorscale': 'viridis',
+        }],
+        'x_title': 'Животное',
+        'y_title': 'Совместимость (%)',
+        'show_values': True,
+        'value_suffix': '%',
+        'rotate_labels': True,
+        'height': 500,
+    }
+
+
+def applications_chart(status_counts):
+    statuses = dict(AdoptionApplication.STATUS_CHOICES)
+    return {
+        'type': 'pie',
+        'title': 'Статусы ваших заявок',
+        'labels': [statuses.get(status, status) for status in status_counts],
+        'values': list(status_counts.values()),
+        'height': 400,
+    }
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # Версия каталога и журнал изменений живут в кэше: в кэше процесса каждый
+    # воркер ведет свою версию и не узнает об изменениях, сделанных другими
+    if settings.CACHES['default']['BACKEND'] not in LOCAL_CACHE_BACKENDS:
+        return []
+    return [
+        Warning(
+            'Кэш по умолчанию хранится в памяти процесса: снимок каталога, индекс похожих '
+            'животных и кэш статистики не делятся между воркерами, а изменения животных в '
+            'одном воркере не доходят до остальных',
+            hint='Задайте CACHE_BACKEND и CACHE_LOCATION общего кэша (Redis, Memcached или FileBasedCache)',
+            id='animals.W001',
+        )
+    ]
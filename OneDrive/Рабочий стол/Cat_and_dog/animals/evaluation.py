@@ -0,0 +1,95 @@
+import numpy as np
+
+from .scoring import PROFILE_FIELDS, TRAIT_FIELDS, compatibility_scores, profiles_from_rows, traits_from_rows
+
+POSITIVE_STATUS = 'completed'
+NEGATIVE_STATUS = 'rejected'
+
+# Строка истории: заявка, исход, сохраненная оценка, анкета автора и животное
+APPLICATION_FIELDS = (
+    'id',
+    'status',
+    'compatibility_score',
+    *(f'user__profile__{field}' for field in PROFILE_FIELDS[1:]),
+    *(f'animal__{field}' for field in TRAIT_FIELDS[1:]),
+)
+_TRAITS_START = 3 + len(PROFILE_FIELDS) - 1
+
+# Оценки округлены до 0.1 балла, поэтому гистограмма по этим ступеням
+# хранит все, что нужно для точного AUC, - без сортировки всей истории
+SCORE_STEPS = 1001
+
+
+def _histograms(scores, completed):
+    steps = np.clip(np.rint(np.asarray(scores, dtype=float) * 10), 0, SCORE_STEPS - 1).astype(np.int64)
+    return (
+        np.bincount(steps[completed], minlength=SCORE_STEPS),
+        np.bincount(steps[~completed], minlength=SCORE_STEPS),
+    )
+
+
+def outcome_histograms(rows, weight_sets):
+    # Пачка строк APPLICATION_FIELDS -> {набор весов: (завершенные, отклоненные)}
+    # по ступеням оценки. Гистограммы пачек складываются, поэтому память не
+    # зависит от длины истории. Модуль не трогает базу и годится для пула процессов
+    rows = list(rows)
+    completed = np.array([row[1] == POSITIVE_STATUS for row in rows], dtype=bool)
+    profiles = profiles_from_rows((row[0], *row[3:_TRAITS_START]) for row in rows)
+    traits = traits_from_rows((row[0], *row[_TRAITS_START:]) for row in rows)
+
+    result = {'stored': _histograms([row[2] for row in rows], completed)}
+    for name, weights in weight_sets:
+        result[name] = _histograms(compatibility_scores(profiles, traits, weights), completed)
+    return result
+
+
+def outcome_metrics(completed, rejected, bins=10):
+    # Оценка как вероятность завершения: калибровка по корзинам, Brier и ECE;
+    # ранжирование - AUC (доля пар "завершенная выше отклоненной", ничья - половина)
+    total = completed + rejected
+    count = int(total.sum())
+    if not count:
+        return None
+    positives, negatives = int(completed.sum()), int(rejected.sum())
+    predicted = np.arange(SCORE_STEPS) / (SCORE_STEPS - 1)
+
+    auc = None
+    if positives and negatives:
+        below = np.cumsum(rejected) - rejected
+        auc = float((completed * (below + rejected / 2)).sum() / (positives * negatives))
+
+    brier = float((completed * (1 - predicted) ** 2 + rejected * predicted ** 2).sum() / count)
+
+    calibration = []
+    ece = 0.0
+    edges = np.linspace(0, SCORE_STEPS - 1, bins + 1).round().astype(int)
+    edges[-1] = SCORE_STEPS
+    for start, end in zip(edges[:-1], edges[1:]):
+        in_bin = int(total[start:end].sum())
+        if not in_bin:
+            continue
+        mean_predicted = float((total[start:end] * predicted[start:end]).sum() / in_bin)
+        observed = float(completed[start:end].sum() / in_bin)
+        ece += in_bin / count * abs(mean_predicted - observed)
+        calibration.append({
+            'scores': [round(start / 10, 1), round(min(end, SCORE_STEPS - 1) / 10, 1)],
+            'applications': in_bin,
+            'predicted': round(mean_predicted, 3),
+            'observed': round(observed, 3),
+        })
+
+    def mean_score(histogram):
+        size = histogram.sum()
+        return round(float((histogram * predicted).sum() / size * 100), 1) if size else None
+
+    return {
+        'applications': count,
+        'completed': positives,
+        'rejected': negatives,
+        'auc': None if auc is None else round(auc, 4),
+        'brier': round(brier, 4),
+        'ece': round(ece, 4),
+        'mean_completed': mean_score(completed),
+        'mean_rejected': mean_score(rejected),
+        'calibration': calibration,
+    }
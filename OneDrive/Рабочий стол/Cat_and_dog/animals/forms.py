@@ -19,9 +19,11 @@ class AnimalSearchForm(forms.Form):
     ]
 
     SORT_CHOICES = [
+        ('relevance', 'По релевантности'),
         ('name', 'По имени'),
         ('age', 'По возрасту'),
         ('child_friendly', 'По дружелюбию к детям'),
+        ('compatibility', 'По совместимости'),
     ]
 
     species = forms.ChoiceField(
@@ -42,11 +44,18 @@ class AnimalSearchForm(forms.Form):
         label='Сортировать по'
     )
 
+    min_score = forms.FloatField(
+        required=False,
+        min_value=0,
+        max_value=100,
+        label='Совместимость от, %'
+    )
+
     search = forms.CharField(
         required=False,
-        label='Поиск по кличке',
+        label='Поиск',
         widget=forms.TextInput(
-            attrs={'placeholder': 'Введите кличку...'}
+            attrs={'placeholder': 'Кличка, порода или описание...'}
         )
     )
 
@@ -0,0 +1,105 @@
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+
+# Ширины вариантов фотографии: миниатюра, карточка каталога, страница животного
+VARIANT_WIDTHS = {
+    'thumb': 320,
+    'card': 640,
+    'detail': 1280,
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'animals/variants'
+
+
+def variant_widths(width):
+    # Не увеличиваем маленькие фото: берем только варианты не шире оригинала,
+    # а если оригинал меньше всех - один вариант в его ширину
+    widths = sorted({min(target, width) for target in VARIANT_WIDTHS.values()})
+    return widths
+
+
+def build_variants(animal_id, source):
+    # Pillow нужен только фоновой сборке вариантов: модуль импортирует и
+    # библиотека тегов шаблонов, а она загружается при старте шаблонизатора
+    from PIL import Image, ImageOps
+
+    with default_storage.open(source) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    if image.mode not in ('RGB', 'L'):
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.convert('RGBA').split()[-1])
+        image = background
+    elif image.mode == 'L':
+        image = image.convert('RGB')
+
+    stem = posixpath.splitext(posixpath.basename(source))[0]
+    variants = {'source': source, 'width': image.width, 'height': image.height}
+    for extension, (pillow_format, options) in FORMATS.items():
+        variants[extension] = {}
+        for width in variant_widths(image.width):
+            height = round(image.height * width / image.width)
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            buffer = BytesIO()
+            resized.save(buffer, pillow_format, **options)
+            name = default_storage.save(
+                f'{VARIANTS_DIR}/{animal_id}/{stem}-{width}.{extension}', ContentFile(buffer.getvalue())
+            )
+            variants[extension][str(width)] = name
+    return variants
+
+
+def delete_variants(variants):
+    for extension in FORMATS:
+        for name in (variants or {}).get(extension, {}).values():
+            default_storage.delete(name)
+
+
+def refresh_photo_variants(animal_id):
+    from .models import Animal
+
+    animal = Animal.objects.filter(pk=animal_id).only('photo', 'photo_variants').first()
+    if animal is None:
+        return
+
+    source = animal.photo.name if animal.photo else ''
+    previous = animal.photo_variants or {}
+    if previous.get('source', '') == source:
+        return
+
+    variants = build_variants(animal_id, source) if source else {}
+    # update() не вызывает post_save, поэтому запись вариантов не запускает конвейер заново;
+    # условие по photo не дает записать варианты фото, которое уже успели заменить
+    current = Animal.objects.filter(pk=animal_id)
+    current = current.filter(photo=source) if source else current.filter(Q(photo='') | Q(photo__isnull=True))
+    if current.update(photo_variants=variants):
+        delete_variants(previous)
+    else:
+        delete_variants(variants)
+
+
+def srcset(variants, extension):
+    return ', '.join(
+        f'{default_storage.url(name)} {width}w'
+        for width, name in sorted((variants or {}).get(extension, {}).items(), key=lambda item: int(item[0]))
+    )
+
+
+def variant_url(variants, extension, target):
+    # Ближайший вариант не уже нужной ширины (или самый широкий из имеющихся)
+    available = sorted((int(width), name) for width, name in (variants or {}).get(extension, {}).items())
+    if not available:
+        return None
+    for width, name in available:
+        if width >= target:
+            return default_storage.url(name)
+    return default_storage.url(available[-1][1])
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from animals.models import Animal
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(share * (len(values) - 1))))]
+
+
+def request_host():
+    # Имя хоста, которое пропустит проверка ALLOWED_HOSTS
+    return next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host and host != '*'), 'localhost')
+
+
+def summarize(latencies, statuses, wall):
+    return {
+        'requests': len(latencies),
+        'errors': sum(status != 200 for status in statuses),
+        'wall_s': round(wall, 2),
+        'rps': round(len(latencies) / wall, 1) if wall else None,
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает один ASGI-воркер и один синхронный WSGI-воркер на множестве медленных клиентов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=50, help='Одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=200, help='Всего запросов на каждый вариант')
+        parser.add_argument(
+            '--client-delay-ms', type=float, default=100,
+            help='Сколько медленный клиент передает запрос (сеть, мобильный интернет)'
+        )
+        parser.add_argument(
+            '--wsgi-threads', type=int, default=1,
+            help='Потоков в WSGI-воркере (1 - классический синхронный воркер)'
+        )
+        parser.add_argument('--path', action='append', dest='paths', help='Адрес для запросов (можно несколько)')
+        parser.add_argument('--username', help='Выполнять запросы от имени этого пользователя')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        self.delay = options['client_delay_ms'] / 1000
+        self.host = request_host()
+        self.cookie = self.session_cookie(options['username'])
+        paths = options['paths'] or self.default_paths(options['username'])
+        total = max(options['requests'], 1)
+        clients = max(min(options['clients'], total), 1)
+        # Запросы поровну распределены между клиентами, адреса идут по кругу
+        plan = [
+            [paths[index % len(paths)] for index in range(client, total, clients)]
+            for client in range(clients)
+        ]
+
+        # Прогрев: первые запросы загружают шаблоны и ленивые модули
+        for path in paths:
+            status = self.wsgi_request(WSGIHandler(), path, delay=0)
+            if status != 200:
+                raise CommandError(f'{path} вернул {status}')
+
+        results = {
+            'config': {
+                'clients': clients,
+                'requests': total,
+                'client_delay_ms': options['client_delay_ms'],
+                'wsgi_threads': options['wsgi_threads'],
+                'cpu_workers': settings.CPU_WORKERS,
+                'paths': paths,
+            },
+            'asgi': asyncio.run(self.run_asgi(plan)),
+            'wsgi': self.run_wsgi(plan, max(options['wsgi_threads'], 1)),
+        }
+        connections.close_all()
+
+        for name in ('asgi', 'wsgi'):
+            result = results[name]
+            self.stdout.write(
+                f"{name.upper()}: {result['rps']} запр/с, p50 {result['p50_ms']} мс, "
+                f"p95 {result['p95_ms']} мс, max {result['max_ms']} мс, ошибок {result['errors']}"
+            )
+        if results['wsgi']['rps']:
+            self.stdout.write(f"ASGI быстрее в {results['asgi']['rps'] / results['wsgi']['rps']:.1f} раза")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+        if results['asgi']['errors'] or results['wsgi']['errors']:
+            raise CommandError('Часть запросов завершилась ошибкой')
+        self.stdout.write(self.style.SUCCESS('Замер завершен'))
+
+    def session_cookie(self, username):
+        if not username:
+            return ''
+        user = User.objects.filter(username=username).first()
+        if user is None:
+            raise CommandError(f'Пользователь "{username}" не найден')
+        client = Client()
+        client.force_login(user)
+        return f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+
+    def default_paths(self, username):
+        paths = [reverse('animal_list')]
+        animal_id = Animal.objects.filter(is_available=True).values_list('pk', flat=True).first()
+        if animal_id:
+            paths.append(reverse('animal_detail', args=[animal_id]))
+        if username:
+            paths.append(reverse('personal_recommendations'))
+        return paths
+
+    async def asgi_request(self, application, path):
+        url = urlsplit(path)
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': url.path,
+            'raw_path': url.path.encode(),
+            'query_string': url.query.encode(),
+            'root_path': '',
+            'headers': [(b'host', self.host.encode()), (b'cookie', self.cookie.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': (self.host, 80),
+        }
+        received = False
+        status = None
+
+        async def receive():
+            nonlocal received
+            if received:
+                # Клиент не отключается: ждем, пока Django сам отменит ожидание
+                await asyncio.Future()
+            received = True
+            # Медленный клиент передает запрос, но цикл событий в это время
+            # обслуживает остальных
+            await asyncio.sleep(self.delay)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        started = time.perf_counter()
+        await application(scope, receive, send)
+        return status, time.perf_counter() - started
+
+    async def run_asgi(self, plan):
+        application = ASGIHandler()
+        latencies, statuses = [], []
+
+        async def client(paths):
+            for path in paths:
+                status, latency = await self.asgi_request(application, path)
+                statuses.append(status)
+                latencies.append(latency)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(paths) for paths in plan))
+        return summarize(latencies, statuses, time.perf_counter() - started)
+
+    def wsgi_request(self, application, path, delay=None):
+        url = urlsplit(path)
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': self.host,
+            'HTTP_COOKIE': self.cookie,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+        status = []
+
+        def start_response(line, headers, exc_info=None):
+            status.append(int(line.split()[0]))
+
+        # Синхронный воркер занят все время, пока медленный клиент передает запрос
+        time.sleep(self.delay if delay is None else delay)
+        response = application(environ, start_response)
+        try:
+            for _ in response:
+                pass
+        finally:
+            response.close()
+        return status[0]
+
+    def run_wsgi(self, plan, threads):
+        application = WSGIHandler()
+        # Потоки воркера - ограниченный ресурс: клиент ждет свободный поток
+        worker = threading.Semaphore(threads)
+        latencies, statuses = [], []
+        lock = threading.Lock()
+
+        def client(paths):
+            try:
+                for path in paths:
+                    started = time.perf_counter()
+                    with worker:
+                        status = self.wsgi_request(application, path)
+                    with lock:
+                        statuses.append(status)
+                        latencies.append(time.perf_counter() - started)
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(plan)) as executor:
+            list(executor.map(client, plan))
+        return summarize(latencies, statuses, time.perf_counter() - started)
@@ -0,0 +1,238 @@
+import json
+import random
+import secrets
+import statistics
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from animals.models import AdoptionApplication, Animal
+from animals.statistics import bump_catalog_version
+from animals.synthetic import generate_dataset
+from animals.urls import urlpatterns
+
+from .benchmark_concurrency import percentile, request_host
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(usage / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными и замеряет все маршруты приложения: '
+        'задержки p50/p95/p99, число запросов к БД и пик памяти. Данные откатываются после замера'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shelters', type=int, default=10, help='Количество приютов')
+        parser.add_argument('--animals', type=int, default=1000, help='Количество животных')
+        parser.add_argument('--users', type=int, default=100, help='Пользователей с заполненной анкетой')
+        parser.add_argument('--applications', type=int, default=500, help='Заявок на усыновление')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора данных')
+        parser.add_argument('--iterations', type=int, default=30, help='Запросов на каждый сценарий')
+        parser.add_argument('--route', action='append', dest='routes', help='Замерить только эти сценарии')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--baseline', help='JSON прошлого замера для сравнения')
+        parser.add_argument('--max-regression', type=float, help='Допустимый рост p95 относительно baseline, %%')
+
+    def handle(self, *args, **options):
+        baseline = self.load_baseline(options['baseline'])
+        self.rng = random.Random(options['seed'])
+
+        # Все данные живут в одной транзакции и откатываются в конце:
+        # замер можно запускать на рабочей базе разработчика
+        with transaction.atomic():
+            started = time.perf_counter()
+            dataset = generate_dataset(
+                shelters=options['shelters'],
+                animals=options['animals'],
+                users=options['users'],
+                applications=options['applications'],
+                seed=options['seed'],
+            )
+            self.stdout.write(
+                f"Данные: {dataset['shelters']} приютов, {dataset['animals']} животных, "
+                f"{dataset['users']} пользователей, {dataset['applications']} заявок "
+                f"({time.perf_counter() - started:.1f} с)"
+            )
+            # Без токена /metrics открыт только при DEBUG: на время замера
+            # эндпоинт получает одноразовый токен
+            with override_settings(METRICS_TOKEN=settings.METRICS_TOKEN or secrets.token_hex(16)):
+                routes = self.measure_routes(options['routes'], max(options['iterations'], 1))
+            transaction.set_rollback(True)
+        # Кэш каталога мог запомнить откаченные данные
+        bump_catalog_version()
+
+        results = {
+            'config': {
+                key: options[key]
+                for key in ('shelters', 'animals', 'users', 'applications', 'seed', 'iterations')
+            },
+            'dataset': dataset,
+            'database': connection.vendor,
+            'routes': routes,
+            'max_rss_mb': peak_rss_mb(),
+        }
+
+        for label, result in routes.items():
+            self.stdout.write(
+                f"{label:<32} p50 {result['p50_ms']:>7} мс  p95 {result['p95_ms']:>7} мс  "
+                f"p99 {result['p99_ms']:>7} мс  запросов {result['queries']:>3}  "
+                f"память {result['peak_kb']:>7} КБ"
+            )
+        self.stdout.write(f"Пик RSS процесса: {results['max_rss_mb']} МБ")
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+        if baseline:
+            self.compare(baseline, routes, options['max_regression'])
+        self.stdout.write(self.style.SUCCESS('Замер завершен'))
+
+    def load_baseline(self, path):
+        if not path:
+            return None
+        try:
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)['routes']
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось прочитать baseline {path}: {error}')
+
+    def scenarios(self):
+        available = list(Animal.objects.filter(is_available=True).values_list('pk', flat=True)[:500])
+        if not available:
+            raise CommandError('Нет доступных животных: увеличьте --animals')
+        user_id = AdoptionApplication.objects.values_list('user', flat=True).first()
+        user = User.objects.filter(pk=user_id).first() if user_id else None
+        user = user or User.objects.filter(username__startswith='synthetic').first()
+        if user is None:
+            raise CommandError('Нет синтетических пользователей: увеличьте --users')
+
+        def animal_path(name):
+            return lambda: reverse(name, args=[self.rng.choice(available)])
+
+        def fixed(name, query=''):
+            return lambda: reverse(name) + query
+
+        # Вторая страница каталога - по курсору из первой
+        first_page = Client(SERVER_NAME=request_host()).get(reverse('animal_list'))
+        cards = first_page.context.get('next_fragment_url') or reverse('animal_cards')
+        adoption = {'full_name': 'Синтетический Заявитель', 'email': user.email, 'phone': '+7 900 0000000'}
+
+        # (сценарий, имя маршрута, адрес, данные POST, от имени пользователя)
+        return user, [
+            ('catalog', 'animal_list', fixed('animal_list'), None, False),
+            ('catalog_filtered', 'animal_list', fixed('animal_list', '?species=dog&size=large&sort_by=age'), None, False),
+            ('catalog_search', 'animal_list', fixed('animal_list', '?search=ласковый'), None, False),
+            ('catalog_cards', 'animal_cards', lambda: cards, None, False),
+            ('detail_anonymous', 'animal_detail', animal_path('animal_detail'), None, False),
+            ('chart_anonymous', 'animal_chart_data', animal_path('animal_chart_data'), None, False),
+            ('shelter_stats', 'shelter_stats', fixed('shelter_stats'), None, False),
+            ('shelter_chart', 'shelter_chart_data', fixed('shelter_chart_data'), None, False),
+            ('register', 'register', fixed('register'), None, False),
+            ('login', 'login', fixed('login'), None, False),
+            ('catalog_compatibility', 'animal_list', fixed('animal_list', '?sort_by=compatibility'), None, True),
+            ('catalog_min_score', 'animal_list', fixed('animal_list', '?min_score=60'), None, True),
+            ('detail_authenticated', 'animal_detail', animal_path('animal_detail'), None, True),
+            ('chart_authenticated', 'animal_chart_data', animal_path('animal_chart_data'), None, True),
+            ('adoption_form', 'submit_adoption', animal_path('submit_adoption'), None, True),
+            ('adoption_post', 'submit_adoption', animal_path('submit_adoption'), adoption, True),
+            ('edit_profile', 'edit_profile', fixed('edit_profile'), None, True),
+            ('recommendations', 'personal_recommendations', fixed('personal_recommendations'), None, True),
+            ('recommendations_chart', 'recommendations_chart_data', fixed('recommendations_chart_data'), None, True),
+            ('my_applications', 'my_applications', fixed('my_applications'), None, True),
+            ('applications_chart', 'applications_chart_data', fixed('applications_chart_data'), None, True),
+            ('logout_confirm', 'logout', fixed('logout'), None, True),
+            ('metrics', 'metrics', fixed('metrics'), None, False),
+        ]
+
+    def request(self, client, path, data):
+        if data is None:
+            response, expected = client.get(path), 200
+        else:
+            # Успешная заявка перенаправляет обратно на карточку животного
+            response, expected = client.post(path, data), 302
+        if response.status_code != expected:
+            raise CommandError(f'{path} вернул {response.status_code}')
+        return response
+
+    def measure_routes(self, only, iterations):
+        user, scenarios = self.scenarios()
+        covered = {name for _, name, _, _, _ in scenarios}
+        missing = sorted({pattern.name for pattern in urlpatterns} - covered)
+        if missing:
+            self.stdout.write(self.style.WARNING(f"Маршруты без сценария: {', '.join(missing)}"))
+
+        # Токен метрик не мешает остальным маршрутам
+        anonymous = Client(SERVER_NAME=request_host(), HTTP_AUTHORIZATION=f'Bearer {settings.METRICS_TOKEN}')
+        authenticated = Client(SERVER_NAME=request_host())
+        authenticated.force_login(user)
+
+        results = {}
+        for label, name, path, data, auth in scenarios:
+            if only and label not in only:
+                continue
+            client = authenticated if auth else anonymous
+            # Прогрев: шаблоны, ленивые модули и кэш каталога
+            self.request(client, path(), data)
+
+            latencies = []
+            for _ in range(iterations):
+                url = path()
+                started = time.perf_counter()
+                self.request(client, url, data)
+                latencies.append(time.perf_counter() - started)
+
+            # Запросы к БД и память считаются отдельным прогоном:
+            # tracemalloc заметно замедляет код и исказил бы задержки
+            url = path()
+            tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                self.request(client, url, data)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            results[label] = {
+                'route': name,
+                'method': 'get' if data is None else 'post',
+                'authenticated': auth,
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+                'queries': len(queries),
+                'peak_kb': round(peak / 1024, 1),
+            }
+        return results
+
+    def compare(self, baseline, routes, max_regression):
+        regressions = []
+        for label, result in routes.items():
+            previous = baseline.get(label)
+            if not previous or not previous.get('p95_ms'):
+                continue
+            change = (result['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100
+            queries = result['queries'] - previous.get('queries', result['queries'])
+            self.stdout.write(
+                f"{label:<32} p95 {change:+.0f}%"
+                + (f", запросов {queries:+d}" if queries else '')
+            )
+            if max_regression is not None and (change > max_regression or queries > 0):
+                regressions.append(f'{label} (p95 {change:+.0f}%, запросов {queries:+d})')
+        if regressions:
+            raise CommandError('Регрессия: ' + '; '.join(regressions))
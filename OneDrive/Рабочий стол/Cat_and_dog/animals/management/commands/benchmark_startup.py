@@ -0,0 +1,157 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Маршруты, которые воркер должен разрешить сразу после старта
+ROUTES = [
+    ('animal_list', []),
+    ('animal_detail', [1]),
+    ('animal_chart_data', [1]),
+    ('submit_adoption', [1]),
+    ('shelter_stats', []),
+    ('shelter_chart_data', []),
+    ('login', []),
+    ('register', []),
+    ('personal_recommendations', []),
+    ('my_applications', []),
+]
+
+# Зависимости, которые должны загружаться лениво: NumPy - для совместимости
+# и похожих животных, Pillow - для вариантов фотографий
+HEAVY_MODULES = ['numpy', 'PIL']
+
+# Код, который выполняется в отдельном свежем процессе: так замер
+# не зависит от модулей, уже загруженных в manage.py
+PROBE = r'''
+import json
+import os
+import sys
+import time
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+config = json.loads(sys.argv[1])
+result = {'rss_start': rss_bytes()}
+
+started = time.perf_counter()
+import django
+django.setup()
+result['setup_ms'] = (time.perf_counter() - started) * 1000
+
+from django.urls import resolve, reverse
+started = time.perf_counter()
+for name, args in config['routes']:
+    resolve(reverse(name, args=args))
+result['urls_ms'] = (time.perf_counter() - started) * 1000
+result['rss_worker'] = rss_bytes()
+result['loaded'] = [name for name in config['heavy'] if name in sys.modules]
+
+import importlib
+started = time.perf_counter()
+for module in config['modules']:
+    importlib.import_module(module)
+result['modules_ms'] = (time.perf_counter() - started) * 1000
+result['rss_modules'] = rss_bytes()
+
+print(json.dumps(result))
+'''
+
+
+def to_mb(value):
+    return None if value is None else value / (1024 * 1024)
+
+
+class Command(BaseCommand):
+    help = 'Замеряет время старта воркера (django.setup + разрешение URL) и его память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Количество запусков свежего процесса')
+        parser.add_argument(
+            '--modules', nargs='*', default=['animals.charts', 'animals.scoring', 'animals.images'],
+            help='Модули, подгружаемые лениво; их стоимость считается отдельно'
+        )
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+        parser.add_argument('--max-startup-ms', type=float, help='Порог медианы setup + URL, мс')
+        parser.add_argument('--max-rss-mb', type=float, help='Порог медианы RSS воркера, МБ')
+
+    def handle(self, *args, **options):
+        config = json.dumps({
+            'routes': ROUTES,
+            'heavy': HEAVY_MODULES,
+            'modules': options['modules'],
+        })
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+
+        runs = []
+        for _ in range(max(options['runs'], 1)):
+            completed = subprocess.run(
+                [sys.executable, '-c', PROBE, config],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if completed.returncode:
+                raise CommandError(completed.stderr.strip())
+            runs.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+        def median(key, convert=float):
+            values = [convert(run[key]) for run in runs if run[key] is not None]
+            return round(statistics.median(values), 1) if values else None
+
+        summary = {
+            'runs': len(runs),
+            'setup_ms': median('setup_ms'),
+            'urls_ms': median('urls_ms'),
+            'startup_ms': round(statistics.median(run['setup_ms'] + run['urls_ms'] for run in runs), 1),
+            'rss_start_mb': median('rss_start', to_mb),
+            'rss_worker_mb': median('rss_worker', to_mb),
+            'modules': options['modules'],
+            'modules_ms': median('modules_ms'),
+            'rss_modules_mb': median('rss_modules', to_mb),
+            'heavy_modules_at_startup': runs[-1]['loaded'],
+        }
+
+        self.stdout.write(f"Запусков: {summary['runs']}")
+        self.stdout.write(f"django.setup(): {summary['setup_ms']} мс")
+        self.stdout.write(f"Разрешение URL: {summary['urls_ms']} мс")
+        self.stdout.write(f"Старт воркера всего: {summary['startup_ms']} мс")
+        self.stdout.write(f"RSS до/после старта: {summary['rss_start_mb']} / {summary['rss_worker_mb']} МБ")
+        self.stdout.write(
+            f"После импорта {', '.join(summary['modules']) or '-'}: "
+            f"+{summary['modules_ms']} мс, RSS {summary['rss_modules_mb']} МБ"
+        )
+        if summary['heavy_modules_at_startup']:
+            self.stdout.write(self.style.WARNING(
+                f"Тяжелые модули загружены при старте: {', '.join(summary['heavy_modules_at_startup'])}"
+            ))
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as output:
+                json.dump({'summary': summary, 'runs': runs}, output, ensure_ascii=False, indent=2)
+
+        failures = []
+        if options['max_startup_ms'] is not None and summary['startup_ms'] > options['max_startup_ms']:
+            failures.append(f"старт {summary['startup_ms']} мс > {options['max_startup_ms']} мс")
+        if (options['max_rss_mb'] is not None and summary['rss_worker_mb'] is not None
+                and summary['rss_worker_mb'] > options['max_rss_mb']):
+            failures.append(f"RSS {summary['rss_worker_mb']} МБ > {options['max_rss_mb']} МБ")
+        if failures:
+            raise CommandError('Регрессия старта: ' + '; '.join(failures))
+
+        self.stdout.write(self.style.SUCCESS('Замер завершен'))
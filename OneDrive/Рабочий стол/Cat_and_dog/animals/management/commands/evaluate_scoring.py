@@ -0,0 +1,124 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from animals.evaluation import (
+    APPLICATION_FIELDS,
+    NEGATIVE_STATUS,
+    POSITIVE_STATUS,
+    outcome_histograms,
+    outcome_metrics,
+)
+from animals.models import AdoptionApplication
+from animals.score_store import _batches
+from animals.scoring import DEFAULT_WEIGHTS
+
+
+def parse_weights(value):
+    # "children=30,pets=10" - остальные слагаемые со своими весами,
+    # затем сумма приводится к 100, чтобы оценка оставалась процентом
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in value.split(','):
+        name, _, number = part.partition('=')
+        name = name.strip()
+        if name not in weights:
+            raise CommandError(f'Неизвестное слагаемое "{name}", есть: {", ".join(DEFAULT_WEIGHTS)}')
+        try:
+            weights[name] = float(number)
+        except ValueError:
+            raise CommandError(f'Вес "{part}" должен быть числом')
+        if weights[name] < 0:
+            raise CommandError(f'Вес "{part}" не может быть отрицательным')
+    total = sum(weights.values())
+    if not total:
+        raise CommandError(f'Все веса в "{value}" нулевые')
+    return {name: weight * 100 / total for name, weight in weights.items()}
+
+
+def chunk_results(chunks, weight_sets, processes):
+    if processes <= 1:
+        for rows in chunks:
+            yield outcome_histograms(rows, weight_sets)
+        return
+
+    # Пачек в работе не больше двух на процесс: чтение истории не обгоняет
+    # расчет, и память не растет вместе с числом заявок
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+        pending = deque()
+        for rows in chunks:
+            pending.append(pool.submit(outcome_histograms, rows, weight_sets))
+            if len(pending) >= processes * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class Command(BaseCommand):
+    help = (
+        'Оценивает алгоритм совместимости по истории заявок: пересчитывает оценку '
+        'с текущими и предложенными весами и сравнивает с исходом заявки '
+        '(завершена или отклонена) - калибровка, Brier, ECE и AUC'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--weights', action='append', default=[],
+            help=f'Набор весов вида children=30,pets=10 (можно несколько); слагаемые: {", ".join(DEFAULT_WEIGHTS)}'
+        )
+        parser.add_argument('--chunk-size', type=int, default=20000, help='Заявок в пачке')
+        parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Процессов для расчета')
+        parser.add_argument('--bins', type=int, default=10, help='Корзин калибровки')
+        parser.add_argument('--json', dest='json_path', help='Сохранить результаты в JSON-файл')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['bins'] < 1:
+            raise CommandError('--chunk-size и --bins должны быть положительными')
+        weight_sets = [('current', None)]
+        weight_sets += [(value, parse_weights(value)) for value in options['weights']]
+
+        # Анкета берется в нынешнем виде: если автор менял ее после заявки,
+        # пересчет расходится с сохраненной оценкой (набор stored)
+        rows = AdoptionApplication.objects.filter(
+            status__in=(POSITIVE_STATUS, NEGATIVE_STATUS),
+            user__profile__isnull=False,
+        ).order_by('pk').values_list(*APPLICATION_FIELDS)
+        chunks = _batches(rows.iterator(chunk_size=options['chunk_size']), options['chunk_size'])
+
+        totals = {}
+        for histograms in chunk_results(chunks, weight_sets, options['processes']):
+            for name, (completed, rejected) in histograms.items():
+                if name in totals:
+                    totals[name][0] += completed
+                    totals[name][1] += rejected
+                else:
+                    totals[name] = [completed, rejected]
+
+        if not totals:
+            raise CommandError('В истории нет завершенных или отклоненных заявок от пользователей с анкетой')
+
+        results = {
+            name: outcome_metrics(completed, rejected, options['bins'])
+            for name, (completed, rejected) in totals.items()
+        }
+        for name, metrics in results.items():
+            self.stdout.write(
+                f"{name}: заявок {metrics['applications']} (завершено {metrics['completed']}), "
+                f"AUC {metrics['auc']}, Brier {metrics['brier']}, ECE {metrics['ece']}, "
+                f"средняя оценка завершенных/отклоненных {metrics['mean_completed']} / {metrics['mean_rejected']}"
+            )
+            for row in metrics['calibration']:
+                low, high = row['scores']
+                self.stdout.write(
+                    f"  {low:5.1f}-{high:5.1f}: {row['applications']:>8} заявок, "
+                    f"ожидалось {row['predicted']:.3f}, завершено {row['observed']:.3f}"
+                )
+
+        if options['json_path']:
+            with open(options['json_path'], 'w', encoding='utf-8') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+        self.stdout.write(self.style.SUCCESS('Оценка завершена'))
@@ -0,0 +1,284 @@
+import csv
+import itertools
+import json
+import re
+import time
+from pathlib import Path
+
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from animals.background import run_in_background
+from animals.models import Animal, Shelter
+from animals.score_store import rescore_animals
+from animals.search import index_animals
+from animals.statistics import bump_catalog_version
+
+IMPORT_FIELDS = (
+    'name',
+    'species',
+    'breed',
+    'age',
+    'description',
+    'child_friendly',
+    'other_pet_friendly',
+    'activity_level',
+    'size_category',
+    'is_available',
+)
+TRUE_VALUES = {'1', 'true', 'yes', 't', 'да'}
+FALSE_VALUES = {'0', 'false', 'no', 'f', 'нет'}
+JSON_CHUNK_SIZE = 64 * 1024
+# Запись массива JSON длиннее этого считается испорченной: иначе незакрытая
+# скобка заставила бы читать в память весь остаток файла
+MAX_JSON_RECORD_SIZE = 1024 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+MAX_REPORTED_ERRORS = 20
+
+
+def iter_csv(file):
+    reader = csv.DictReader(file)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def iter_json(file):
+    # JSON-массив разбирается потоково по одному объекту, JSON Lines - построчно,
+    # поэтому весь файл никогда не оказывается в памяти
+    first = file.read(1)
+    while first.isspace():
+        first = file.read(1)
+
+    if first != '[':
+        lines = itertools.chain([first + file.readline()], file)
+        for number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except json.JSONDecodeError as error:
+                # Ошибка разбора - такая же ошибка строки, как и ошибка проверки полей
+                yield number, ValidationError(f'Некорректный JSON: {error.msg} (символ {error.colno})')
+        return
+
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    number = 0
+    exhausted = False
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+
+        problem = 'файл оборвался'
+        if position < len(buffer):
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError as error:
+                problem = error.msg
+            else:
+                # Запись, которая уперлась в конец буфера (число на границе
+                # чанка), могла прочитаться не целиком - сначала дочитываем
+                if end < len(buffer) or exhausted:
+                    number += 1
+                    yield number, record
+                    position = end
+                    continue
+
+        # После испорченной записи начало следующей не найти: разбор
+        # останавливается ошибкой строки, прочитанные записи импортируются
+        if exhausted:
+            yield number + 1, ValidationError(f'Некорректный JSON: {problem}')
+            return
+        if len(buffer) - position > MAX_JSON_RECORD_SIZE:
+            yield number + 1, ValidationError(
+                f'Запись длиннее {MAX_JSON_RECORD_SIZE} символов или некорректный JSON: {problem}'
+            )
+            return
+
+        # Буфер сжимается только при подкачке: разобранные записи не копируются
+        # после каждой, и в буфере не больше чанка и одной незаконченной записи
+        chunk = file.read(JSON_CHUNK_SIZE)
+        buffer = buffer[position:] + chunk
+        position = 0
+        exhausted = not chunk
+
+
+def parse_boolean(value):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValidationError({'is_available': f'Не удалось распознать "{value}" как да/нет'})
+
+
+class Command(BaseCommand):
+    help = 'Потоковый импорт животных из CSV, JSON или JSON Lines с обновлением по external_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки приюта')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Формат файла (по умолчанию по расширению)')
+        parser.add_argument('--shelter', help='ID или название приюта для строк без колонки shelter')
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки bulk_create')
+        parser.add_argument('--max-errors', type=int, help='Прервать импорт после стольких ошибочных строк')
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, ничего не записывая')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.exists():
+            raise CommandError(f'Файл {path} не найден')
+
+        file_format = options['format'] or ('csv' if path.suffix.lower() == '.csv' else 'json')
+        self.batch_size = max(options['batch_size'], 1)
+        self.dry_run = options['dry_run']
+        self.shelters = {}
+        self.default_shelter = self.resolve_default_shelter(options['shelter'])
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'errors': 0}
+        self.started = time.perf_counter()
+
+        records = iter_csv if file_format == 'csv' else iter_json
+        batch = {}
+        with path.open(encoding='utf-8-sig', newline='') as file:
+            for number, record in records(file):
+                self.stats['rows'] += 1
+                try:
+                    if isinstance(record, ValidationError):
+                        raise record
+                    animal, fields = self.build_animal(record)
+                except ValidationError as error:
+                    self.report_error(number, error)
+                    if options['max_errors'] is not None and self.stats['errors'] > options['max_errors']:
+                        raise CommandError(f'Слишком много ошибок: {self.stats["errors"]}')
+                    continue
+
+                # Повтор того же животного внутри пачки: остается последняя версия
+                batch[(animal.shelter_id, animal.external_id)] = (animal, fields)
+                if len(batch) >= self.batch_size:
+                    self.save_batch(list(batch.values()))
+                    batch = {}
+
+        if batch:
+            self.save_batch(list(batch.values()))
+
+        if not self.dry_run and self.stats['created'] + self.stats['updated']:
+            bump_catalog_version()
+
+        self.report_progress(final=True)
+
+    def resolve_default_shelter(self, value):
+        if not value:
+            return None
+        shelter = Shelter.objects.filter(pk=value).first() if value.isdigit() else None
+        shelter = shelter or Shelter.objects.filter(name=value).first()
+        if shelter is None:
+            raise CommandError(f'Приют "{value}" не найден')
+        return shelter.pk
+
+    def resolve_shelter(self, record):
+        name = (record.get('shelter') or '').strip()
+        if not name:
+            if self.default_shelter is None:
+                raise ValidationError({'shelter': 'Не указан приют (колонка shelter или опция --shelter)'})
+            return self.default_shelter
+
+        if name not in self.shelters:
+            shelter = Shelter.objects.filter(name=name).first()
+            if shelter is None and not self.dry_run:
+                shelter = Shelter.objects.create(
+                    name=name,
+                    address=record.get('shelter_address') or '',
+                    phone=record.get('shelter_phone') or '',
+                )
+            self.shelters[name] = shelter.pk if shelter else None
+        return self.shelters[name]
+
+    def build_animal(self, record):
+        if not isinstance(record, dict):
+            raise ValidationError('Запись должна быть объектом')
+
+        external_id = str(record.get('external_id') or '').strip()
+        if not external_id:
+            raise ValidationError({'external_id': 'Обязательное поле для импорта'})
+
+        animal = Animal(external_id=external_id, shelter_id=self.resolve_shelter(record))
+        fields = []
+        for field in IMPORT_FIELDS:
+            value = record.get(field)
+            if value is None or (value == '' and field not in ('name', 'breed', 'description')):
+                continue
+            if field == 'is_available':
+                value = parse_boolean(value)
+            setattr(animal, field, value)
+            fields.append(field)
+
+        # Те же ограничения полей, что и при сохранении через админку
+        animal.full_clean(exclude=['shelter', 'photo'], validate_unique=False, validate_constraints=False)
+        return animal, tuple(fields)
+
+    def save_batch(self, entries):
+        animals = [animal for animal, _ in entries]
+        existing = set(
+            Animal.objects.filter(
+                external_id__in=[animal.external_id for animal in animals]
+            ).values_list('shelter_id', 'external_id')
+        )
+        updated = sum((animal.shelter_id, animal.external_id) in existing for animal in animals)
+        if self.dry_run:
+            self.stats['updated'] += updated
+            self.stats['created'] += len(animals) - updated
+            self.report_progress()
+            return
+
+        # Существующее животное обновляется только по полям, которые есть в
+        # записи: пропущенная колонка не сбрасывает значение к умолчанию модели
+        groups = {}
+        for animal, fields in entries:
+            groups.setdefault(fields, []).append(animal)
+
+        with transaction.atomic():
+            for fields, group in groups.items():
+                Animal.objects.bulk_create(
+                    group,
+                    update_conflicts=True,
+                    unique_fields=['shelter', 'external_id'],
+                    # Запись из одного external_id ничего не меняет, но upsert
+                    # все равно должен вернуть pk существующей строки
+                    update_fields=list(fields) or ['external_id'],
+                )
+            # bulk_create не вызывает сигналы, поэтому поиск и таблицу
+            # совместимости обновляем сами - одной пачкой. Пересчет стоит
+            # профили x пачка оценок, поэтому он уходит в фон после коммита,
+            # как и при обычном сохранении животного
+            index_animals(animals, animals[0]._state.db)
+            run_in_background(rescore_animals, [animal.pk for animal in animals])
+
+        self.stats['updated'] += updated
+        self.stats['created'] += len(animals) - updated
+        self.report_progress()
+
+    def report_error(self, number, error):
+        self.stats['errors'] += 1
+        if self.stats['errors'] <= MAX_REPORTED_ERRORS:
+            messages = '; '.join(
+                f'{field}: {", ".join(errors)}' for field, errors in error.message_dict.items()
+            ) if hasattr(error, 'error_dict') else '; '.join(error.messages)
+            self.stderr.write(f'Строка {number}: {messages}')
+
+    def report_progress(self, final=False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.stats['rows'] / elapsed if elapsed else 0
+        line = (
+            f"Обработано {self.stats['rows']}: создано {self.stats['created']}, "
+            f"обновлено {self.stats['updated']}, ошибок {self.stats['errors']} "
+            f"({rate:.0f} строк/с)"
+        )
+        if final:
+            prefix = 'Проверка завершена' if self.dry_run else 'Импорт завершен'
+            self.stdout.write(self.style.SUCCESS(f'{prefix}. {line}, {elapsed:.1f} с'))
+        else:
+            self.stdout.write(line)
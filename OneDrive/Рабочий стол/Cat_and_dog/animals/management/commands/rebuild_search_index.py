@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from animals.models import Animal
+from animals.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает поисковый индекс животных (FTS5 на SQLite). Нужна после '
+        'loaddata и других сохранений в обход сигналов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='База, индекс которой пересобирается')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Животных в пачке')
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=options['database']):
+            rebuild_index(Animal.objects.using(options['database']), max(options['batch_size'], 1))
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
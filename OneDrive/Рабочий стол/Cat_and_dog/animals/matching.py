@@ -0,0 +1,69 @@
+import heapq
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+
+from .models import UserProfile
+from .score_store import _batches
+from .scoring import PROFILE_FIELDS, top_profiles, traits_from_animals
+
+CHUNK_SIZE = 10000
+
+_process_pool = None
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # spawn, а не fork: воркер веб-сервера многопоточный, и копия его
+        # памяти с захваченными блокировками может зависнуть
+        _process_pool = ProcessPoolExecutor(
+            max_workers=settings.MATCHING_PROCESSES,
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+    return _process_pool
+
+
+def _chunk_results(traits, chunks, k, processes):
+    if processes <= 1:
+        for rows in chunks:
+            yield top_profiles(traits, rows, k)
+        return
+
+    # Пачек в работе не больше двух на процесс, чтобы чтение из базы
+    # не обгоняло расчет и не копило профили в памяти
+    pool = _get_process_pool()
+    pending = deque()
+    for rows in chunks:
+        pending.append(pool.submit(top_profiles, traits, rows, k))
+        if len(pending) >= processes * 2:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def top_adopters(animal, k=20, chunk_size=CHUNK_SIZE, processes=None):
+    # Обратный подбор: все анкеты против одного животного. Анкеты читаются
+    # пачками, каждая пачка считается векторно и отдает свои k лучших, а
+    # общий результат держится в куче размера k
+    processes = settings.MATCHING_PROCESSES if processes is None else processes
+    traits = traits_from_animals([animal])
+    rows = UserProfile.objects.order_by('pk').values_list(*PROFILE_FIELDS)
+    chunks = _batches(rows.iterator(chunk_size=chunk_size), chunk_size)
+
+    # В куче (оценка, -id): вершина - худший из лучших, при равной оценке
+    # вытесняется анкета с большим id
+    heap = []
+    for results in _chunk_results(traits, chunks, k, processes):
+        for score, profile_id in results:
+            entry = (score, -profile_id)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    best = sorted(heap, reverse=True)
+    profiles = UserProfile.objects.select_related('user').in_bulk([-profile_id for _, profile_id in best])
+    return [(profiles[-profile_id], score) for score, profile_id in best if -profile_id in profiles]
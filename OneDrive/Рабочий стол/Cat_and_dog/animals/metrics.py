@@ -0,0 +1,309 @@
+import atexit
+import json
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from time import monotonic, perf_counter, time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ARCHIVE_NAME = 'metrics-archive.json'
+ARCHIVE_LOCK_NAME = 'metrics-archive.lock'
+# Блокировка архива старше этого осталась от упавшего процесса
+STALE_LOCK_SECONDS = 60
+
+# Все метрики приложения: имя -> (тип, описание)
+METRICS = {
+    'animals_http_requests_total': ('counter', 'Запросы по имени маршрута, методу и статусу'),
+    'animals_http_request_duration_seconds': ('histogram', 'Время ответа по имени маршрута'),
+    'animals_adoption_submissions_total': ('counter', 'Отправки формы заявки: created или invalid'),
+    'animals_adoption_applications': ('gauge', 'Заявки в базе по статусу'),
+    'animals_cache_requests_total': ('counter', 'Обращения к кэшу каталога: hit или miss'),
+}
+
+
+def _key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class Registry:
+    # Каждый процесс копит метрики в памяти и периодически сбрасывает их в
+    # собственный файл в METRICS_DIR; эндпоинт суммирует файлы всех процессов.
+    # Файл процесса пишется целиком и подменяется атомарно, поэтому читатель
+    # никогда не видит половину записи, а процессы не мешают друг другу
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.pid = os.getpid()
+            self.token = f'{self.pid}-{uuid.uuid4().hex[:8]}'
+            self.counters = {}
+            self.histograms = {}
+            self.flushed = monotonic()
+
+    def check_fork(self):
+        # После fork потомок начинает с нуля: накопленное принадлежит родителю
+        if os.getpid() != self.pid:
+            self.reset()
+
+    def inc(self, name, amount=1, **labels):
+        self.check_fork()
+        key = (name, _key(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+        self.maybe_flush()
+
+    def observe(self, name, value, **labels):
+        self.check_fork()
+        key = (name, _key(labels))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 1) + [0.0]
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    break
+            else:
+                index = len(LATENCY_BUCKETS)
+            histogram[index] += 1
+            histogram[-1] += value
+        self.maybe_flush()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(values)] for (name, labels), values in self.histograms.items()],
+            }
+
+    def maybe_flush(self):
+        if monotonic() - self.flushed < settings.METRICS_FLUSH_INTERVAL:
+            return
+        try:
+            self.flush()
+        except OSError:
+            # Метрики не должны ронять запрос: попробуем снова через интервал
+            logger.exception('Не удалось сохранить метрики в %s', settings.METRICS_DIR)
+
+    def flush(self):
+        self.flushed = monotonic()
+        directory = metrics_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        _write(directory / f'metrics-{self.token}.json', self.snapshot())
+
+
+registry = Registry()
+
+
+def metrics_dir():
+    return Path(settings.METRICS_DIR)
+
+
+def _write(path, data):
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix='.metrics-', suffix='.tmp')
+    with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+def _read(path):
+    try:
+        with path.open(encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _merge(data, counters, histograms):
+    for name, labels, value in data['counters']:
+        key = (name, _key(labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, values in data['histograms']:
+        key = (name, _key(labels))
+        total = histograms.setdefault(key, [0] * len(values))
+        histograms[key] = [left + right for left, right in zip(total, values)]
+
+
+def _process_alive(path):
+    # Имя файла процесса - metrics-<pid>-<случайный суффикс>.json
+    pid = path.stem.removeprefix('metrics-').split('-')[0]
+    if not pid.isdigit() or int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def fold_dead_processes(directory):
+    # Файлы завершившихся воркеров складываются в один архивный, чтобы
+    # каталог не рос с каждым перезапуском. Счетчики при этом не теряются,
+    # а одновременные сборщики не складывают один файл дважды - архив
+    # меняется только под блокировкой
+    if os.name == 'nt':
+        # В Windows os.kill(pid, 0) не проверяет процесс, а завершает его
+        return
+    dead = [path for path in directory.glob('metrics-*.json') if not _process_alive(path)]
+    if not dead:
+        return
+
+    lock = directory / ARCHIVE_LOCK_NAME
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        try:
+            if time() - lock.stat().st_mtime > STALE_LOCK_SECONDS:
+                lock.unlink()
+        except OSError:
+            pass
+        return
+
+    try:
+        counters, histograms = {}, {}
+        archive = directory / ARCHIVE_NAME
+        for path in [archive, *dead]:
+            data = _read(path)
+            if data is not None:
+                _merge(data, counters, histograms)
+        _write(archive, {
+            'counters': [[name, dict(labels), value] for (name, labels), value in counters.items()],
+            'histograms': [[name, dict(labels), values] for (name, labels), values in histograms.items()],
+        })
+        for path in dead:
+            path.unlink()
+    finally:
+        lock.unlink()
+
+
+def _flush_at_exit():
+    if os.getpid() == registry.pid and (registry.counters or registry.histograms):
+        try:
+            registry.flush()
+        except OSError:
+            pass
+
+
+atexit.register(_flush_at_exit)
+
+
+def collect():
+    # Сумма по файлам всех процессов, включая уже завершившиеся (они в архиве):
+    # счетчики монотонны, поэтому данные ушедших воркеров не теряются
+    registry.flush()
+    directory = metrics_dir()
+    try:
+        fold_dead_processes(directory)
+    except OSError:
+        logger.exception('Не удалось свернуть метрики завершившихся процессов в %s', directory)
+    counters, histograms = {}, {}
+    for path in directory.glob('metrics-*.json'):
+        data = _read(path)
+        if data is not None:
+            _merge(data, counters, histograms)
+    return counters, histograms
+
+
+def application_gauges():
+    from django.db.models import Count
+
+    from .models import AdoptionApplication
+
+    counts = dict.fromkeys(dict(AdoptionApplication.STATUS_CHOICES), 0)
+    counts.update(AdoptionApplication.objects.values_list('status').annotate(count=Count('id')).order_by())
+    return {
+        ('animals_adoption_applications', _key({'status': status})): count
+        for status, count in counts.items()
+    }
+
+
+def _labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in items
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    # Текстовый формат Prometheus 0.0.4
+    counters, histograms = collect()
+    counters.update(application_gauges())
+
+    lines = []
+    for name, (kind, description) in METRICS.items():
+        series = sorted(
+            (labels, value) for (metric, labels), value in
+            (histograms if kind == 'histogram' else counters).items() if metric == name
+        )
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in series:
+            if kind != 'histogram':
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(value[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+class MetricsMiddleware:
+    # Пропускная способность и гистограмма времени ответа по имени маршрута
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, perf_counter() - started)
+        return response
+
+    def record(self, request, response, duration):
+        view = view_name(request)
+        registry.inc(
+            'animals_http_requests_total', view=view, method=request.method, status=response.status_code
+        )
+        registry.observe('animals_http_request_duration_seconds', duration, view=view)
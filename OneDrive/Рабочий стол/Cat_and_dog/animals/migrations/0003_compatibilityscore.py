@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0002_alter_adoptionapplication_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompatibilityScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField(verbose_name='Процент совместимости')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата расчета')),
+                ('animal', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatibility_scores', to='animals.animal', verbose_name='Животное')),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatibility_scores', to='animals.userprofile', verbose_name='Профиль')),
+            ],
+            options={
+                'verbose_name': 'Совместимость',
+                'verbose_name_plural': 'Таблица совместимости',
+                'indexes': [models.Index(fields=['profile', '-score'], name='compat_profile_score_idx')],
+                'constraints': [models.UniqueConstraint(fields=('profile', 'animal'), name='unique_compatibility_score')],
+            },
+        ),
+    ]
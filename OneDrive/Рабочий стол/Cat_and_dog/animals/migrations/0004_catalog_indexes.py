@@ -0,0 +1,35 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0003_compatibilityscore'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='adoptionapplication',
+            index=models.Index(fields=['email', '-created_at'], name='application_email_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['name'], name='animal_available_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['age'], name='animal_available_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['child_friendly'], name='animal_available_child_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['species', 'size_category', 'name'], name='animal_available_kind_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['size_category', 'name'], name='animal_available_size_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+import re
+
+import snowballstemmer
+from django.db import migrations
+
+# Копия DDL и стемминга animals.search на момент миграции: код приложения
+# может меняться, а историческая миграция должна работать как раньше
+FTS_TABLE = 'animals_animal_fts'
+PG_INDEX_NAME = 'animal_search_idx'
+WORD_RE = re.compile(r'\w+')
+
+
+def stem_text(stemmer, text):
+    return ' '.join(stemmer.stemWord(word) for word in WORD_RE.findall((text or '').lower().replace('ё', 'е')))
+
+
+def create_search_index(apps, schema_editor):
+    Animal = apps.get_model('animals', 'Animal')
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"name, breed, description, tokenize='unicode61 remove_diacritics 2')"
+        )
+        stemmer = snowballstemmer.stemmer('russian')
+        animals = Animal.objects.using(schema_editor.connection.alias).only('name', 'breed', 'description')
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, name, breed, description) VALUES (%s, %s, %s, %s)',
+                [
+                    (
+                        animal.pk,
+                        stem_text(stemmer, animal.name),
+                        stem_text(stemmer, animal.breed),
+                        stem_text(stemmer, animal.description),
+                    )
+                    for animal in animals.iterator()
+                ]
+            )
+    elif vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        vector = (
+            SearchVector('name', weight='A', config='russian')
+            + SearchVector('breed', weight='B', config='russian')
+            + SearchVector('description', weight='C', config='russian')
+        )
+        schema_editor.add_index(Animal, GinIndex(vector, name=PG_INDEX_NAME))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+    elif vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PG_INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
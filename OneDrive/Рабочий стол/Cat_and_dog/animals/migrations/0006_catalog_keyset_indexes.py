@@ -0,0 +1,51 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0005_animal_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='animal',
+            name='animal_available_name_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='animal',
+            name='animal_available_age_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='animal',
+            name='animal_available_child_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='animal',
+            name='animal_available_kind_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='animal',
+            name='animal_available_size_idx',
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['name', 'id'], name='animal_available_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['age', 'id'], name='animal_available_age_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['child_friendly', 'id'], name='animal_available_child_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['species', 'size_category', 'name', 'id'], name='animal_available_kind_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['size_category', 'name', 'id'], name='animal_available_size_idx'),
+        ),
+    ]
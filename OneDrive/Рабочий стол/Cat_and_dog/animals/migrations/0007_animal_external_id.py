@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0006_catalog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animal',
+            name='external_id',
+            field=models.CharField(blank=True, help_text='ID животного в системе приюта - по нему обновляются записи при импорте', max_length=100, null=True, verbose_name='Внешний ID'),
+        ),
+        migrations.AddConstraint(
+            model_name='animal',
+            constraint=models.UniqueConstraint(fields=('shelter', 'external_id'), name='unique_shelter_external_id'),
+        ),
+    ]
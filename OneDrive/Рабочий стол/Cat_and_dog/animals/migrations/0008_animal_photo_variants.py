@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0007_animal_external_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animal',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Уменьшенные копии фото в WebP и JPEG, создаются в фоне после сохранения', verbose_name='Варианты фотографии'),
+        ),
+    ]
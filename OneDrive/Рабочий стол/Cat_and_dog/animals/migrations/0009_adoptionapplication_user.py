@@ -0,0 +1,23 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0008_animal_photo_variants'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adoptionapplication',
+            name='user',
+            field=models.ForeignKey(blank=True, help_text='Автор заявки, если он отправил ее под своей учетной записью', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='adoption_applications', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AddIndex(
+            model_name='adoptionapplication',
+            index=models.Index(fields=['user', '-created_at'], name='application_user_created_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations, transaction
+
+BATCH_SIZE = 1000
+
+
+def link_applications_to_users(apps, schema_editor):
+    # Старые заявки находят автора по email. Пользователи обходятся пачками,
+    # каждая пачка - отдельная транзакция, поэтому миграция не держит
+    # блокировку на всю таблицу заявок. При одинаковом email заявки
+    # достаются пользователю, зарегистрированному раньше
+    User = apps.get_model('auth', 'User')
+    AdoptionApplication = apps.get_model('animals', 'AdoptionApplication')
+    alias = schema_editor.connection.alias
+    users = User.objects.using(alias).exclude(email='').order_by('pk').values_list('pk', 'email')
+    unlinked = AdoptionApplication.objects.using(alias).filter(user__isnull=True)
+
+    last_pk = 0
+    while batch := list(users.filter(pk__gt=last_pk)[:BATCH_SIZE]):
+        last_pk = batch[-1][0]
+        with transaction.atomic(using=alias):
+            # Запросы по email идут по индексу application_email_created_idx,
+            # который удаляется только после заполнения
+            emails = set(unlinked.filter(email__in=[email for _, email in batch]).values_list('email', flat=True))
+            for pk, email in batch:
+                if email in emails:
+                    unlinked.filter(email=email).update(user_id=pk)
+                    emails.discard(email)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('animals', '0009_adoptionapplication_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(link_applications_to_users, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='adoptionapplication',
+            name='application_email_created_idx',
+        ),
+    ]
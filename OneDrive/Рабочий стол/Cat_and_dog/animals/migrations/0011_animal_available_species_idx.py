@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animals', '0010_link_applications_to_users'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='animal',
+            index=models.Index(condition=models.Q(('is_available', True)), fields=['species', 'name', 'id'], name='animal_available_species_idx'),
+        ),
+    ]
@@ -1,6 +1,9 @@
+from functools import partial
+
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 SIZE_CHOICES = [
@@ -80,6 +83,13 @@ class Animal(models.Model):
         blank=True,
         null=True
     )
+    photo_variants = models.JSONField(
+        "Варианты фотографии",
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Уменьшенные копии фото в WebP и JPEG, создаются в фоне после сохранения"
+    )
 
     child_friendly = models.IntegerField(
         "Дружелюбие к детям",
@@ -110,6 +120,13 @@ class Animal(models.Model):
         "Ищет дом",
         default=True
     )
+    external_id = models.CharField(
+        "Внешний ID",
+        max_length=100,
+        blank=True,
+        null=True,
+        help_text="ID животного в системе приюта - по нему обновляются записи при импорте"
+    )
 
     def __str__(self):
         if self.name:
@@ -120,6 +137,41 @@ class Animal(models.Model):
         verbose_name = "Животное"
         verbose_name_plural = "Животные"
         ordering = ['name']
+        # Каталог всегда фильтрует по доступности, поэтому индексы частичные:
+        # в них только доступные животные, а порядок совпадает с сортировками
+        # и ключом пагинации (поле сортировки, id)
+        indexes = [
+            models.Index(
+                fields=['name', 'id'], condition=models.Q(is_available=True),
+                name='animal_available_name_idx'
+            ),
+            models.Index(
+                fields=['age', 'id'], condition=models.Q(is_available=True),
+                name='animal_available_age_idx'
+            ),
+            models.Index(
+                fields=['child_friendly', 'id'], condition=models.Q(is_available=True),
+                name='animal_available_child_idx'
+            ),
+            models.Index(
+                fields=['species', 'size_category', 'name', 'id'], condition=models.Q(is_available=True),
+                name='animal_available_kind_idx'
+            ),
+            models.Index(
+                fields=['species', 'name', 'id'], condition=models.Q(is_available=True),
+                name='animal_available_species_idx'
+            ),
+            models.Index(
+                fields=['size_category', 'name', 'id'], condition=models.Q(is_available=True),
+                name='animal_available_size_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['shelter', 'external_id'],
+                name='unique_shelter_external_id'
+            ),
+        ]
 
 
 class AdoptionApplication(models.Model):
@@ -136,6 +188,15 @@ class AdoptionApplication(models.Model):
         verbose_name="Животное",
         related_name='applications'
     )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name="Пользователь",
+        related_name='adoption_applications',
+        help_text="Автор заявки, если он отправил ее под своей учетной записью"
+    )
     full_name = models.CharField(
         "ФИО",
         max_length=150
@@ -174,6 +235,9 @@ class AdoptionApplication(models.Model):
         verbose_name = "Заявка на усыновление"
         verbose_name_plural = "Заявки на усыновление"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='application_user_created_idx'),
+        ]
 
 
 class UserProfile(models.Model):
@@ -268,9 +332,28 @@ class UserProfile(models.Model):
         auto_now=True
     )
 
+    SCORING_FIELDS = (
+        'has_children',
+        'has_other_pets',
+        'pref_activity_level',
+        'pref_size',
+        'experience_years',
+        'daily_walk_time',
+        'has_garden',
+    )
+
     def __str__(self):
         return f"Профиль: {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._scoring_snapshot = instance.get_scoring_snapshot()
+        return instance
+
+    def get_scoring_snapshot(self):
+        return tuple(getattr(self, field, None) for field in self.SCORING_FIELDS)
+
     def get_experience_level(self):
         if self.experience_years == 0:
             return "Новичок"
@@ -279,60 +362,50 @@ class UserProfile(models.Model):
         else:
             return "Профессионал"
 
-    def calculate_compatibility_with_animal(self, animal):
-        total_score = 0
+    def calculate_compatibility_with_animal(self, animal, weights=None):
+        from .scoring import score_animals, traits_from_animals
 
-        if self.has_children:
-            child_score = (animal.child_friendly / 10.0) * 25
-        else:
-            child_score = 12.5
-        total_score += child_score
+        return score_animals(self, traits_from_animals([animal]), weights)[0].item()
 
-        if self.has_other_pets:
-            pet_score = (animal.other_pet_friendly / 10.0) * 20
-        else:
-            pet_score = 10
-        total_score += pet_score
-
-        activity_diff = abs(animal.activity_level - self.pref_activity_level)
-        activity_score = max(0, (10 - activity_diff) / 10.0) * 15
-        total_score += activity_score
-
-        if self.pref_size and animal.size_category == self.pref_size:
-            size_score = 15
-        elif self.pref_size and animal.size_category != self.pref_size:
-            size_score = 5
-        else:
-            size_score = 10
-        total_score += size_score
-
-        if self.experience_years >= 3 and animal.activity_level <= 7:
-            experience_score = 10
-        elif self.experience_years >= 1:
-            experience_score = 7
-        else:
-            experience_score = 5
-        total_score += experience_score
-
-        if animal.species == 'dog' and self.daily_walk_time >= 60:
-            conditions_score = 15
-        elif animal.species == 'dog' and self.daily_walk_time >= 30:
-            conditions_score = 10
-        elif animal.species == 'dog':
-            conditions_score = 5
-        else:
-            conditions_score = 12
+    class Meta:
+        verbose_name = "Профиль пользователя"
+        verbose_name_plural = "Профили пользователей"
 
-        if animal.size_category == 'large' and self.has_garden:
-            conditions_score += 3
 
-        total_score += min(conditions_score, 15)
+class CompatibilityScore(models.Model):
+    profile = models.ForeignKey(
+        UserProfile,
+        on_delete=models.CASCADE,
+        verbose_name="Профиль",
+        related_name='compatibility_scores'
+    )
+    animal = models.ForeignKey(
+        Animal,
+        on_delete=models.CASCADE,
+        verbose_name="Животное",
+        related_name='compatibility_scores'
+    )
+    score = models.FloatField("Процент совместимости")
+    updated_at = models.DateTimeField(
+        "Дата расчета",
+        auto_now=True
+    )
 
-        return round(total_score, 1)
+    def __str__(self):
+        return f"{self.profile_id} - {self.animal_id}: {self.score}%"
 
     class Meta:
-        verbose_name = "Профиль пользователя"
-        verbose_name_plural = "Профили пользователей"
+        verbose_name = "Совместимость"
+        verbose_name_plural = "Таблица совместимости"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['profile', 'animal'],
+                name='unique_compatibility_score'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['profile', '-score'], name='compat_profile_score_idx'),
+        ]
 
 
 @receiver(post_save, sender=User)
@@ -344,4 +417,91 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
-        instance.profile.save()
\ No newline at end of file
+        instance.profile.save()
+
+
+@receiver(post_save, sender=Animal)
+@receiver(post_delete, sender=Animal)
+def invalidate_catalog_cache(sender, instance, **kwargs):
+    from .statistics import bump_catalog_version
+
+    # После удаления Django обнуляет pk, поэтому id запоминается сразу
+    transaction.on_commit(partial(bump_catalog_version, [instance.pk]))
+
+
+@receiver(post_save, sender=Animal)
+@receiver(post_delete, sender=Animal)
+def refresh_catalog_snapshot(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .snapshot import schedule_snapshot_refresh
+
+    # Регистрируется после смены версии каталога, поэтому собирается уже новая версия
+    transaction.on_commit(schedule_snapshot_refresh)
+
+
+@receiver(post_save, sender=Animal)
+def update_search_index(sender, instance, using, raw=False, **kwargs):
+    # loaddata и фикстуры не трогают индекс: после них его пересобирает
+    # команда rebuild_search_index
+    if raw:
+        return
+    from .search import index_animals
+
+    index_animals([instance], using)
+
+
+@receiver(post_delete, sender=Animal)
+def remove_from_search_index(sender, instance, using, **kwargs):
+    from .search import unindex_animal
+
+    unindex_animal(instance.pk, using)
+
+
+@receiver(post_save, sender=Animal)
+def refresh_animal_scores(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .background import run_in_background
+    from .score_store import rescore_animal
+
+    run_in_background(rescore_animal, instance.pk)
+
+
+@receiver(post_save, sender=Animal)
+def refresh_photo_variants(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    source = instance.photo.name if instance.photo else ''
+    if (instance.photo_variants or {}).get('source', '') == source:
+        return
+    from .background import run_in_background
+    from .images import refresh_photo_variants
+
+    run_in_background(refresh_photo_variants, instance.pk)
+
+
+@receiver(post_delete, sender=Animal)
+def remove_photo_variants(sender, instance, **kwargs):
+    if not instance.photo_variants:
+        return
+    from .background import run_in_background
+    from .images import delete_variants
+
+    run_in_background(delete_variants, instance.photo_variants)
+
+
+@receiver(post_save, sender=UserProfile)
+def refresh_profile_scores(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # Профиль сохраняется при каждом входе пользователя - пересчитываем
+    # совместимость только если изменились поля анкеты, влияющие на расчет
+    snapshot = instance.get_scoring_snapshot()
+    if not created and snapshot == getattr(instance, '_scoring_snapshot', None):
+        return
+    instance._scoring_snapshot = snapshot
+    from .background import run_in_background
+    from .score_store import rescore_profile
+
+    run_in_background(rescore_profile, instance.pk)
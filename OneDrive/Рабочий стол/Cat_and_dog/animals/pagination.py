@@ -0,0 +1,105 @@
+import base64
+import binascii
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def encode_cursor(values):
+    data = json.dumps(values, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data.decode('utf-8'))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _field(key):
+    return key.lstrip('-')
+
+
+def _after(keys, values):
+    # (k1, k2, ..., id) строго после значений курсора с учетом направления каждого ключа
+    condition = Q()
+    for index, key in enumerate(keys):
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        step = Q(**{f'{_field(key)}__{lookup}': values[index]})
+        for previous, value in zip(keys[:index], values):
+            step &= Q(**{_field(previous): value})
+        condition |= step
+
+    # Диапазон по первому ключу позволяет базе начать чтение индекса с нужного места
+    first = 'lte' if keys[0].startswith('-') else 'gte'
+    return Q(**{f'{_field(keys[0])}__{first}': values[0]}) & condition
+
+
+def keyset_queryset(queryset, ordering, cursor=None):
+    keys = list(ordering) + ['id']
+    queryset = queryset.order_by(*keys)
+
+    values = decode_cursor(cursor) if cursor else None
+    if values is not None and len(values) == len(keys):
+        queryset = queryset.filter(_after(keys, values))
+    return queryset
+
+
+def _keyset_page(object_list, ordering, per_page):
+    if len(object_list) <= per_page:
+        return KeysetPage(object_list)
+
+    object_list = object_list[:per_page]
+    last = object_list[-1]
+    keys = list(ordering) + ['id']
+    return KeysetPage(object_list, encode_cursor([getattr(last, _field(key)) for key in keys]))
+
+
+def keyset_paginate(queryset, ordering, cursor=None, per_page=6):
+    # Пагинация по ключу сортировки и id вместо OFFSET: страница любой
+    # глубины читается так же быстро, как первая, и не требует COUNT(*)
+    object_list = list(keyset_queryset(queryset, ordering, cursor)[:per_page + 1])
+    return _keyset_page(object_list, ordering, per_page)
+
+
+async def akeyset_paginate(queryset, ordering, cursor=None, per_page=6):
+    queryset = keyset_queryset(queryset, ordering, cursor)[:per_page + 1]
+    return _keyset_page([item async for item in queryset], ordering, per_page)
+
+
+class EstimatedCountPaginator(Paginator):
+    # Для больших таблиц без фильтров точный COUNT(*) заменяется оценкой
+    # из статистики PostgreSQL; отфильтрованные списки считаются точно
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            connection = connections[self.object_list.db]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT reltuples FROM pg_class WHERE relname = %s',
+                        [self.object_list.model._meta.db_table]
+                    )
+                    row = cursor.fetchone()
+                if row and row[0] >= self.estimate_threshold:
+                    return int(row[0])
+        return super().count
@@ -0,0 +1,119 @@
+import random
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_COOKIE = 'db_primary'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Состояние маршрутизации текущего запроса; вне запроса (команды,
+# фоновые задачи) все читается с основной базы
+_state = ContextVar('animals_db_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('primary', 'wrote')
+
+    def __init__(self, primary):
+        self.primary = primary
+        self.wrote = False
+
+
+class ReplicaRouter:
+    # Запросы только на чтение читают со случайной реплики, все записи и
+    # чтения пишущих запросов идут в default
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state.primary or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # После записи этот клиент какое-то время читает с основной базы,
+            # пока реплики не догонят
+            state.wrote = True
+            state.primary = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же данные, что и в default
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def use_primary(view):
+    # Представление, которое пишет в базу или должно видеть свежие данные
+    # даже на GET, целиком работает с default
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        return view(*args, **kwargs)
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            return await view(*args, **kwargs)
+
+    wrapper.use_primary_db = True
+    return wrapper
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def start(self, request):
+        return RoutingState(
+            primary=request.method not in SAFE_METHODS or PRIMARY_COOKIE in request.COOKIES
+        )
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    async def __acall__(self, request):
+        state = self.start(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.finish(response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = _state.get()
+        match = request.resolver_match
+        if state is not None and (
+            getattr(view_func, 'use_primary_db', False) or (match and match.namespace == 'admin')
+        ):
+            state.primary = True
+
+    def finish(self, response, state):
+        if state.wrote:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1', max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax'
+            )
+        return response
@@ -0,0 +1,141 @@
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.db import connections, router, transaction
+from django.utils import timezone
+
+from .background import run_cpu_bound
+from .models import Animal, CompatibilityScore, UserProfile
+from .scoring import (
+    PROFILE_FIELDS,
+    compatibility_scores,
+    load_traits,
+    profiles_from_rows,
+    score_animals,
+)
+from .snapshot import catalog_snapshot
+
+BATCH_SIZE = 2000
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _save_scores(pairs):
+    # Оценок много (профили x животные), поэтому на SQLite и PostgreSQL пишем их
+    # через executemany с ON CONFLICT, без создания объектов модели на каждую строку.
+    # База берется у роутера, как при обычном сохранении: он отмечает запись,
+    # и клиент потом читает свои оценки с основной базы
+    connection = connections[router.db_for_write(CompatibilityScore)]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        CompatibilityScore.objects.using(connection.alias).bulk_create(
+            [
+                CompatibilityScore(profile_id=profile_id, animal_id=animal_id, score=score)
+                for profile_id, animal_id, score in pairs
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['profile', 'animal'],
+            update_fields=['score', 'updated_at'],
+        )
+        return
+
+    table = connection.ops.quote_name(CompatibilityScore._meta.db_table)
+    sql = (
+        f'INSERT INTO {table} (profile_id, animal_id, score, updated_at) VALUES (%s, %s, %s, %s) '
+        f'ON CONFLICT (profile_id, animal_id) DO UPDATE SET score = excluded.score, updated_at = excluded.updated_at'
+    )
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        for batch in _batches(pairs, BATCH_SIZE):
+            cursor.executemany(sql, [(profile_id, animal_id, score, now) for profile_id, animal_id, score in batch])
+
+
+def rescore_profile(profile_id):
+    # Строка профиля в таблице совместимости: профиль против всех доступных животных
+    profile = UserProfile.objects.filter(pk=profile_id).first()
+    if profile is None:
+        return
+
+    # Строки пишутся в таблицу, поэтому снимок нужен свежий, а не прежний
+    traits = catalog_snapshot(wait=True)
+    scores = score_animals(profile, traits)
+
+    with transaction.atomic():
+        CompatibilityScore.objects.filter(profile_id=profile_id).delete()
+        _save_scores(
+            (profile_id, animal_id, score)
+            for animal_id, score in zip(traits['id'].tolist(), scores.tolist())
+        )
+
+
+def rescore_animal(animal_id):
+    rescore_animals([animal_id])
+
+
+def rescore_animals(animal_ids):
+    # Столбцы таблицы совместимости: пачка животных против всех профилей
+    animal_ids = list(animal_ids)
+
+    with transaction.atomic():
+        CompatibilityScore.objects.filter(animal_id__in=animal_ids).delete()
+        traits = load_traits(Animal.objects.filter(pk__in=animal_ids, is_available=True).order_by())
+        animal_count = len(traits['id'])
+        if not animal_count:
+            return
+
+        # Профили берутся кусками так, чтобы матрица профили x животные
+        # оставалась порядка BATCH_SIZE оценок
+        chunk_size = max(1, BATCH_SIZE // animal_count)
+        rows = UserProfile.objects.order_by('pk').values_list(*PROFILE_FIELDS)
+        for batch in _batches(rows.iterator(chunk_size=BATCH_SIZE), chunk_size):
+            profiles = profiles_from_rows(batch)
+            columns = {field: values[:, None] for field, values in profiles.items()}
+            scores = compatibility_scores(columns, traits)
+            _save_scores(
+                (profile_id, animal_id, score)
+                for profile_id, row in zip(profiles['id'].tolist(), scores.tolist())
+                for animal_id, score in zip(traits['id'].tolist(), row)
+            )
+
+
+def available_scores(profile):
+    return CompatibilityScore.objects.filter(
+        profile=profile, animal__is_available=True
+    ).order_by('-score', 'animal__name')
+
+
+def ensure_profile_scores(profile):
+    # Если фоновый пересчет еще не успел заполнить строку профиля - считаем сразу
+    stored = available_scores(profile).count()
+    if stored < len(catalog_snapshot()):
+        rescore_profile(profile.pk)
+
+
+async def aensure_profile_scores(profile):
+    stored = await available_scores(profile).acount()
+    if stored < len(await sync_to_async(catalog_snapshot)()):
+        await sync_to_async(rescore_profile)(profile.pk)
+
+
+def score_for_animal(profile, animal):
+    # Чтение ничего не пишет: недостающую строку заполнит фоновый пересчет,
+    # а запись на GET закрепила бы клиента за основной базой
+    score = CompatibilityScore.objects.filter(
+        profile=profile, animal=animal
+    ).values_list('score', flat=True).first()
+    if score is None:
+        score = profile.calculate_compatibility_with_animal(animal)
+    return score
+
+
+async def ascore_for_animal(profile, animal):
+    score = await CompatibilityScore.objects.filter(
+        profile=profile, animal=animal
+    ).values_list('score', flat=True).afirst()
+    if score is None:
+        score = await run_cpu_bound(profile.calculate_compatibility_with_animal, animal)
+    return score
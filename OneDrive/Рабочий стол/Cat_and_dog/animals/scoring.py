@@ -0,0 +1,223 @@
+import numpy as np
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from django.db.models.functions import Abs, Cast
+
+SPECIES_CODES = {'cat': 0, 'dog': 1}
+SIZE_CODES = {'small': 0, 'medium': 1, 'large': 2}
+UNKNOWN_CODE = -1
+NO_PREFERENCE = -2
+
+TRAIT_FIELDS = (
+    'id',
+    'child_friendly',
+    'other_pet_friendly',
+    'activity_level',
+    'size_category',
+    'species',
+)
+
+# Слагаемые оценки и их максимум в баллах: это и есть веса алгоритма
+DEFAULT_WEIGHTS = {
+    'children': 25,
+    'pets': 20,
+    'activity': 15,
+    'size': 15,
+    'experience': 10,
+    'conditions': 15,
+}
+
+PROFILE_FIELDS = (
+    'id',
+    'has_children',
+    'has_other_pets',
+    'pref_activity_level',
+    'pref_size',
+    'experience_years',
+    'daily_walk_time',
+    'has_garden',
+)
+
+
+def _size_code(size):
+    return SIZE_CODES.get(size, UNKNOWN_CODE)
+
+
+def _pref_size_code(size):
+    return _size_code(size) if size else NO_PREFERENCE
+
+
+def traits_from_rows(rows):
+    # rows - кортежи в порядке TRAIT_FIELDS
+    rows = list(rows)
+    ids, child, pets, activity, sizes, species = zip(*rows) if rows else ((),) * 6
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'child_friendly': np.array(child, dtype=np.int64),
+        'other_pet_friendly': np.array(pets, dtype=np.int64),
+        'activity_level': np.array(activity, dtype=np.int64),
+        'size_category': np.array([_size_code(s) for s in sizes], dtype=np.int8),
+        'species': np.array([SPECIES_CODES.get(s, UNKNOWN_CODE) for s in species], dtype=np.int8),
+    }
+
+
+def traits_from_animals(animals):
+    return traits_from_rows(
+        tuple(getattr(animal, field) for field in TRAIT_FIELDS) for animal in animals
+    )
+
+
+def load_traits(queryset):
+    return traits_from_rows(queryset.values_list(*TRAIT_FIELDS))
+
+
+def profiles_from_rows(rows):
+    # rows - кортежи в порядке PROFILE_FIELDS
+    rows = list(rows)
+    ids, children, pets, activity, sizes, experience, walk, garden = zip(*rows) if rows else ((),) * 8
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'has_children': np.array(children, dtype=bool),
+        'has_other_pets': np.array(pets, dtype=bool),
+        'pref_activity_level': np.array(activity, dtype=np.int64),
+        'pref_size': np.array([_pref_size_code(s) for s in sizes], dtype=np.int8),
+        'experience_years': np.array(experience, dtype=np.int64),
+        'daily_walk_time': np.array(walk, dtype=np.int64),
+        'has_garden': np.array(garden, dtype=bool),
+    }
+
+
+def profile_columns(profile):
+    columns = {field: getattr(profile, field) for field in PROFILE_FIELDS}
+    columns['pref_size'] = _pref_size_code(profile.pref_size)
+    return columns
+
+
+def compatibility_scores(profile, traits, weights=None):
+    # Векторная версия алгоритма совместимости. Колонки профиля и животных
+    # могут быть как скалярами, так и массивами - результат вычисляется по
+    # правилам broadcasting NumPy (один профиль на много животных и наоборот).
+    child_friendly = traits['child_friendly']
+    activity_level = traits['activity_level']
+    size_category = traits['size_category']
+    is_dog = traits['species'] == SPECIES_CODES['dog']
+
+    child_score = np.where(profile['has_children'], (child_friendly / 10.0) * 25, 12.5)
+    pet_score = np.where(profile['has_other_pets'], (traits['other_pet_friendly'] / 10.0) * 20, 10)
+
+    activity_diff = np.abs(activity_level - profile['pref_activity_level'])
+    activity_score = np.maximum(0, (10 - activity_diff) / 10.0) * 15
+
+    size_score = np.where(
+        profile['pref_size'] == NO_PREFERENCE,
+        10,
+        np.where(size_category == profile['pref_size'], 15, 5)
+    )
+
+    experience_years = profile['experience_years']
+    experience_score = np.where(
+        (experience_years >= 3) & (activity_level <= 7),
+        10,
+        np.where(experience_years >= 1, 7, 5)
+    )
+
+    walk_time = profile['daily_walk_time']
+    dog_score = np.where(walk_time >= 60, 15, np.where(walk_time >= 30, 10, 5))
+    conditions_score = np.where(is_dog, dog_score, 12) + np.where(
+        (size_category == SIZE_CODES['large']) & profile['has_garden'], 3, 0
+    )
+
+    scores = (
+        child_score,
+        pet_score,
+        activity_score,
+        size_score,
+        experience_score,
+        np.minimum(conditions_score, 15),
+    )
+    if weights is not None:
+        # Другие веса растягивают каждое слагаемое до своего максимума
+        scores = [
+            score * (weights[name] / DEFAULT_WEIGHTS[name])
+            for name, score in zip(DEFAULT_WEIGHTS, scores)
+        ]
+    return np.round(sum(scores), 1)
+
+
+def score_animals(profile, traits, weights=None):
+    return compatibility_scores(profile_columns(profile), traits, weights)
+
+
+def top_profiles(traits, rows, k):
+    # Лучшие k профилей из пачки строк PROFILE_FIELDS для одного животного:
+    # [(оценка, id профиля)] по убыванию оценки, при равенстве - по id.
+    # Модуль не трогает базу, поэтому функция годится для пула процессов
+    profiles = profiles_from_rows(rows)
+    scores = compatibility_scores(profiles, traits)
+    ids = profiles['id']
+    if len(scores) > k:
+        # Оценки дискретны (шаг 0.5), поэтому на границе много равных:
+        # берем всех не хуже k-й и упорядочиваем только их
+        threshold = np.partition(scores, -k)[-k]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    best = candidates[np.lexsort((ids[candidates], -scores[candidates]))][:k]
+    return list(zip(scores[best].tolist(), ids[best].tolist()))
+
+
+def compatibility_expression(profile):
+    # Та же формула в виде выражения для базы данных, чтобы сортировка,
+    # фильтрация и LIMIT выполнялись в SQL. Все слагаемые кратны 0.5,
+    # поэтому считаем в целых "полубаллах" и делим на 2 в конце - так
+    # результат совпадает с округленным значением score_animals.
+    def case(*whens, default):
+        return Case(*whens, default=Value(default), output_field=IntegerField())
+
+    if profile.has_children:
+        child_score = F('child_friendly') * 5
+    else:
+        child_score = Value(25)
+
+    if profile.has_other_pets:
+        pet_score = F('other_pet_friendly') * 4
+    else:
+        pet_score = Value(20)
+
+    pref_activity = profile.pref_activity_level
+    activity_score = case(
+        When(
+            activity_level__gte=pref_activity - 10,
+            activity_level__lte=pref_activity + 10,
+            then=(10 - Abs(F('activity_level') - pref_activity)) * 3
+        ),
+        default=0
+    )
+
+    if profile.pref_size:
+        size_score = case(When(size_category=profile.pref_size, then=Value(30)), default=10)
+    else:
+        size_score = Value(20)
+
+    if profile.experience_years >= 3:
+        experience_score = case(When(activity_level__lte=7, then=Value(20)), default=14)
+    elif profile.experience_years >= 1:
+        experience_score = Value(14)
+    else:
+        experience_score = Value(10)
+
+    if profile.daily_walk_time >= 60:
+        dog_score = 15
+    elif profile.daily_walk_time >= 30:
+        dog_score = 10
+    else:
+        dog_score = 5
+    garden_bonus = 3 if profile.has_garden else 0
+    conditions_score = case(
+        When(species='dog', size_category='large', then=Value(2 * min(dog_score + garden_bonus, 15))),
+        When(species='dog', then=Value(2 * dog_score)),
+        When(size_category='large', then=Value(2 * min(12 + garden_bonus, 15))),
+        default=2 * 12
+    )
+
+    half_points = child_score + pet_score + activity_score + size_score + experience_score + conditions_score
+    return Cast(half_points, FloatField()) / Value(2.0)
@@ -0,0 +1,143 @@
+import re
+import threading
+from functools import lru_cache
+
+import snowballstemmer
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'animals_animal_fts'
+SEARCH_FIELDS = ('name', 'breed', 'description')
+# Кличка важнее породы, порода важнее описания
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+PG_WEIGHTS = ('A', 'B', 'C')
+SEARCH_CONFIG = 'russian'
+
+WORD_RE = re.compile(r'\w+')
+
+_local = threading.local()
+
+
+def _stemmer():
+    # Объект стеммера хранит состояние, поэтому у каждого потока свой
+    if not hasattr(_local, 'stemmer'):
+        _local.stemmer = snowballstemmer.stemmer(SEARCH_CONFIG)
+    return _local.stemmer
+
+
+def words(text):
+    return WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+
+
+@lru_cache(maxsize=50000)
+def stem_word(word):
+    # Словарь кличек и описаний небольшой, поэтому основы слов кэшируются
+    return _stemmer().stemWord(word)
+
+
+def stem_words(text):
+    return [stem_word(word) for word in words(text)]
+
+
+def stem_text(text):
+    return ' '.join(stem_words(text))
+
+
+def fts_enabled(connection):
+    return connection.vendor == 'sqlite'
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    vector = None
+    for field, weight in zip(SEARCH_FIELDS, PG_WEIGHTS):
+        part = SearchVector(field, weight=weight, config=SEARCH_CONFIG)
+        vector = part if vector is None else vector + part
+    return vector
+
+
+def index_rows(cursor, animals):
+    # В FTS5 лежат уже приведенные к основе слова: своего русского стеммера у SQLite нет
+    cursor.executemany(
+        f'INSERT INTO {FTS_TABLE} (rowid, name, breed, description) VALUES (%s, %s, %s, %s)',
+        [
+            (animal.pk, stem_text(animal.name), stem_text(animal.breed), stem_text(animal.description))
+            for animal in animals
+        ]
+    )
+
+
+def index_animals(animals, using=DEFAULT_DB_ALIAS):
+    # using - база, в которую записаны сами животные
+    animals = list(animals)
+    connection = connections[using]
+    if not fts_enabled(connection) or not animals:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({", ".join(["%s"] * len(animals))})',
+            [animal.pk for animal in animals]
+        )
+        index_rows(cursor, animals)
+
+
+def unindex_animal(animal_id, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    if not fts_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [animal_id])
+
+
+def rebuild_index(queryset, batch_size=1000):
+    connection = connections[queryset.db]
+    if not fts_enabled(connection):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        batch = []
+        for animal in queryset.only(*SEARCH_FIELDS).iterator(chunk_size=batch_size):
+            batch.append(animal)
+            if len(batch) >= batch_size:
+                index_rows(cursor, batch)
+                batch = []
+        index_rows(cursor, batch)
+
+
+def search_animals(queryset, text):
+    # Возвращает отфильтрованный queryset с аннотацией search_rank:
+    # чем она больше, тем релевантнее животное. Индекс берется в той же базе,
+    # что и queryset: с репликами это может быть не default
+    connection = connections[queryset.db]
+    if connection.vendor == 'sqlite':
+        terms = stem_words(text)
+        if not terms:
+            return queryset.none()
+        match = ' '.join(f'"{term}"*' for term in terms)
+        animal_id = f'{connection.ops.quote_name(queryset.model._meta.db_table)}.{connection.ops.quote_name("id")}'
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+        ).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {animal_id}',
+            [match]
+        ))
+
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+
+        terms = words(text)
+        if not terms:
+            return queryset.none()
+        query = SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        return queryset.annotate(search=search_vector()).filter(search=query).annotate(
+            search_rank=SearchRank(search_vector(), query)
+        )
+
+    condition = Q()
+    for field in SEARCH_FIELDS:
+        condition |= Q(**{f'{field}__icontains': text})
+    return queryset.filter(condition).annotate(search_rank=Value(0.0))
@@ -0,0 +1,260 @@
+import heapq
+import math
+import threading
+
+import numpy as np
+from django.core.cache import cache
+
+from .background import submit_background
+from .models import Animal
+from .scoring import SIZE_CODES, SPECIES_CODES, UNKNOWN_CODE
+from .statistics import catalog_changes_key, get_catalog_version
+
+SIMILAR_COUNT = 3
+VECTOR_FIELDS = ('id', 'species', 'size_category', 'age', 'child_friendly', 'other_pet_friendly', 'activity_level')
+# Вес признака в расстоянии: вид разделяет животных почти жестко,
+# ступень размера весит как три года возраста или три балла характера
+WEIGHTS = np.array([100.0, 3.0, 1.0, 1.0, 1.0, 1.0])
+LEAF_SIZE = 32
+# Сколько версий каталога догоняется по журналу изменений;
+# при большем отставании индекс перестраивается из базы
+MAX_REPLAY = 500
+# Изменения после построения дерева проверяются перебором; когда их
+# становится много, дерево перестраивается в фоне вместе с ними
+MAX_PENDING = 512
+
+
+def vectors_from_rows(rows):
+    # rows - кортежи в порядке VECTOR_FIELDS
+    rows = list(rows)
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, len(WEIGHTS)))
+    ids, species, sizes, *traits = zip(*rows)
+    points = np.column_stack([
+        [SPECIES_CODES.get(value, UNKNOWN_CODE) for value in species],
+        [SIZE_CODES.get(value, UNKNOWN_CODE) for value in sizes],
+        *traits,
+    ]).astype(float)
+    return np.array(ids, dtype=np.int64), points * WEIGHTS
+
+
+def load_vectors(queryset):
+    return vectors_from_rows(queryset.values_list(*VECTOR_FIELDS))
+
+
+def animal_vector(animal):
+    return vectors_from_rows([tuple(getattr(animal, field) for field in VECTOR_FIELDS)])[1][0]
+
+
+class KDTree:
+    # KD-дерево над различными векторами признаков: у многих животных они
+    # совпадают, поэтому в дереве лежит точка, а за ней - группа id.
+    # Признаки целочисленные, поэтому узел делит точки строго: слева
+    # координата меньше медианы, справа не меньше, и хранит зазор между
+    # сторонами - по нему дальняя сторона отсекается даже при равенстве
+    def __init__(self, ids, points):
+        self.ids, self.points = ids, np.ascontiguousarray(points)
+        # Строка вектора как набор байт: np.unique по ним в разы быстрее, чем с axis=0
+        rows = self.points.view(np.dtype((np.void, self.points.dtype.itemsize * len(WEIGHTS)))).ravel()
+        _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+        order = np.argsort(inverse, kind='stable')
+        self.group_ids = ids[order]
+        self.group_bounds = np.searchsorted(inverse[order], np.arange(len(first) + 1))
+
+        self.unique = self.points[first]
+        self.groups = np.arange(len(first))
+        # Узел: (ось, максимум слева, минимум справа, левый, правый) или
+        # (-1, начало, конец) для листа
+        self.nodes = []
+        self.root = self._build(0, len(first)) if len(first) else None
+
+    def _build(self, start, end):
+        node = len(self.nodes)
+        self.nodes.append((-1, start, end))
+        if end - start <= LEAF_SIZE:
+            return node
+
+        block = self.unique[start:end]
+        dim = int((block.max(axis=0) - block.min(axis=0)).argmax())
+        column = block[:, dim]
+        split = np.median(column)
+        left = column < split
+        if not left.any():
+            left = column <= split
+        left_max, right_min = float(column[left].max()), float(column[~left].min())
+        middle = start + int(left.sum())
+
+        order = np.concatenate([np.flatnonzero(left), np.flatnonzero(~left)])
+        self.unique[start:end] = block[order]
+        self.groups[start:end] = self.groups[start:end][order]
+        self.nodes[node] = (dim, left_max, right_min, self._build(start, middle), self._build(middle, end))
+        return node
+
+    def group(self, group):
+        return self.group_ids[self.group_bounds[group]:self.group_bounds[group + 1]]
+
+    def query(self, point, k):
+        # k ближайших групп как [(квадрат расстояния, группа)] по возрастанию
+        heap = []
+        if self.root is not None:
+            self._visit(self.root, point, k, heap)
+        return sorted((-distance, group) for distance, group in heap)
+
+    def _visit(self, node, point, k, heap):
+        dim, *rest = self.nodes[node]
+        if dim < 0:
+            start, end = rest
+            distances = ((self.unique[start:end] - point) ** 2).sum(axis=1)
+            bound = -heap[0][0] if len(heap) == k else math.inf
+            for offset in (distances < bound).nonzero()[0].tolist():
+                # В куче (-расстояние, группа): вершина - самая дальняя из найденных
+                entry = (-float(distances[offset]), int(self.groups[start + offset]))
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry[0] > heap[0][0]:
+                    heapq.heapreplace(heap, entry)
+            return
+
+        left_max, right_min, left, right = rest
+        value = point[dim]
+        left_gap, right_gap = max(value - left_max, 0.0), max(right_min - value, 0.0)
+        if left_gap <= right_gap:
+            near, far, gap = left, right, right_gap
+        else:
+            near, far, gap = right, left, left_gap
+        self._visit(near, point, k, heap)
+        if len(heap) < k or gap * gap < -heap[0][0]:
+            self._visit(far, point, k, heap)
+
+
+class SimilarityIndex:
+    # Дерево по снимку каталога плюс изменения после снимка: id -> точка
+    # или None, если животное удалено или больше не ищет дом
+    def __init__(self, tree, version, changed=None):
+        self.tree = tree
+        self.version = version
+        self.changed = changed or {}
+        pending = [(animal_id, point) for animal_id, point in self.changed.items() if point is not None]
+        self.pending_ids = np.array([animal_id for animal_id, _ in pending], dtype=np.int64)
+        self.pending_points = np.array([point for _, point in pending]).reshape(len(pending), len(WEIGHTS))
+
+    @classmethod
+    def build(cls, version):
+        return cls(KDTree(*load_vectors(Animal.objects.filter(is_available=True))), version)
+
+    def with_changes(self, animal_ids, version):
+        ids, points = load_vectors(Animal.objects.filter(pk__in=animal_ids, is_available=True))
+        changed = dict(self.changed)
+        changed.update(dict.fromkeys(animal_ids))
+        changed.update(zip(ids.tolist(), points))
+        return SimilarityIndex(self.tree, version, changed)
+
+    def compacted(self):
+        # Новое дерево из старого и накопленных изменений, без обращения к базе
+        keep = ~np.isin(self.tree.ids, list(self.changed))
+        ids = np.concatenate([self.tree.ids[keep], self.pending_ids])
+        points = np.concatenate([self.tree.points[keep], self.pending_points])
+        return SimilarityIndex(KDTree(ids, points), self.version)
+
+    def nearest(self, point, k, exclude):
+        skip = set(self.changed)
+        skip.add(exclude)
+
+        # Групп берется с запасом: часть id в них может быть исключена
+        groups = k + 1
+        while True:
+            nearest_groups = self.tree.query(point, groups)
+            found = []
+            for distance, group in nearest_groups:
+                found.extend(
+                    (distance, animal_id) for animal_id in self.tree.group(group).tolist()
+                    if animal_id not in skip
+                )
+                if len(found) >= k:
+                    break
+            if len(found) >= k or len(nearest_groups) < groups:
+                break
+            groups *= 2
+
+        if len(self.pending_ids):
+            distances = ((self.pending_points - point) ** 2).sum(axis=1)
+            found.extend(
+                (distance, animal_id)
+                for distance, animal_id in zip(distances.tolist(), self.pending_ids.tolist())
+                if animal_id != exclude
+            )
+        return [animal_id for _, animal_id in heapq.nsmallest(k, found)]
+
+
+_index = None
+_lock = threading.Lock()
+_compacting = False
+
+
+def _replay(index, version):
+    # Изменения между версиями индекса и каталога берутся из журнала;
+    # None - журнал неполон (массовый импорт, очистка кэша)
+    if not 0 < version - index.version <= MAX_REPLAY:
+        return None
+    keys = [catalog_changes_key(number) for number in range(index.version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    return sorted({animal_id for animal_ids in changes.values() for animal_id in animal_ids})
+
+
+def compact_similarity_index():
+    global _index, _compacting
+    try:
+        with _lock:
+            source = _index
+        index = source.compacted()
+        with _lock:
+            # Пока дерево строилось, могли прийти новые изменения - переносим их
+            later = {
+                animal_id: point for animal_id, point in _index.changed.items()
+                if source.changed.get(animal_id, source) is not point
+            }
+            _index = SimilarityIndex(index.tree, _index.version, later)
+    finally:
+        _compacting = False
+
+
+def similarity_index():
+    # Индекс процесса догоняет версию каталога: обычно точечно по журналу
+    # изменений, после массовых изменений - полной перестройкой из базы
+    global _index, _compacting
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    compact = False
+    with _lock:
+        if _index is not None and _index.version != version:
+            animal_ids = _replay(_index, version)
+            if animal_ids is None:
+                _index = None
+            else:
+                _index = _index.with_changes(animal_ids, version)
+                compact = len(_index.changed) > MAX_PENDING and not _compacting
+                _compacting = _compacting or compact
+        if _index is None:
+            _index = SimilarityIndex.build(version)
+        index = _index
+    if compact:
+        # Запросы тем временем обслуживает текущий индекс
+        submit_background(compact_similarity_index)
+    return index
+
+
+def similar_animal_ids(animal, k=SIMILAR_COUNT):
+    return similarity_index().nearest(animal_vector(animal), k, animal.pk)
+
+
+def similar_animals(animal, k=SIMILAR_COUNT):
+    # Соседи из индекса дочитываются по первичному ключу; животные, которых
+    # уже забрали, отсеиваются здесь, даже если индекс еще не догнал каталог
+    animal_ids = similar_animal_ids(animal, k)
+    animals = Animal.objects.filter(is_available=True).select_related('shelter').in_bulk(animal_ids)
+    return [animals[animal_id] for animal_id in animal_ids if animal_id in animals]
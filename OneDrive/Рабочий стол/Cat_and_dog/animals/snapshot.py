@@ -0,0 +1,157 @@
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from .background import submit_background
+from .models import Animal
+from .scoring import SIZE_CODES, SPECIES_CODES, UNKNOWN_CODE, traits_from_animals
+from .statistics import get_catalog_version
+
+# Строка снимка - доступное животное; колонки трейтов называются как в
+# traits_from_rows, поэтому снимок передается в движок совместимости как есть
+SNAPSHOT_DTYPE = np.dtype([
+    ('id', np.int64),
+    ('species', np.int8),
+    ('size_category', np.int8),
+    ('age', np.int16),
+    ('child_friendly', np.int16),
+    ('other_pet_friendly', np.int16),
+    ('activity_level', np.int16),
+])
+SNAPSHOT_FIELDS = SNAPSHOT_DTYPE.names
+
+_current = None
+_lock = threading.Lock()
+_refresh_queued = False
+
+
+def snapshot_from_rows(rows):
+    # rows - кортежи в порядке SNAPSHOT_FIELDS
+    return np.array(
+        [
+            (animal_id, SPECIES_CODES.get(species, UNKNOWN_CODE), SIZE_CODES.get(size, UNKNOWN_CODE), *traits)
+            for animal_id, species, size, *traits in rows
+        ],
+        dtype=SNAPSHOT_DTYPE,
+    )
+
+
+def snapshot_path(version):
+    return Path(settings.CATALOG_SNAPSHOT_DIR) / f'catalog-{version}.npy'
+
+
+def _open(version):
+    try:
+        return np.load(snapshot_path(version), mmap_mode='r')
+    except FileNotFoundError:
+        return None
+
+
+def _build(version):
+    # Снимок читается с основной базы: реплика может отставать, а файл
+    # версии потом используют все воркеры хоста
+    rows = Animal.objects.using(DEFAULT_DB_ALIAS).filter(is_available=True).order_by('pk')
+    array = snapshot_from_rows(rows.values_list(*SNAPSHOT_FIELDS).iterator(chunk_size=10000))
+
+    directory = Path(settings.CATALOG_SNAPSHOT_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-', suffix='.tmp')
+    with os.fdopen(descriptor, 'wb') as file:
+        np.save(file, array)
+    # Файл отображается до переименования: отображение держится за сам файл,
+    # и его не сломает ни замена, ни удаление другим процессом
+    snapshot = np.load(temp_path, mmap_mode='r')
+    path = snapshot_path(version)
+    try:
+        # Переименование атомарно: читатели видят либо старый файл, либо
+        # целиком записанный новый. Два процесса, собравшие одну версию,
+        # просто заменяют файл одинаковым содержимым
+        os.replace(temp_path, path)
+    except OSError:
+        # Windows не дает заменить файл, который отображен другим процессом
+        return snapshot
+
+    # Удаляются только файлы старых версий: процесс, который еще не увидел
+    # новую версию, не теряет свой файл, а перейдя на нее, откроет новый
+    for old in directory.glob('catalog-*.npy'):
+        try:
+            if int(old.stem.removeprefix('catalog-')) < version:
+                old.unlink()
+        except (ValueError, OSError):
+            pass
+    return snapshot
+
+
+def _snapshot(version, wait):
+    # (версия снимка, снимок); версия снимка может быть старше запрошенной
+    global _current
+    current = _current
+    if current is not None and current[0] == version:
+        return current
+
+    if current is not None and not wait:
+        # Запрос не ждет сборки: файл новой версии, если его уже собрал другой
+        # процесс, просто отображается, иначе до конца фоновой сборки отдается
+        # прежний снимок. Ждут только первый запрос процесса и фоновые
+        # пересчеты (wait=True), которым нужны свежие данные
+        snapshot = _open(version)
+        if snapshot is None:
+            schedule_snapshot_refresh()
+            return _current
+        with _lock:
+            if _current[0] != version:
+                _current = (version, snapshot)
+            return _current
+
+    with _lock:
+        if _current is None or _current[0] != version:
+            snapshot = _open(version)
+            if snapshot is None:
+                snapshot = _build(version)
+            _current = (version, snapshot)
+        return _current
+
+
+def catalog_snapshot(wait=False):
+    # Доступные животные как массив NumPy, отображенный из файла только для
+    # чтения: все процессы хоста делят одни страницы памяти. Файл привязан к
+    # версии каталога, поэтому после изменения животных процессы переходят
+    # на новый файл. Версия общая только при общем кэше - см. проверку animals.W001
+    return _snapshot(get_catalog_version(), wait)[1]
+
+
+def _refresh():
+    global _refresh_queued
+    _refresh_queued = False
+    catalog_snapshot(wait=True)
+
+
+def schedule_snapshot_refresh():
+    # Пересборка после изменения животных; пачка изменений подряд
+    # сворачивается в одну задачу
+    global _refresh_queued
+    if not _refresh_queued:
+        _refresh_queued = True
+        submit_background(_refresh)
+
+
+def snapshot_traits(animals):
+    # Строки снимка для уже загруженных животных. Если снимок прежней версии
+    # (новый еще собирается) или кого-то в нем нет, считаем по самим объектам:
+    # трейты в старом снимке могли измениться
+    version = get_catalog_version()
+    built, snapshot = _snapshot(version, wait=False)
+    if built != version:
+        return traits_from_animals(animals)
+    ids = np.array([animal.pk for animal in animals], dtype=np.int64)
+    positions = np.searchsorted(snapshot['id'], ids)
+    if len(snapshot) and (positions < len(snapshot)).all():
+        rows = snapshot[positions]
+        if (rows['id'] == ids).all():
+            return rows
+    return traits_from_animals(animals)
@@ -0,0 +1,101 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+
+from .metrics import registry
+from .models import Animal, Shelter
+
+CATALOG_VERSION_KEY = 'animals:catalog-version'
+
+
+def get_catalog_version():
+    # Версия каталога меняется при любом изменении животных, поэтому
+    # закэшированные данные старой версии просто перестают читаться
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def catalog_changes_key(version):
+    return f'animals:catalog-changes:{version}'
+
+
+def bump_catalog_version(animal_ids=None):
+    # Если известно, какие животные изменились, версия запоминает их id:
+    # по этому журналу индексы в памяти процессов обновляются точечно.
+    # Версия без журнала означает "изменилось что угодно"
+    try:
+        version = cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(CATALOG_VERSION_KEY, version, None)
+        return version
+    if animal_ids is not None:
+        cache.set(catalog_changes_key(version), list(animal_ids), settings.CATALOG_CACHE_TIMEOUT)
+    return version
+
+
+def catalog_cache_key(name):
+    return f'animals:{name}:{get_catalog_version()}'
+
+
+def catalog_stats():
+    key = catalog_cache_key('catalog-stats')
+    stats = cache.get(key)
+    registry.inc('animals_cache_requests_total', cache='catalog_stats', result='miss' if stats is None else 'hit')
+    if stats is None:
+        stats = Animal.objects.filter(is_available=True).aggregate(
+            total_count=Count('id'),
+            cats_count=Count('id', filter=Q(species='cat')),
+            dogs_count=Count('id', filter=Q(species='dog')),
+            avg_child_friendly=Avg('child_friendly'),
+            avg_activity=Avg('activity_level'),
+            avg_age=Avg('age'),
+        )
+        for field in ('avg_child_friendly', 'avg_activity', 'avg_age'):
+            stats[field] = round(stats[field] or 0, 1)
+        cache.set(key, stats, settings.CATALOG_CACHE_TIMEOUT)
+    return stats
+
+
+def catalog_count(queryset, params):
+    # COUNT(*) по фильтрам каталога считается один раз на версию каталога
+    digest = hashlib.sha256(repr(params).encode('utf-8')).hexdigest()
+    key = catalog_cache_key(f'catalog-count:{digest}')
+    total = cache.get(key)
+    registry.inc('animals_cache_requests_total', cache='catalog_count', result='miss' if total is None else 'hit')
+    if total is None:
+        total = queryset.count()
+        cache.set(key, total, settings.CATALOG_CACHE_TIMEOUT)
+    return total
+
+
+def shelter_stats():
+    available = Q(animals__is_available=True)
+    return Shelter.objects.annotate(
+        animal_count=Count('animals', filter=available),
+        avg_age=Avg('animals__age', filter=available),
+        avg_child_friendly=Avg('animals__child_friendly', filter=available),
+    ).order_by('pk')
+
+
+def application_summary(applications):
+    # Один GROUP BY по статусу: число заявок и средняя совместимость в каждой
+    # группе; общее среднее - взвешенное по числу заявок
+    rows = (
+        applications.order_by().values('status')
+        .annotate(count=Count('id'), avg_score=Avg('compatibility_score'))
+        .order_by('-count', 'status')
+    )
+    status_counts, total = {}, 0.0
+    for row in rows:
+        status_counts[row['status']] = row['count']
+        total += row['avg_score'] * row['count']
+    if not status_counts:
+        return {}, 0
+    return status_counts, round(total / sum(status_counts.values()), 1)
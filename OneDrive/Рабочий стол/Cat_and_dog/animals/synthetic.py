@@ -0,0 +1,149 @@
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+
+from .models import AdoptionApplication, Animal, Shelter, UserProfile
+from .score_store import rescore_animals
+from .search import rebuild_index
+from .statistics import bump_catalog_version
+
+SYNTHETIC_PASSWORD = 'synthetic-password'
+
+CAT_NAMES = ['Барсик', 'Мурка', 'Васька', 'Пушок', 'Снежок', 'Рыжик', 'Соня', 'Маруся', 'Тиша', 'Луна']
+DOG_NAMES = ['Шарик', 'Бим', 'Джек', 'Рекс', 'Найда', 'Белка', 'Дружок', 'Лайма', 'Граф', 'Тузик']
+CAT_BREEDS = ['', '', '', 'Сибирская', 'Британская', 'Мейн-кун', 'Шотландская вислоухая']
+DOG_BREEDS = ['', '', '', 'Лабрадор', 'Овчарка', 'Хаски', 'Такса', 'Корги', 'Спаниель']
+TRAITS = [
+    'ласковый', 'спокойный', 'игривый', 'пугливый', 'любит детей', 'ладит с кошками',
+    'приучен к лотку', 'гуляет на поводке', 'стерилизован', 'привит', 'любит долгие прогулки',
+]
+STREETS = ['Ленина', 'Малышева', 'Московская', 'Белинского', 'Куйбышева', 'Луначарского']
+# Кошки в приютах в основном небольшие, собаки - средние и крупные
+SIZE_WEIGHTS = {
+    'cat': {'small': 6, 'medium': 3, 'large': 1},
+    'dog': {'small': 2, 'medium': 4, 'large': 4},
+}
+STATUS_WEIGHTS = {'pending': 5, 'approved': 2, 'rejected': 2, 'completed': 1}
+
+
+def score(rng, mean, spread=2.0):
+    # Оценки 1-10 распределены нормально вокруг среднего и обрезаны по краям
+    return min(10, max(1, round(rng.gauss(mean, spread))))
+
+
+def weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def synthetic_animal(rng, shelter_id, index):
+    species = 'cat' if rng.random() < 0.55 else 'dog'
+    size = weighted(rng, SIZE_WEIGHTS[species])
+    names = CAT_NAMES if species == 'cat' else DOG_NAMES
+    return Animal(
+        shelter_id=shelter_id,
+        # Часть животных поступает без клички
+        name='' if rng.random() < 0.05 else f'{rng.choice(names)} {index}',
+        species=species,
+        breed=rng.choice(CAT_BREEDS if species == 'cat' else DOG_BREEDS),
+        # Молодых животных больше, чем старых
+        age=min(18, int(rng.expovariate(1 / 3.5))),
+        description=', '.join(rng.sample(TRAITS, rng.randint(1, 4))).capitalize(),
+        child_friendly=score(rng, 6.5),
+        other_pet_friendly=score(rng, 6),
+        activity_level=score(rng, 7 if species == 'dog' else 4.5),
+        size_category=size,
+        is_available=rng.random() < 0.85,
+        external_id=f'synthetic-{index}',
+    )
+
+
+def synthetic_profile(rng, user_id):
+    has_children = rng.random() < 0.4
+    return UserProfile(
+        user_id=user_id,
+        phone=f'+7 900 {rng.randint(1000000, 9999999)}',
+        home_type=weighted(rng, {'apartment': 7, 'house': 2, 'dacha': 1}),
+        has_children=has_children,
+        has_other_pets=rng.random() < 0.35,
+        experience_years=min(30, int(rng.expovariate(1 / 3))),
+        pref_child_friendly=score(rng, 8 if has_children else 4),
+        pref_pet_friendly=score(rng, 5),
+        pref_activity_level=score(rng, 5),
+        pref_size=weighted(rng, {'': 3, 'small': 3, 'medium': 3, 'large': 1}),
+        daily_walk_time=rng.choice([0, 15, 30, 30, 45, 60, 90, 120]),
+        has_garden=rng.random() < 0.25,
+    )
+
+
+def generate_dataset(shelters=10, animals=1000, users=100, applications=500, seed=42, batch_size=1000):
+    # Синтетический каталог для замеров: bulk_create без сигналов, затем
+    # поисковый индекс и таблица совместимости заполняются одной пачкой
+    rng = random.Random(seed)
+
+    shelter_objects = Shelter.objects.bulk_create([
+        Shelter(
+            name=f'Приют {index + 1}',
+            address=f'Екатеринбург, ул. {rng.choice(STREETS)}, {rng.randint(1, 150)}',
+            phone=f'+7 343 {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}',
+        )
+        for index in range(max(shelters, 1))
+    ])
+    shelter_ids = [shelter.pk for shelter in shelter_objects]
+    # Приюты разного размера: у крупных животных в разы больше
+    shelter_weights = [rng.paretovariate(1.5) for _ in shelter_ids]
+
+    animal_objects = Animal.objects.bulk_create(
+        [
+            synthetic_animal(rng, rng.choices(shelter_ids, weights=shelter_weights)[0], index)
+            for index in range(animals)
+        ],
+        batch_size=batch_size,
+    )
+
+    # Хэш пароля считается один раз - он медленный намеренно
+    password = make_password(SYNTHETIC_PASSWORD)
+    user_objects = User.objects.bulk_create(
+        [
+            User(username=f'synthetic{index}', email=f'synthetic{index}@example.com', password=password)
+            for index in range(users)
+        ],
+        batch_size=batch_size,
+    )
+    UserProfile.objects.bulk_create(
+        [synthetic_profile(rng, user.pk) for user in user_objects],
+        batch_size=batch_size,
+    )
+
+    if user_objects and animal_objects:
+        AdoptionApplication.objects.bulk_create(
+            [
+                AdoptionApplication(
+                    animal=rng.choice(animal_objects),
+                    user=user,
+                    full_name=user.username,
+                    email=user.email,
+                    phone=f'+7 900 {rng.randint(1000000, 9999999)}',
+                    compatibility_score=round(rng.uniform(30, 95), 1),
+                    status=weighted(rng, STATUS_WEIGHTS),
+                )
+                # Активных пользователей мало, поэтому заявки распределены неравномерно
+                for user in rng.choices(user_objects, weights=[1 / (rank + 1) for rank in range(len(user_objects))],
+                                        k=applications)
+            ],
+            batch_size=batch_size,
+        )
+
+    animal_ids = [animal.pk for animal in animal_objects]
+    rebuild_index(Animal.objects.all())
+    for start in range(0, len(animal_ids), 100):
+        rescore_animals(animal_ids[start:start + 100])
+    bump_catalog_version()
+
+    return {
+        'shelters': len(shelter_objects),
+        'animals': len(animal_objects),
+        'available_animals': sum(animal.is_available for animal in animal_objects),
+        'users': len(user_objects),
+        'applications': applications if user_objects and animal_objects else 0,
+    }
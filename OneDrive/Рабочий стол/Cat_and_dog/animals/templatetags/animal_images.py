@@ -0,0 +1,33 @@
+from django import template
+from django.utils.html import format_html
+
+from animals.images import VARIANT_WIDTHS, srcset, variant_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def animal_picture(animal, variant='card', sizes=None, loading='lazy', **attrs):
+    # <picture> с WebP и JPEG в srcset; пока фоновые варианты не готовы,
+    # отдается исходное фото
+    width = VARIANT_WIDTHS[variant]
+    sizes = sizes or f'{width}px'
+    variants = animal.photo_variants if animal.photo_variants.get('source') == animal.photo.name else {}
+    attributes = format_html(
+        ' '.join(f'{name}="{{}}"' for name in attrs), *attrs.values()
+    ) if attrs else ''
+
+    if not variants:
+        return format_html(
+            '<img src="{}" alt="{}" loading="{}" decoding="async" {}>',
+            animal.photo.url, animal.name, loading, attributes
+        )
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}" decoding="async" {}>'
+        '</picture>',
+        srcset(variants, 'webp'), sizes,
+        variant_url(variants, 'jpeg', width), srcset(variants, 'jpeg'), sizes,
+        variants['width'], variants['height'], animal.name, loading, attributes
+    )
@@ -1,3 +1,1595 @@
-from django.test import TestCase
+import itertools
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+from importlib import import_module
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.core import serializers
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.apps import apps
+from django.db import connection
+from django.template import engines
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import resolve, reverse
+from PIL import Image
+
+from .checks import check_shared_cache
+from .images import refresh_photo_variants
+from .management.commands import import_animals
+from .matching import top_adopters
+from .metrics import ARCHIVE_NAME, registry
+from .models import AdoptionApplication, Animal, CompatibilityScore, Shelter, UserProfile
+from .pagination import encode_cursor, keyset_queryset
+from .routers import PRIMARY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware, use_primary
+from .score_store import _save_scores, available_scores, score_for_animal
+from .search import rebuild_index, search_animals
+from . import similar, snapshot
+from .scoring import (
+    DEFAULT_WEIGHTS,
+    PROFILE_FIELDS,
+    compatibility_expression,
+    compatibility_scores,
+    load_traits,
+    profiles_from_rows,
+    score_animals,
+    traits_from_animals,
+)
+from .statistics import bump_catalog_version, catalog_stats, shelter_stats
+from .synthetic import synthetic_animal, synthetic_profile
+from .timing import DjangoTemplates
+from .urls import urlpatterns
+from .views import AnimalListView
+
+
+def reference_compatibility(profile, animal):
+    # Исходная построчная формула, с которой сверяется векторный движок
+    total_score = 0
+
+    if profile.has_children:
+        child_score = (animal.child_friendly / 10.0) * 25
+    else:
+        child_score = 12.5
+    total_score += child_score
+
+    if profile.has_other_pets:
+        pet_score = (animal.other_pet_friendly / 10.0) * 20
+    else:
+        pet_score = 10
+    total_score += pet_score
+
+    activity_diff = abs(animal.activity_level - profile.pref_activity_level)
+    activity_score = max(0, (10 - activity_diff) / 10.0) * 15
+    total_score += activity_score
+
+    if profile.pref_size and animal.size_category == profile.pref_size:
+        size_score = 15
+    elif profile.pref_size and animal.size_category != profile.pref_size:
+        size_score = 5
+    else:
+        size_score = 10
+    total_score += size_score
+
+    if profile.experience_years >= 3 and animal.activity_level <= 7:
+        experience_score = 10
+    elif profile.experience_years >= 1:
+        experience_score = 7
+    else:
+        experience_score = 5
+    total_score += experience_score
+
+    if animal.species == 'dog' and profile.daily_walk_time >= 60:
+        conditions_score = 15
+    elif animal.species == 'dog' and profile.daily_walk_time >= 30:
+        conditions_score = 10
+    elif animal.species == 'dog':
+        conditions_score = 5
+    else:
+        conditions_score = 12
+
+    if animal.size_category == 'large' and profile.has_garden:
+        conditions_score += 3
+
+    total_score += min(conditions_score, 15)
+
+    return round(total_score, 1)
+
+
+class ScoringEngineTests(SimpleTestCase):
+    def test_batch_scores_match_reference_formula(self):
+        animals = [
+            Animal(
+                id=index,
+                species=species,
+                size_category=size,
+                child_friendly=child,
+                other_pet_friendly=11 - child,
+                activity_level=activity,
+                age=3,
+            )
+            for index, (species, size, child, activity) in enumerate(itertools.product(
+                ['cat', 'dog'], ['small', 'medium', 'large'], [1, 4, 7, 10], range(1, 11)
+            ))
+        ]
+        traits = traits_from_animals(animals)
+        profiles = []
+
+        for has_children, has_other_pets, pref_size, experience, walk, garden, pref_activity in itertools.product(
+            [False, True], [False, True], ['', 'small', 'large'], [0, 1, 5], [10, 30, 90], [False, True], [1, 6, 10]
+        ):
+            profile = UserProfile(
+                id=len(profiles),
+                has_children=has_children,
+                has_other_pets=has_other_pets,
+                pref_size=pref_size,
+                experience_years=experience,
+                daily_walk_time=walk,
+                has_garden=garden,
+                pref_activity_level=pref_activity,
+            )
+            expected = [reference_compatibility(profile, animal) for animal in animals]
+            self.assertEqual(score_animals(profile, traits).tolist(), expected)
+            self.assertEqual(profile.calculate_compatibility_with_animal(animals[-1]), expected[-1])
+            profiles.append(profile)
+
+        # Обратное направление: одно животное против массива профилей
+        columns = profiles_from_rows(
+            tuple(getattr(profile, field) for field in PROFILE_FIELDS) for profile in profiles
+        )
+        for animal in animals[::7]:
+            self.assertEqual(
+                compatibility_scores(columns, traits_from_animals([animal])).tolist(),
+                [reference_compatibility(profile, animal) for profile in profiles]
+            )
+
+
+class CompatibilityExpressionTests(TestCase):
+    def test_database_annotation_matches_engine(self):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        Animal.objects.bulk_create([
+            Animal(
+                shelter=shelter,
+                species=species,
+                size_category=size,
+                child_friendly=child,
+                other_pet_friendly=child,
+                activity_level=activity,
+                age=2,
+            )
+            for species, size, child, activity in itertools.product(
+                ['cat', 'dog'], ['small', 'medium', 'large'], [1, 5, 10], [1, 4, 8, 10]
+            )
+        ])
+        traits = load_traits(Animal.objects.order_by('pk'))
+        user = User.objects.create_user('tester', 'tester@example.com', 'password123')
+
+        for has_children, pref_size, experience, walk, garden in itertools.product(
+            [False, True], ['', 'medium'], [0, 2, 4], [20, 45, 60], [False, True]
+        ):
+            profile = UserProfile(
+                user=user,
+                has_children=has_children,
+                has_other_pets=not has_children,
+                pref_size=pref_size,
+                experience_years=experience,
+                daily_walk_time=walk,
+                has_garden=garden,
+                pref_activity_level=3,
+            )
+            annotated = Animal.objects.order_by('pk').annotate(
+                compatibility=compatibility_expression(profile)
+            ).values_list('compatibility', flat=True)
+            self.assertEqual(list(annotated), score_animals(profile, traits).tolist())
+
+
+class ShelterStatisticsTests(TestCase):
+    def create_shelter(self, number):
+        shelter = Shelter.objects.create(name=f'Приют {number}', address='Екатеринбург', phone='123')
+        Animal.objects.bulk_create([
+            Animal(shelter=shelter, species='cat', age=age, child_friendly=age, is_available=age != 3)
+            for age in range(1, 5)
+        ])
+        return shelter
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('shelter_stats'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_shelters(self):
+        self.create_shelter(1)
+        baseline, _ = self.count_queries()
+
+        for number in range(2, 7):
+            self.create_shelter(number)
+        queries, response = self.count_queries()
+
+        self.assertEqual(queries, baseline)
+        self.assertEqual(len(response.context['stats_data']), 6)
+        self.assertEqual(response.context['stats_data'][0]['animal_count'], 3)
+        self.assertEqual(response.context['stats_data'][0]['avg_age'], round((1 + 2 + 4) / 3, 1))
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class CatalogStatisticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        Animal.objects.bulk_create([
+            Animal(shelter=self.shelter, species=species, age=age)
+            for species, age in [('cat', 2), ('cat', 4), ('dog', 6)]
+        ])
+
+    def test_stats_are_cached_until_catalog_changes(self):
+        stats = catalog_stats()
+        self.assertEqual((stats['total_count'], stats['cats_count'], stats['avg_age']), (3, 2, 4.0))
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog_stats(), stats)
+
+        # Сохранение и удаление животного меняют версию каталога после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            dog = Animal.objects.create(shelter=self.shelter, species='dog', age=8)
+        stats = catalog_stats()
+        self.assertEqual((stats['total_count'], stats['dogs_count'], stats['avg_age']), (4, 2, 5.0))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            dog.delete()
+        self.assertEqual(catalog_stats()['total_count'], 3)
+
+    def test_shelter_stats_is_one_query(self):
+        Shelter.objects.create(name='Пустой приют', address='Екатеринбург', phone='123')
+        with self.assertNumQueries(1):
+            rows = [(shelter.animal_count, shelter.avg_age) for shelter in shelter_stats()]
+
+        self.assertEqual(rows, [(3, 4.0), (0, None)])
+
+
+class StartupBenchmarkTests(SimpleTestCase):
+    def test_worker_starts_without_heavy_analytics_modules(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'startup.json'
+            call_command('benchmark_startup', runs=1, json_path=str(path), stdout=StringIO())
+            summary = json.loads(path.read_text(encoding='utf-8'))['summary']
+
+        self.assertEqual(summary['heavy_modules_at_startup'], [])
+        self.assertGreater(summary['startup_ms'], 0)
+
+    def test_pages_render_without_pillow(self):
+        # Свежий процесс со своей базой: в процессе тестов Pillow уже загружен
+        with tempfile.TemporaryDirectory() as directory:
+            completed = subprocess.run(
+                [sys.executable, '-c', (
+                    'import sys, django; django.setup(); '
+                    'from django.core.management import call_command; '
+                    "call_command('migrate', verbosity=0); "
+                    'from django.test import Client; '
+                    'from django.test.utils import setup_test_environment; '
+                    'from django.urls import reverse; '
+                    'from animals.models import Animal, Shelter; '
+                    'setup_test_environment(); '
+                    "shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123'); "
+                    "animal = Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2); "
+                    "pages = [reverse('animal_list'), reverse('animal_detail', args=[animal.pk])]; "
+                    'print([Client().get(page).status_code for page in pages], "PIL" in sys.modules)'
+                )],
+                cwd=settings.BASE_DIR, check=True, capture_output=True, text=True,
+                env=dict(
+                    os.environ,
+                    DJANGO_SETTINGS_MODULE='config.settings',
+                    DATABASE_URL=str(Path(directory) / 'pages.sqlite3'),
+                    CATALOG_SNAPSHOT_DIR=directory,
+                    METRICS_DIR=directory,
+                ),
+            )
+
+        self.assertEqual(completed.stdout.strip().splitlines()[-1], '[200, 200] False')
+
+
+class CatalogCompatibilityTests(TestCase):
+    def setUp(self):
+        self.shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+        self.profile = user.profile
+        self.profile.has_children = True
+        self.profile.pref_size = 'small'
+        self.profile.save()
+        self.client.force_login(user)
+
+    def create_animals(self, count):
+        Animal.objects.bulk_create([
+            Animal(shelter=self.shelter, name=f'Кот {index}', species='cat', age=2,
+                   child_friendly=index % 10 + 1, activity_level=(index * 3) % 10 + 1)
+            for index in range(count)
+        ])
+
+    def count_queries(self, params=None):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('animal_list'), params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_page_scores_are_batched(self):
+        self.create_animals(1)
+        baseline, _ = self.count_queries()
+
+        self.create_animals(5)
+        queries, response = self.count_queries()
+
+        self.assertEqual(queries, baseline)
+        animals = response.context['animals']
+        self.assertEqual(len(animals), 6)
+        self.assertEqual(
+            [animal.compatibility for animal in animals],
+            [reference_compatibility(self.profile, animal) for animal in animals]
+        )
+        self.assertContains(response, 'class="badge bg-success compatibility-badge"', count=6)
+
+    def test_sorted_page_uses_sql_annotation(self):
+        self.create_animals(6)
+        _, response = self.count_queries({'sort_by': 'compatibility'})
+
+        scores = [animal.compatibility for animal in response.context['animals']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+class QueryPlanTests(TestCase):
+    # Полный проход в плане SQLite - "SCAN <таблица>", по таблице или по всему
+    # индексу. Допустим он только как проход по индексу в порядке сортировки
+    # страницы: тогда LIMIT останавливает его на первых строках
+    FULL_SCAN = re.compile(r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?$')
+    TEMP_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', 'planner@example.com', 'password123')
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, queryset, allowed=(), walk=None, sort=False):
+        # walk - индекс, по которому разрешен проход в порядке сортировки;
+        # sort - разрешена ли сортировка результата во временном B-дереве
+        plan = self.query_plan(queryset)
+        scans = [
+            line for line, match in zip(plan, map(self.FULL_SCAN.match, plan))
+            if match and match.group(1) not in allowed and not (walk and match.group(2) == walk)
+        ]
+        self.assertEqual(scans, [], '\n'.join(plan))
+        if not sort:
+            self.assertNotIn(self.TEMP_SORT, plan)
+        return plan
+
+    def catalog_queryset(self, params, user=None):
+        request = RequestFactory().get(reverse('animal_list'), params)
+        request.user = user or AnonymousUser()
+        view = AnimalListView()
+        view.setup(request)
+        # Запрос страницы каталога: сортировку, курсор и LIMIT добавляет пагинация
+        queryset = keyset_queryset(view.get_queryset(), view.ordering_keys, request.GET.get('cursor'))
+        return queryset[:view.page_size + 1]
+
+    def test_catalog_queries_use_indexes(self):
+        for params, walk in [
+            ({}, 'animal_available_name_idx'),
+            ({'sort_by': 'age'}, 'animal_available_age_idx'),
+            ({'sort_by': 'child_friendly'}, 'animal_available_child_idx'),
+            ({'species': 'dog'}, None),
+            ({'size': 'small'}, None),
+            ({'species': 'cat', 'size': 'medium', 'sort_by': 'name'}, None),
+        ]:
+            with self.subTest(params=params):
+                self.assertNoFullScan(self.catalog_queryset(params), walk=walk)
+
+        with self.subTest(params='search'):
+            # Совпадения берутся из FTS, и сортируются по релевантности только они
+            plan = self.assertNoFullScan(self.catalog_queryset({'search': 'Барсик'}), sort=True)
+            self.assertTrue(any('VIRTUAL TABLE' in line for line in plan), plan)
+
+        with self.subTest(params='cursor'):
+            queryset = self.catalog_queryset({'cursor': encode_cursor(['Мурка', 10])})
+            self.assertNoFullScan(queryset)
+            self.assertIn('USING INDEX animal_available_name_idx (name>?)', self.query_plan(queryset)[0])
+
+        with self.subTest(params='compatibility'):
+            # Совместимость вычисляется, поэтому сортировка читает всех доступных
+            # животных - но через частичный индекс, без снятых с каталога
+            plan = self.query_plan(self.catalog_queryset({'sort_by': 'compatibility'}, self.user))
+            [scan] = [line for line in plan if self.FULL_SCAN.match(line)]
+            self.assertRegex(scan, r'^SCAN animals_animal USING (COVERING )?INDEX animal_available_\w+$')
+
+    def test_detail_and_application_queries_use_indexes(self):
+        self.assertNoFullScan(Animal.objects.filter(pk=1))
+        self.assertNoFullScan(
+            AdoptionApplication.objects.filter(user=self.user)
+            .select_related('animal', 'animal__shelter').order_by('-created_at')
+        )
+
+    def test_recommendation_queries_use_indexes(self):
+        self.assertNoFullScan(available_scores(self.user.profile).select_related('animal__shelter'))
+
+    def test_shelter_statistics_scan_only_shelters(self):
+        # Статистика по определению читает все приюты, но животных - по индексу
+        self.assertNoFullScan(shelter_stats(), allowed={Shelter._meta.db_table}, sort=True)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        self.barsik = Animal.objects.create(
+            shelter=shelter, name='Барсик', species='cat', breed='Сиамская', age=2
+        )
+        self.murka = Animal.objects.create(
+            shelter=shelter, name='Мурка', species='cat', age=3,
+            description='Ласковая кошка, дружит с Рексом и любит детей'
+        )
+        self.rex = Animal.objects.create(
+            shelter=shelter, name='Рекс', species='dog', breed='Овчарка', age=4,
+            description='Охраняет дом'
+        )
+
+    def search(self, text, **params):
+        response = self.client.get(reverse('animal_list'), {'search': text, **params})
+        self.assertEqual(response.status_code, 200)
+        return [animal.name for animal in response.context['animals']]
+
+    def test_russian_word_forms_match_description(self):
+        self.assertEqual(self.search('кошками'), ['Мурка'])
+        self.assertEqual(self.search('ласковый'), ['Мурка'])
+        self.assertEqual(self.search('овчарки'), ['Рекс'])
+
+    def test_results_are_ranked_by_relevance(self):
+        self.assertEqual(self.search('Рекс'), ['Рекс', 'Мурка'])
+        self.assertEqual(self.search('Рекс', sort_by='name'), ['Мурка', 'Рекс'])
+
+    def test_index_follows_save_and_delete(self):
+        self.barsik.description = 'Спокойный и пушистый'
+        self.barsik.save()
+        self.assertEqual(self.search('пушистые'), ['Барсик'])
+
+        self.barsik.delete()
+        self.assertEqual(self.search('пушистые'), [])
+
+    def test_raw_saves_wait_for_rebuild(self):
+        # Как при loaddata: сохранение в обход логики модели индекс не трогает
+        self.rex.description = 'Пушистый охранник'
+        for record in serializers.deserialize('json', serializers.serialize('json', [self.rex])):
+            record.save()
+        self.assertEqual(self.search('пушистые'), [])
+
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('пушистые'), ['Рекс'])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        Animal.objects.bulk_create([
+            Animal(shelter=shelter, name=f'Пес {index % 7}', species='dog', age=index % 4 + 1,
+                   child_friendly=index % 3 + 1, description='Веселый пес' if index % 2 else '')
+            for index in range(20)
+        ])
+        Animal.objects.bulk_create([Animal(shelter=shelter, name='Скрытый', species='dog', age=1, is_available=False)])
+        # bulk_create обходит сигналы, поэтому индекс поиска и кэш обновляем сами
+        rebuild_index(Animal.objects.all())
+        cache.clear()
+        user = User.objects.create_user('scroller', 'scroller@example.com', 'password123')
+        self.client.force_login(user)
+
+    def walk(self, params):
+        response = self.client.get(reverse('animal_list'), params)
+        pages = [response]
+        while 'next_fragment_url' in response.context:
+            response = self.client.get(response.context['next_fragment_url'])
+            self.assertTemplateUsed(response, 'animals/_animal_cards.html')
+            pages.append(response)
+        return [animal.pk for page in pages for animal in page.context['animals']], pages
+
+    def test_pages_cover_catalog_in_sort_order(self):
+        available = Animal.objects.filter(is_available=True)
+        for params, ordering in [
+            ({}, ['name', 'id']),
+            ({'sort_by': 'age'}, ['age', 'id']),
+            ({'sort_by': 'child_friendly', 'species': 'dog'}, ['child_friendly', 'id']),
+        ]:
+            with self.subTest(params=params):
+                ids, pages = self.walk(params)
+                self.assertEqual(ids, list(available.order_by(*ordering).values_list('pk', flat=True)))
+                self.assertEqual(len(pages), 4)
+                self.assertEqual(pages[0].context['total_count'], 20)
+
+        with self.subTest(params='compatibility'):
+            ids, _ = self.walk({'sort_by': 'compatibility'})
+            self.assertEqual(sorted(ids), sorted(available.values_list('pk', flat=True)))
+
+        with self.subTest(params='search'):
+            ids, _ = self.walk({'search': 'веселые'})
+            self.assertEqual(len(ids), 10)
+            self.assertEqual(len(set(ids)), 10)
+
+    def test_fragments_skip_count(self):
+        _, pages = self.walk({})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(pages[0].context['next_fragment_url'])
+        self.assertFalse(any('COUNT' in query['sql'] for query in queries.captured_queries))
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'password123')
+        self.client.force_login(admin)
+
+    def add_rows(self, count):
+        animals = Animal.objects.bulk_create([
+            Animal(shelter=self.shelter, name=f'Животное {index}', species='cat', age=1)
+            for index in range(count)
+        ])
+        offset = User.objects.count()
+        users = User.objects.bulk_create([User(username=f'user-{offset + index}') for index in range(count)])
+        AdoptionApplication.objects.bulk_create([
+            AdoptionApplication(animal=animal, user=user, full_name='Заявитель', email='a@example.com',
+                                phone='1', compatibility_score=50 + index % 10)
+            for index, (animal, user) in enumerate(zip(animals, users))
+        ])
+        UserProfile.objects.bulk_create([
+            UserProfile(user=user) for user in User.objects.filter(profile__isnull=True, is_superuser=False)
+        ])
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_use_constant_queries(self):
+        urls = [
+            reverse('admin:animals_animal_changelist'),
+            reverse('admin:animals_shelter_changelist'),
+            reverse('admin:animals_adoptionapplication_changelist'),
+            reverse('admin:animals_userprofile_changelist'),
+            reverse('admin:animals_adoptionapplication_add'),
+        ]
+        self.add_rows(3)
+        # Первый проход прогревает кэш ContentType
+        for url in urls:
+            self.count_queries(url)
+        baseline = [self.count_queries(url) for url in urls]
+
+        self.add_rows(30)
+        self.assertEqual([self.count_queries(url) for url in urls], baseline)
+
+    def test_application_form_does_not_list_users(self):
+        self.add_rows(3)
+        response = self.client.get(reverse('admin:animals_adoptionapplication_add'))
+        self.assertNotContains(response, '<select name="user"')
+        self.assertContains(response, 'name="user"')
+
+    def test_annotated_columns(self):
+        self.add_rows(2)
+        response = self.client.get(reverse('admin:animals_shelter_changelist'))
+        self.assertEqual(response.context['cl'].result_list[0].animal_count, 2)
+
+        response = self.client.get(reverse('admin:animals_animal_changelist'), {'o': '8'})
+        self.assertEqual(
+            sorted(animal.avg_compatibility for animal in response.context['cl'].result_list),
+            [50, 51]
+        )
+
+
+class ImportAnimalsTests(TestCase):
+    def setUp(self):
+        self.shelter = Shelter.objects.create(name='Партнер', address='Екатеринбург', phone='123')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.directory.name) / name
+        path.write_text(content, encoding='utf-8')
+        return str(path)
+
+    def run_import(self, path, **options):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_animals', path, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv_rows_are_validated_and_upserted(self):
+        path = self.write('animals.csv', (
+            'external_id,name,species,age,description,child_friendly,is_available\n'
+            '1,Барсик,cat,2,Ласковый кот,8,да\n'
+            '2,Шарик,dog,5,,,нет\n'
+            '3,Кеша,parrot,1,,,\n'
+            ',Безымянный,cat,1,,,\n'
+        ))
+        output, errors = self.run_import(path, shelter=str(self.shelter.pk), batch_size=1)
+
+        self.assertIn('создано 2', output)
+        self.assertIn('ошибок 2', output)
+        self.assertIn('Строка 4', errors)
+        barsik = Animal.objects.get(shelter=self.shelter, external_id='1')
+        self.assertEqual((barsik.child_friendly, barsik.is_available), (8, True))
+        self.assertFalse(Animal.objects.get(external_id='2').is_available)
+        self.assertEqual(list(search_animals(Animal.objects.all(), 'ласковые')), [barsik])
+
+        # Колонок, которых нет в файле, обновление не касается
+        self.run_import(self.write('update.csv', 'external_id,name,species,age\n1,Барсик,cat,3\n'),
+                        shelter='Партнер')
+        self.assertEqual(Animal.objects.count(), 2)
+        barsik.refresh_from_db()
+        self.assertEqual(
+            (barsik.age, barsik.child_friendly, barsik.is_available, barsik.description),
+            (3, 8, True, 'Ласковый кот'),
+        )
+
+    def test_dry_run_tells_created_from_updated(self):
+        Animal.objects.create(shelter=self.shelter, external_id='1', name='Барсик', species='cat', age=2)
+        path = self.write('animals.csv', 'external_id,name,species,age\n1,Барсик,cat,3\n2,Шарик,dog,5\n')
+        output, _ = self.run_import(path, shelter=str(self.shelter.pk), dry_run=True)
+
+        self.assertIn('создано 1, обновлено 1', output)
+        self.assertEqual(Animal.objects.get().age, 2)
+
+    @override_settings(BACKGROUND_TASKS_SYNC=True)
+    def test_json_array_and_lines_create_shelters_and_scores(self):
+        user = User.objects.create_user('importer', 'importer@example.com', 'password123')
+        records = [
+            {'external_id': index, 'shelter': 'Новый приют', 'species': 'dog', 'age': index}
+            for index in range(1, 6)
+        ]
+        # Совместимость пересчитывается в фоне после коммита каждой пачки
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.run_import(self.write('animals.json', json.dumps(records)), batch_size=2)
+        self.assertFalse(user.profile.compatibility_scores.exists())
+        for callback in callbacks:
+            callback()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import(self.write('more.jsonl', '\n'.join(
+                json.dumps({**record, 'external_id': record['external_id'] + 10}) for record in records
+            )))
+
+        shelter = Shelter.objects.get(name='Новый приют')
+        self.assertEqual(shelter.animals.count(), 10)
+        self.assertEqual(
+            sorted(user.profile.compatibility_scores.values_list('animal_id', flat=True)),
+            sorted(shelter.animals.values_list('pk', flat=True))
+        )
+
+    def test_malformed_json_lines_are_row_errors(self):
+        path = self.write('animals.jsonl', '\n'.join([
+            json.dumps({'external_id': 1, 'species': 'cat', 'age': 2}),
+            '{"external_id": 2, "species": ',
+            json.dumps({'external_id': 3, 'species': 'dog', 'age': 4}),
+        ]))
+        output, errors = self.run_import(path, shelter=str(self.shelter.pk))
+
+        self.assertIn('создано 2', output)
+        self.assertIn('ошибок 1', output)
+        self.assertIn('Строка 2: Некорректный JSON', errors)
+        self.assertEqual(sorted(Animal.objects.values_list('external_id', flat=True)), ['1', '3'])
+
+    def test_malformed_json_array_stops_with_row_error(self):
+        valid = [{'external_id': index, 'species': 'cat', 'age': 1} for index in range(1, 4)]
+        content = json.dumps(valid)[:-1] + ', {"external_id": 4, "species": } , {"external_id": 5}]'
+        with mock.patch('animals.management.commands.import_animals.JSON_CHUNK_SIZE', 7):
+            output, errors = self.run_import(self.write('animals.json', content), shelter=str(self.shelter.pk))
+
+        self.assertIn('создано 3', output)
+        self.assertIn('Строка 4: Некорректный JSON', errors)
+        self.assertEqual(Animal.objects.count(), 3)
+
+    def test_oversized_json_record_stops_reading(self):
+        content = '[{"external_id": 1, "age": 1.5}, {"external_id": 2, "description": "' + 'x' * 50000
+        file = StringIO(content)
+        with mock.patch.multiple(import_animals, JSON_CHUNK_SIZE=64, MAX_JSON_RECORD_SIZE=1000):
+            records = list(import_animals.iter_json(file))
+
+        self.assertEqual(records[0], (1, {'external_id': 1, 'age': 1.5}))
+        number, error = records[1]
+        self.assertEqual(number, 2)
+        self.assertIn('Запись длиннее 1000 символов', error.messages[0])
+        # Остаток файла после слишком длинной записи не читается
+        self.assertLess(file.tell(), 2000)
+
+
+class PhotoVariantsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        media = override_settings(MEDIA_ROOT=directory.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+
+    def upload(self, size):
+        buffer = BytesIO()
+        Image.new('RGBA', size, (200, 120, 40, 255)).save(buffer, 'PNG')
+        return SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_built_and_rendered_with_srcset(self):
+        animal = Animal.objects.create(
+            name='Барсик', species='cat', age=2, shelter=self.shelter, photo=self.upload((1600, 1200))
+        )
+        # Пока фоновые варианты не готовы, отдается исходное фото
+        response = self.client.get(reverse('animal_detail', args=[animal.pk]))
+        self.assertContains(response, animal.photo.url)
+        self.assertNotContains(response, 'srcset')
+
+        refresh_photo_variants(animal.pk)
+        animal.refresh_from_db()
+        variants = animal.photo_variants
+        self.assertEqual(variants['source'], animal.photo.name)
+        self.assertEqual(sorted(variants['webp'], key=int), ['320', '640', '1280'])
+        with Image.open(animal.photo.storage.path(variants['jpeg']['640'])) as image:
+            self.assertEqual((image.format, image.size), ('JPEG', (640, 480)))
+
+        response = self.client.get(reverse('animal_detail', args=[animal.pk]))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '1280w')
+
+    @override_settings(BACKGROUND_TASKS_SYNC=True)
+    def test_new_photo_replaces_variants_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            animal = Animal.objects.create(
+                name='Шарик', species='dog', age=3, shelter=self.shelter, photo=self.upload((1600, 1200))
+            )
+        animal.refresh_from_db()
+        old_files = list(animal.photo_variants['webp'].values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            animal.photo = self.upload((400, 300))
+            animal.save()
+        animal.refresh_from_db()
+        # Маленькое фото не растягивается: вместо 640 и 1280 один вариант в ширину оригинала
+        self.assertEqual(list(animal.photo_variants['jpeg']), ['320', '400'])
+        self.assertFalse(any(animal.photo.storage.exists(name) for name in old_files))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            animal.delete()
+        self.assertFalse(any(
+            animal.photo.storage.exists(name) for name in animal.photo_variants['webp'].values()
+        ))
+
+
+class ChartDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animal = Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2)
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'password123')
+
+    def test_public_chart_is_cached(self):
+        response = self.client.get(reverse('animal_chart_data', args=[self.animal.pk]))
+
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn(f'max-age={settings.CHART_DATA_MAX_AGE}', response['Cache-Control'])
+        repeat = self.client.get(
+            reverse('animal_chart_data', args=[self.animal.pk]), headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_chart_fingerprint_follows_data(self):
+        url = reverse('animal_chart_data', args=[self.animal.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+
+        Animal.objects.filter(pk=self.animal.pk).update(child_friendly=9)
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['series'][0]['values'][0], 9)
+
+    def test_private_chart_is_revalidated(self):
+        self.client.force_login(self.user)
+        url = reverse('applications_chart_data')
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('max-age', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        # После новой заявки сверка ETag сразу отдает новые данные
+        self.client.post(reverse('submit_adoption', args=[self.animal.pk]), {
+            'full_name': 'Иван', 'email': 'reader@example.com', 'phone': '123',
+        })
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['values'], [1])
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animals = Animal.objects.bulk_create([
+            Animal(shelter=shelter, name=f'Кот {index}', species='cat', age=2, child_friendly=index + 1)
+            for index in range(8)
+        ])
+        cls.user = User.objects.create_user('async', 'async@example.com', 'password123')
+
+    async def test_catalog_and_detail_on_asgi(self):
+        response = await self.async_client.get(reverse('animal_list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['animals']), 6)
+        self.assertIn('next_fragment_url', response.context)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('animal_list'), {'sort_by': 'age'})
+        animals, profile = response.context['animals'], response.context['profile']
+        self.assertEqual(
+            [animal.compatibility for animal in animals],
+            [reference_compatibility(profile, animal) for animal in animals]
+        )
+
+        animal = self.animals[0]
+        response = await self.async_client.get(reverse('animal_detail', args=[animal.pk]))
+        self.assertEqual(response.context['animal'], animal)
+        self.assertEqual(
+            response.context['user_compatibility'],
+            reference_compatibility(profile, animal)
+        )
+
+    async def test_recommendations_on_asgi(self):
+        response = await self.async_client.get(reverse('personal_recommendations'))
+        self.assertEqual(response.status_code, 302)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse('personal_recommendations'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['stats']['total'], 8)
+        scores = [item['compatibility'] for item in response.context['recommendations']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+
+class ConcurrencyBenchmarkTests(TransactionTestCase):
+    def test_benchmark_reports_both_deployments(self):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'concurrency.json'
+            call_command(
+                'benchmark_concurrency', clients=2, requests=4, client_delay_ms=0,
+                json_path=str(path), stdout=StringIO()
+            )
+            results = json.loads(path.read_text(encoding='utf-8'))
+
+        for name in ('asgi', 'wsgi'):
+            self.assertEqual((results[name]['requests'], results[name]['errors']), (4, 0))
+
+
+class RouteBenchmarkTests(TestCase):
+    def test_all_routes_are_measured_and_data_rolled_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / 'routes.json'
+            output = StringIO()
+            call_command(
+                'benchmark_routes', shelters=2, animals=30, users=3, applications=5, iterations=2,
+                json_path=str(path), stdout=output
+            )
+            results = json.loads(path.read_text(encoding='utf-8'))
+
+        self.assertNotIn('Маршруты без сценария', output.getvalue())
+        self.assertEqual(results['dataset']['animals'], 30)
+        routes = results['routes']
+        self.assertEqual(
+            {route['route'] for route in routes.values()},
+            {pattern.name for pattern in urlpatterns}
+        )
+        for result in routes.values():
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+            self.assertGreater(result['peak_kb'], 0)
+        self.assertEqual(routes['catalog']['queries'], 1)
+        self.assertFalse(Animal.objects.exists())
+        self.assertFalse(User.objects.filter(username__startswith='synthetic').exists())
+
+
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animal = Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2)
+        cls.user = User.objects.create_user('timed', 'timed@example.com', 'password123')
+        AdoptionApplication.objects.create(
+            animal=cls.animal, user=cls.user, full_name='Тест', email=cls.user.email, phone='123',
+            compatibility_score=70,
+        )
+
+    def metrics(self, response):
+        return {
+            metric.split(';')[0]: metric
+            for metric in response['Server-Timing'].split(', ')
+        }
+
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse('animal_list'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_timed_engine_keeps_standard_alias(self):
+        self.assertIsInstance(engines['django'], DjangoTemplates)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_header_and_log_line_for_sampled_request(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('animals.timing', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('animal_list'))
+
+        metrics = self.metrics(response)
+        self.assertEqual({'total', 'sql', 'template', 'scoring'}, set(metrics))
+        self.assertIn(f'desc="{len(queries)} queries"', metrics['sql'])
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status'], record['sql_queries']), ('/', 200, len(queries)))
+        self.assertGreater(record['sections']['template'], 0)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    def test_named_sections(self):
+        self.client.force_login(self.user)
+        with self.assertLogs('animals.timing', 'INFO'):
+            chart = self.metrics(self.client.get(reverse('animal_chart_data', args=[self.animal.pk])))
+        self.assertIn('charts', chart)
+        self.assertIn('scoring', chart)
+
+    @override_settings(SERVER_TIMING_SAMPLE_RATE=1)
+    async def test_async_views_are_measured(self):
+        await self.async_client.aforce_login(self.user)
+        with self.assertLogs('animals.timing', 'INFO') as logs:
+            response = await self.async_client.get(reverse('personal_recommendations'))
+
+        self.assertIn('scoring', self.metrics(response))
+        self.assertGreater(json.loads(logs.records[0].getMessage())['sql_queries'], 0)
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animal = Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        metrics_settings = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='secret')
+        metrics_settings.enable()
+        self.addCleanup(metrics_settings.disable)
+        registry.reset()
+        self.addCleanup(registry.reset)
+        cache.clear()
+
+    def scrape(self):
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        return response.content.decode().splitlines()
+
+    def test_requests_submissions_and_cache_are_exported(self):
+        self.client.get(reverse('animal_list'))
+        self.client.get(reverse('animal_list'))
+        adopt = reverse('submit_adoption', args=[self.animal.pk])
+        self.client.post(adopt, {'full_name': 'Иван', 'email': 'ivan@example.com', 'phone': '123'})
+        self.client.post(adopt, {'full_name': 'Иван'})
+
+        lines = self.scrape()
+        self.assertIn('animals_http_requests_total{method="GET",status="200",view="animal_list"} 2', lines)
+        self.assertIn('animals_http_requests_total{method="POST",status="302",view="submit_adoption"} 1', lines)
+        self.assertIn('animals_http_request_duration_seconds_count{view="animal_list"} 2', lines)
+        self.assertIn('animals_http_request_duration_seconds_bucket{view="animal_list",le="+Inf"} 2', lines)
+        self.assertIn('animals_adoption_submissions_total{result="created"} 1', lines)
+        self.assertIn('animals_adoption_submissions_total{result="invalid"} 1', lines)
+        self.assertIn('animals_adoption_applications{status="pending"} 1', lines)
+        self.assertIn('animals_adoption_applications{status="approved"} 0', lines)
+        self.assertIn('animals_cache_requests_total{cache="catalog_stats",result="miss"} 1', lines)
+        self.assertIn('animals_cache_requests_total{cache="catalog_stats",result="hit"} 1', lines)
+
+    def test_counters_are_summed_across_processes(self):
+        registry.inc('animals_adoption_submissions_total', result='created')
+        # Другой процесс с тем же METRICS_DIR сбрасывает свои счетчики при выходе
+        subprocess.run(
+            [sys.executable, '-c', (
+                'import django; django.setup(); '
+                'from animals.metrics import registry; '
+                "registry.inc('animals_adoption_submissions_total', 3, result='created')"
+            )],
+            cwd=settings.BASE_DIR, check=True,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='config.settings', METRICS_DIR=self.directory),
+        )
+
+        self.assertIn('animals_adoption_submissions_total{result="created"} 4', self.scrape())
+        # Файл завершившегося процесса свернут в архив, и повторный сбор
+        # не считает его дважды
+        self.assertEqual(
+            sorted(path.name for path in Path(self.directory).glob('metrics-*.json')),
+            sorted([ARCHIVE_NAME, f'metrics-{registry.token}.json']),
+        )
+        self.assertIn('animals_adoption_submissions_total{result="created"} 4', self.scrape())
+
+    def test_token_is_required(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer wrong'}).status_code, 401
+        )
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=10)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, request, view=None, write=False):
+        # Ответ содержит базу, которую роутер выбрал бы для чтения внутри представления
+        def get_response(request):
+            if view is not None:
+                middleware.process_view(request, view, (), {})
+            if write:
+                self.router.db_for_write(Animal)
+            return HttpResponse(self.router.db_for_read(Animal))
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(request)
+
+    def test_read_only_request_reads_from_replica(self):
+        response = self.route(self.factory.get('/'), view=lambda request: None)
+
+        self.assertEqual(response.content, b'replica1')
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+
+    def test_writes_and_write_views_use_primary(self):
+        self.assertEqual(self.route(self.factory.post('/')).content, b'default')
+        self.assertEqual(self.route(self.factory.get('/'), view=use_primary(lambda request: None)).content, b'default')
+
+        request = self.factory.get('/admin/')
+        request.resolver_match = resolve('/admin/')
+        self.assertEqual(self.route(request, view=request.resolver_match.func).content, b'default')
+
+    def test_client_reads_own_writes(self):
+        response = self.route(self.factory.get('/'), write=True)
+
+        self.assertEqual(response.content, b'default')
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], 10)
+
+        request = self.factory.get('/')
+        request.COOKIES[PRIMARY_COOKIE] = response.cookies[PRIMARY_COOKIE].value
+        self.assertEqual(self.route(request).content, b'default')
+
+    def test_outside_requests_use_primary(self):
+        self.assertEqual(self.router.db_for_read(Animal), 'default')
+        self.assertTrue(self.router.allow_migrate('default', 'animals'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'animals'))
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class IncrementalScoresTests(TestCase):
+    def setUp(self):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cat = Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2)
+            self.dog = Animal.objects.create(shelter=shelter, name='Шарик', species='dog', age=5)
+            self.reader = User.objects.create_user('reader', 'reader@example.com', 'password123')
+            self.other = User.objects.create_user('other', 'other@example.com', 'password123')
+        self.assertEqual(CompatibilityScore.objects.count(), 4)
+        # Метка вместо оценки: пересчитанные строки ее теряют
+        CompatibilityScore.objects.update(score=-1)
+
+    def stale(self):
+        return set(CompatibilityScore.objects.filter(score=-1).values_list('profile__user__username', 'animal__name'))
+
+    def test_animal_save_rescores_only_its_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cat.child_friendly = 9
+            self.cat.save()
+
+        self.assertEqual(self.stale(), {('reader', 'Шарик'), ('other', 'Шарик')})
+
+    def test_profile_save_without_scoring_changes_is_skipped(self):
+        profile = UserProfile.objects.get(user=self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+            self.reader.save()
+
+        self.assertEqual(len(self.stale()), 4)
+
+    def test_profile_save_with_scoring_changes_rescores_it(self):
+        profile = UserProfile.objects.get(user=self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.has_children = not profile.has_children
+            profile.save()
+
+        self.assertEqual(self.stale(), {('other', 'Барсик'), ('other', 'Шарик')})
+
+    def test_unavailable_or_deleted_animal_loses_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cat.is_available = False
+            self.cat.save()
+        self.assertFalse(CompatibilityScore.objects.filter(animal=self.cat).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dog.delete()
+        self.assertFalse(CompatibilityScore.objects.exists())
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_STICKY_SECONDS=10)
+class ScoreStoreRoutingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animal = Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2)
+        cls.profile = User.objects.create_user('reader', 'reader@example.com', 'password123').profile
+
+    def route(self, view):
+        return ReplicaRoutingMiddleware(lambda request: HttpResponse(view()))(RequestFactory().get('/'))
+
+    def test_saved_score_pins_client_to_primary(self):
+        response = self.route(lambda: _save_scores([(self.profile.pk, self.animal.pk, 50.0)]))
+
+        self.assertEqual(response.cookies[PRIMARY_COOKIE]['max-age'], 10)
+        self.assertTrue(available_scores(self.profile).filter(animal=self.animal).exists())
+
+    def test_missing_score_is_computed_without_writing(self):
+        response = self.route(lambda: score_for_animal(self.profile, self.animal))
+
+        self.assertEqual(
+            float(response.content), self.profile.calculate_compatibility_with_animal(self.animal)
+        )
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+        self.assertFalse(available_scores(self.profile).exists())
+
+
+class ApplicationOwnershipTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animal = Animal.objects.create(shelter=shelter, name='Барсик', species='cat', age=2)
+        cls.user = User.objects.create_user('owner', 'owner@example.com', 'password123')
+        cls.other = User.objects.create_user('other', 'other@example.com', 'password123')
+
+    def application(self, user, email, status='pending', score=50.0):
+        return AdoptionApplication.objects.create(
+            animal=self.animal, user=user, full_name='Заявитель', email=email, phone='123',
+            status=status, compatibility_score=score,
+        )
+
+    def test_submission_is_linked_to_user(self):
+        self.client.force_login(self.user)
+        self.client.post(
+            reverse('submit_adoption', args=[self.animal.pk]),
+            {'full_name': 'Иван', 'email': 'another@example.com', 'phone': '123'},
+        )
+
+        self.assertEqual(AdoptionApplication.objects.get().user, self.user)
+
+    def test_my_applications_aggregates_own_applications(self):
+        self.application(self.user, 'owner@example.com', 'pending', 40)
+        self.application(self.user, 'owner@example.com', 'pending', 60)
+        self.application(self.user, 'owner@example.com', 'approved', 90)
+        self.application(self.other, 'owner@example.com', 'rejected', 10)
+        self.client.force_login(self.user)
+
+        # Сессия, пользователь, сводка по статусам и сами заявки
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('my_applications'))
+
+        self.assertEqual(response.context['status_counts'], {'pending': 2, 'approved': 1})
+        self.assertEqual(response.context['avg_compatibility'], round((40 + 60 + 90) / 3, 1))
+        self.assertEqual(len(response.context['applications']), 3)
+
+    def test_backfill_links_old_applications_by_email(self):
+        migration = import_module('animals.migrations.0010_link_applications_to_users')
+        User.objects.create_user('late', 'owner@example.com', 'password123')
+        old = [self.application(None, email) for email in ('owner@example.com', 'other@example.com', 'guest@example.com')]
+        linked = self.application(self.other, 'owner@example.com')
+
+        with mock.patch.object(migration, 'BATCH_SIZE', 1):
+            migration.link_applications_to_users(apps, connection.schema_editor())
+
+        users = [AdoptionApplication.objects.get(pk=application.pk).user for application in old]
+        self.assertEqual(users, [self.user, self.other, None])
+        linked.refresh_from_db()
+        self.assertEqual(linked.user, self.other)
+
+
+class ReverseMatchingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animal = Animal.objects.create(
+            shelter=shelter, name='Шарик', species='dog', age=3, size_category='large', activity_level=8
+        )
+        rng = random.Random(7)
+        users = User.objects.bulk_create([User(username=f'adopter{index}') for index in range(60)])
+        UserProfile.objects.bulk_create([synthetic_profile(rng, user.pk) for user in users])
+
+    def expected(self, k):
+        scores = [
+            (profile.calculate_compatibility_with_animal(self.animal), profile.pk)
+            for profile in UserProfile.objects.all()
+        ]
+        return sorted(scores, key=lambda item: (-item[0], item[1]))[:k]
+
+    def ranking(self, adopters):
+        return [(score, profile.pk) for profile, score in adopters]
+
+    def test_matches_scoring_one_profile_at_a_time(self):
+        for k, chunk_size in [(5, 7), (10, 1000), (100, 16)]:
+            with self.subTest(k=k, chunk_size=chunk_size):
+                adopters = top_adopters(self.animal, k=k, chunk_size=chunk_size, processes=0)
+                self.assertEqual(self.ranking(adopters), self.expected(k))
+
+    @override_settings(MATCHING_PROCESSES=2)
+    def test_process_pool(self):
+        adopters = top_adopters(self.animal, k=8, chunk_size=10)
+        self.assertEqual(self.ranking(adopters), self.expected(8))
+
+    def test_admin_action(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password123'))
+        response = self.client.post(reverse('admin:animals_animal_changelist'), {
+            'action': 'show_top_adopters', '_selected_action': [self.animal.pk],
+        })
+
+        self.assertTemplateUsed(response, 'admin/animals/animal/top_adopters.html')
+        [(animal, adopters)] = response.context['results']
+        self.assertEqual(animal, self.animal)
+        self.assertEqual(self.ranking(adopters), self.expected(20))
+        self.assertContains(response, adopters[0][0].user.username)
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class SimilarAnimalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+
+    def setUp(self):
+        cache.clear()
+        similar._index = None
+        self.addCleanup(setattr, similar, '_index', None)
+
+    def create(self, name, species='dog', size='large', age=3, traits=(5, 5, 5), **fields):
+        child, pets, activity = traits
+        with self.captureOnCommitCallbacks(execute=True):
+            return Animal.objects.create(
+                shelter=self.shelter, name=name, species=species, size_category=size, age=age,
+                child_friendly=child, other_pet_friendly=pets, activity_level=activity, **fields
+            )
+
+    def nearest(self, animal, k):
+        # Эталон: перебор всех доступных животных
+        point = similar.animal_vector(animal)
+        distances = sorted(
+            float(((similar.animal_vector(other) - point) ** 2).sum())
+            for other in Animal.objects.filter(is_available=True).exclude(pk=animal.pk)
+        )
+        return distances[:k]
+
+    def distances(self, animal, animal_ids):
+        point = similar.animal_vector(animal)
+        animals = Animal.objects.in_bulk(animal_ids)
+        return [float(((similar.animal_vector(animals[pk]) - point) ** 2).sum()) for pk in animal_ids]
+
+    def test_detail_shows_similar_animals(self):
+        animal = self.create('Рекс')
+        twin = self.create('Граф', traits=(5, 5, 6))
+        older = self.create('Бим', age=6)
+        self.create('Лайма', traits=(5, 5, 5), is_available=False)
+        self.create('Мурка', species='cat')
+        self.create('Тузик', size='small', traits=(9, 1, 9))
+
+        response = self.client.get(reverse('animal_detail', args=[animal.pk]))
+
+        self.assertEqual(response.context['similar_animals'][:2], [twin, older])
+        self.assertNotIn('Лайма', [other.name for other in response.context['similar_animals']])
+        self.assertContains(response, 'Похожие животные')
+
+    def test_matches_brute_force(self):
+        rng = random.Random(3)
+        Animal.objects.bulk_create([synthetic_animal(rng, self.shelter.pk, index) for index in range(300)])
+        bump_catalog_version()
+
+        for animal in Animal.objects.order_by('?')[:25]:
+            with self.subTest(animal=animal.pk):
+                found = similar.similar_animal_ids(animal, k=5)
+                self.assertNotIn(animal.pk, found)
+                self.assertEqual(self.distances(animal, found), self.nearest(animal, 5))
+
+    def test_index_follows_changes_incrementally(self):
+        animal = self.create('Рекс')
+        neighbour = self.create('Граф', traits=(5, 5, 6))
+        self.create('Бим', traits=(9, 9, 9))
+        self.assertEqual(similar.similar_animal_ids(animal, k=1), [neighbour.pk])
+        tree = similar.similarity_index().tree
+
+        neighbour.activity_level = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            neighbour.save()
+        moved = self.create('Джек', traits=(5, 6, 5))
+
+        self.assertEqual(similar.similar_animal_ids(animal, k=1), [moved.pk])
+        self.assertIs(similar.similarity_index().tree, tree)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            moved.delete()
+        self.assertNotEqual(similar.similar_animal_ids(animal, k=1), [moved.pk])
+        self.assertIs(similar.similarity_index().tree, tree)
+
+        # Версия без журнала изменений - полная перестройка
+        bump_catalog_version()
+        self.assertIsNot(similar.similarity_index().tree, tree)
+
+    def test_pending_changes_are_compacted(self):
+        animal = self.create('Рекс')
+        similar.similar_animal_ids(animal)
+        tree = similar.similarity_index().tree
+
+        with mock.patch.object(similar, 'MAX_PENDING', 1):
+            first = self.create('Граф', traits=(5, 5, 6))
+            second = self.create('Бим', traits=(5, 6, 6))
+            found = similar.similar_animal_ids(animal, k=2)
+
+        index = similar.similarity_index()
+        self.assertIsNot(index.tree, tree)
+        self.assertEqual(index.changed, {})
+        self.assertEqual(found, [first.pk, second.pk])
+        self.assertEqual(similar.similar_animal_ids(animal, k=2), [first.pk, second.pk])
+
+
+@override_settings(BACKGROUND_TASKS_SYNC=True)
+class CatalogSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        cls.animals = [
+            Animal.objects.create(
+                shelter=cls.shelter, name=name, species=species, size_category=size, age=age,
+                child_friendly=child, other_pet_friendly=pets, activity_level=activity
+            )
+            for name, species, size, age, child, pets, activity in [
+                ('Рекс', 'dog', 'large', 3, 8, 4, 9),
+                ('Мурка', 'cat', 'small', 1, 6, 7, 2),
+            ]
+        ]
+        Animal.objects.create(shelter=cls.shelter, name='Лайма', species='dog', age=2, is_available=False)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        snapshot_dir = override_settings(CATALOG_SNAPSHOT_DIR=directory.name)
+        snapshot_dir.enable()
+        self.addCleanup(snapshot_dir.disable)
+        cache.clear()
+        snapshot._current = None
+        self.addCleanup(setattr, snapshot, '_current', None)
+        snapshot._refresh_queued = False
+        self.addCleanup(setattr, snapshot, '_refresh_queued', False)
+
+    def files(self):
+        return sorted(path.name for path in self.directory.iterdir())
+
+    def test_snapshot_matches_catalog(self):
+        array = snapshot.catalog_snapshot()
+
+        self.assertIsInstance(array, np.memmap)
+        self.assertFalse(array.flags.writeable)
+        self.assertEqual(array['id'].tolist(), [animal.pk for animal in self.animals])
+        traits = load_traits(Animal.objects.filter(is_available=True).order_by('pk'))
+        for field in ('child_friendly', 'other_pet_friendly', 'activity_level', 'size_category', 'species'):
+            self.assertEqual(array[field].tolist(), traits[field].tolist())
+
+        profile = synthetic_profile(random.Random(5), None)
+        self.assertEqual(
+            score_animals(profile, array).tolist(),
+            [reference_compatibility(profile, animal) for animal in self.animals]
+        )
+
+    def run_worker(self, code, cache_dir):
+        # Отдельный процесс с тем же общим кэшем и папкой снимков. Его база
+        # пуста, поэтому любой запрос к животным в нем завершился бы ошибкой
+        completed = subprocess.run(
+            [sys.executable, '-c', (
+                'import json, django; django.setup(); '
+                'from animals.snapshot import catalog_snapshot; '
+                'from animals.statistics import bump_catalog_version; '
+                + code
+            )],
+            cwd=settings.BASE_DIR, check=True, capture_output=True, text=True,
+            env=dict(
+                os.environ,
+                DJANGO_SETTINGS_MODULE='config.settings',
+                CACHE_BACKEND='django.core.cache.backends.filebased.FileBasedCache',
+                CACHE_LOCATION=cache_dir,
+                CATALOG_SNAPSHOT_DIR=str(self.directory),
+                DATABASE_URL=str(self.directory / 'empty.sqlite3'),
+            ),
+        )
+        return completed.stdout.strip()
+
+    def test_processes_share_the_file(self):
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        shared_cache = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': cache_dir.name,
+        }})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+
+        snapshot.catalog_snapshot()
+        [name] = self.files()
+        with self.assertNumQueries(0):
+            snapshot.catalog_snapshot()
+
+        # Другой процесс отображает готовый файл, не читая базу
+        mapped = json.loads(self.run_worker(
+            "array = catalog_snapshot(); print(json.dumps([str(array.filename), array['id'].tolist()]))",
+            cache_dir.name,
+        ))
+        self.assertEqual(mapped, [str(self.directory / name), [animal.pk for animal in self.animals]])
+
+        # Изменение в другом процессе меняет общую версию, и этот процесс
+        # переходит на новый снимок, а старый файл удаляется
+        animal = Animal.objects.create(shelter=self.shelter, name='Бим', species='dog', age=4)
+        self.assertEqual(len(snapshot.catalog_snapshot()), 2)
+        self.run_worker(f'bump_catalog_version([{animal.pk}])', cache_dir.name)
+
+        self.assertEqual(len(snapshot.catalog_snapshot()), 3)
+        self.assertNotIn(name, self.files())
+        self.assertEqual(len(self.files()), 1)
+
+    def test_process_local_cache_is_reported(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['animals.W001'])
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(self.directory),
+        }}):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_snapshot_is_swapped_after_changes(self):
+        old = snapshot.catalog_snapshot()
+        old_files = self.files()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Animal.objects.create(shelter=self.shelter, name='Бим', species='dog', age=4)
+
+        files = self.files()
+        self.assertEqual(len(files), 1)
+        self.assertNotEqual(files, old_files)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(snapshot.catalog_snapshot()), 3)
+        # Уже отображенный старый снимок остается читаемым
+        self.assertEqual(len(old), 2)
+
+    def test_page_scores_use_snapshot_rows(self):
+        profile = synthetic_profile(random.Random(5), None)
+        array = snapshot.catalog_snapshot()
+        rows = snapshot.snapshot_traits(self.animals[::-1])
+        self.assertEqual(rows['id'].tolist(), [animal.pk for animal in self.animals[::-1]])
+        self.assertEqual(rows.dtype, array.dtype)
+
+        # Животного нет в снимке - считаем по объектам
+        missing = Animal.objects.get(name='Лайма')
+        traits = snapshot.snapshot_traits([self.animals[0], missing])
+        self.assertEqual(
+            score_animals(profile, traits).tolist(),
+            [reference_compatibility(profile, animal) for animal in (self.animals[0], missing)]
+        )
+
+    def test_previous_snapshot_is_served_while_rebuilding(self):
+        old = snapshot.catalog_snapshot()
+        rex = self.animals[0]
+        Animal.objects.filter(pk=rex.pk).update(child_friendly=1)
+        rex.refresh_from_db()
+        bump_catalog_version([rex.pk])
+
+        # Новая версия собирается в фоне, запрос не ждет и не читает базу
+        with mock.patch.object(snapshot, 'submit_background') as submit:
+            with self.assertNumQueries(0):
+                self.assertIs(snapshot.catalog_snapshot(), old)
+                self.assertIs(snapshot.catalog_snapshot(), old)
+            submit.assert_called_once_with(snapshot._refresh)
+            # Трейты страницы не берутся из устаревшего снимка
+            self.assertEqual(snapshot.snapshot_traits([rex])['child_friendly'].tolist(), [1])
+
+        snapshot._refresh()
+        array = snapshot.catalog_snapshot()
+        self.assertIsNot(array, old)
+        self.assertEqual(array['child_friendly'].tolist()[0], 1)
+
+
+class ScoringEvaluationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(11)
+        shelter = Shelter.objects.create(name='Приют', address='Екатеринбург', phone='123')
+        animals = Animal.objects.bulk_create([synthetic_animal(rng, shelter.pk, index) for index in range(20)])
+        users = User.objects.bulk_create([User(username=f'adopter{index}') for index in range(30)])
+        UserProfile.objects.bulk_create([synthetic_profile(rng, user.pk) for user in users])
+        AdoptionApplication.objects.bulk_create([
+            AdoptionApplication(
+                animal=rng.choice(animals), user=rng.choice(users), full_name='Заявитель',
+                email='adopter@example.com', phone='123', compatibility_score=round(rng.uniform(30, 95), 1),
+                status=rng.choice(['completed', 'rejected', 'rejected', 'pending']),
+            )
+            for _ in range(150)
+        ] + [
+            # Заявка без учетной записи не участвует: анкеты автора нет
+            AdoptionApplication(animal=animals[0], full_name='Гость', email='guest@example.com',
+                                phone='123', status='completed'),
+        ])
+
+    def evaluate(self, *args):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'evaluation.json')
+            call_command('evaluate_scoring', '--json', path, *args, stdout=StringIO())
+            with open(path, encoding='utf-8') as file:
+                return json.load(file)
+
+    def expected_auc(self, weights=None):
+        # Эталон: перебор всех пар "завершенная - отклоненная"
+        applications = AdoptionApplication.objects.filter(
+            status__in=['completed', 'rejected'], user__isnull=False
+        ).select_related('animal', 'user__profile')
+        scores = {'completed': [], 'rejected': []}
+        for application in applications:
+            score = application.user.profile.calculate_compatibility_with_animal(application.animal, weights)
+            scores[application.status].append(score)
+        pairs = list(itertools.product(scores['completed'], scores['rejected']))
+        return round(sum(1.0 if high > low else 0.5 if high == low else 0.0 for high, low in pairs) / len(pairs), 4)
+
+    def test_engine_weights(self):
+        profile = synthetic_profile(random.Random(5), None)
+        traits = load_traits(Animal.objects.all())
+        default = score_animals(profile, traits)
+
+        self.assertEqual(score_animals(profile, traits, DEFAULT_WEIGHTS).tolist(), default.tolist())
+        doubled = {name: weight * 2 for name, weight in DEFAULT_WEIGHTS.items()}
+        self.assertEqual(score_animals(profile, traits, doubled).tolist(), (default * 2).round(1).tolist())
+
+    def test_metrics_match_pairwise_ranking(self):
+        results = self.evaluate('--processes', '1', '--chunk-size', '7', '--weights', 'children=50')
+
+        applications = AdoptionApplication.objects.filter(status__in=['completed', 'rejected'], user__isnull=False)
+        self.assertEqual(set(results), {'stored', 'current', 'children=50'})
+        current = results['current']
+        self.assertEqual(current['applications'], applications.count())
+        self.assertEqual(current['completed'], applications.filter(status='completed').count())
+        self.assertEqual(sum(row['applications'] for row in current['calibration']), current['applications'])
+        self.assertEqual(current['auc'], self.expected_auc())
+
+        weights = dict(DEFAULT_WEIGHTS, children=50)
+        total = sum(weights.values())
+        normalized = {name: weight * 100 / total for name, weight in weights.items()}
+        self.assertEqual(results['children=50']['auc'], self.expected_auc(normalized))
+
+    def test_process_pool(self):
+        self.assertEqual(
+            self.evaluate('--processes', '2', '--chunk-size', '10', '--weights', 'pets=0'),
+            self.evaluate('--processes', '1', '--weights', 'pets=0'),
+        )
+
+    def test_invalid_weights(self):
+        for value in ['garden=10', 'children=много', 'children=-1']:
+            with self.subTest(value=value), self.assertRaises(CommandError):
+                call_command('evaluate_scoring', '--weights', value, stdout=StringIO())
@@ -0,0 +1,161 @@
+import json
+import logging
+import random
+from contextvars import ContextVar
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+# Замеры текущего запроса; None - запрос не попал в выборку
+_current = ContextVar('animals_request_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.started = perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.sections = {}
+
+    def add(self, name, duration):
+        self.sections[name] = self.sections.get(name, 0.0) + duration
+
+
+class timed:
+    # Именованный участок запроса: with timed('scoring'): ...
+    # Вне выборки стоит одно чтение ContextVar
+    __slots__ = ('name', 'timings', 'started')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.timings = _current.get()
+        if self.timings is not None:
+            self.started = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.add(self.name, perf_counter() - self.started)
+
+
+def record_query(execute, sql, params, many, context):
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql_count += 1
+        timings.sql_time += perf_counter() - started
+
+
+def install_query_timer(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class TimedTemplate:
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return self.template.render(context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    # Обычный бэкенд Django, который замеряет рендер шаблона целиком
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def server_timing_header(timings, total):
+    metrics = [f'total;dur={total * 1000:.1f}']
+    metrics.append(f'sql;dur={timings.sql_time * 1000:.1f};desc="{timings.sql_count} queries"')
+    metrics.extend(f'{name};dur={duration * 1000:.1f}' for name, duration in timings.sections.items())
+    return ', '.join(metrics)
+
+
+class ServerTimingMiddleware:
+    # Для доли запросов SERVER_TIMING_SAMPLE_RATE считает запросы к БД, рендер
+    # шаблона и именованные участки и отдает их в Server-Timing и в лог.
+    # При нулевой доле Django вовсе не включает middleware в цепочку
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.SERVER_TIMING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+        connection_created.connect(install_query_timer, dispatch_uid='animals-server-timing')
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def start(self):
+        # Новые соединения получают счетчик через connection_created,
+        # уже открытые - здесь
+        for connection in connections.all(initialized_only=True):
+            install_query_timer(connection=connection)
+        return RequestTimings()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        timings = self.start()
+        token = _current.set(timings)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        # Соединения с БД живут в синхронном потоке запроса - счетчик ставится там
+        timings = await sync_to_async(self.start)()
+        token = _current.set(timings)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timings)
+
+    def finish(self, request, response, timings):
+        total = perf_counter() - timings.started
+        response['Server-Timing'] = server_timing_header(timings, total)
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'sql_queries': timings.sql_count,
+            'sql_ms': round(timings.sql_time * 1000, 1),
+            'sections': {name: round(duration * 1000, 1) for name, duration in timings.sections.items()},
+        }, ensure_ascii=False))
+        return response
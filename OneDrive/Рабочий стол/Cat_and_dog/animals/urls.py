@@ -4,13 +4,19 @@ from . import views
 
 urlpatterns = [
     path('', views.AnimalListView.as_view(), name='animal_list'),
+    path('cards/', views.AnimalCardsView.as_view(), name='animal_cards'),
     path('animal/<int:pk>/', views.AnimalDetailView.as_view(), name='animal_detail'),
+    path('animal/<int:pk>/chart-data/', views.animal_chart_data, name='animal_chart_data'),
     path('animal/<int:animal_id>/adopt/', views.submit_adoption_application, name='submit_adoption'),
     path('shelter-stats/', views.shelter_statistics, name='shelter_stats'),
+    path('shelter-stats/chart-data/', views.shelter_chart_data, name='shelter_chart_data'),
     path('register/', views.register, name='register'),
     path('login/', views.user_login, name='login'),
     path('logout/', views.custom_logout, name='logout'),
     path('profile/edit/', views.edit_profile, name='edit_profile'),
     path('recommendations/', views.personal_recommendations, name='personal_recommendations'),
+    path('recommendations/chart-data/', views.recommendations_chart_data, name='recommendations_chart_data'),
     path('my-applications/', views.my_applications, name='my_applications'),
+    path('my-applications/chart-data/', views.applications_chart_data, name='applications_chart_data'),
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
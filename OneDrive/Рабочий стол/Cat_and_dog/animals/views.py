@@ -1,23 +1,58 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
+from django.template.response import TemplateResponse
 from django.views.generic import ListView, DetailView
 from django.contrib import messages
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.models import User
-from django.db.models import Q, Avg, Count
-import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+from django.conf import settings
+from django.db.models import Q, Avg, Count, Max
+from django.http import Http404, HttpResponse
+from django.urls import reverse
 from .models import Animal, Shelter, UserProfile, AdoptionApplication
+from .background import run_cpu_bound
+from .metrics import registry
+from .pagination import akeyset_paginate
+from .routers import use_primary
+from .search import search_animals
+from .statistics import application_summary, catalog_count, catalog_stats, shelter_stats
+from .timing import timed
 from .forms import AnimalSearchForm, AdoptionApplicationForm, UserRegistrationForm, UserProfileForm
 
 
+def user_profile(user):
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.profile
+    except UserProfile.DoesNotExist:
+        return None
+
+
+async def auser_profile(request):
+    user = await request.auser()
+    # Шаблон рендерится в синхронном потоке - отдаем ему уже загруженного
+    # пользователя, чтобы не читать его из базы второй раз
+    request.user = user
+    if not user.is_authenticated:
+        return None
+    return await UserProfile.objects.filter(user=user).afirst()
+
+
 class AnimalListView(ListView):
     model = Animal
     template_name = 'animals/animal_list.html'
     context_object_name = 'animals'
-    paginate_by = 6
+    page_size = 6
+    fragment = False
+
+    async def get(self, request, *args, **kwargs):
+        self.profile = await auser_profile(request)
+        self.object_list = self.get_queryset()
+        context = await self.aget_context_data()
+        return self.render_to_response(context)
 
     def get_queryset(self):
         queryset = Animal.objects.filter(is_available=True).select_related('shelter')
@@ -30,160 +65,185 @@ class AnimalListView(ListView):
         if size:
             queryset = queryset.filter(size_category=size)
 
-        sort_by = self.request.GET.get('sort_by', 'name')
-        if sort_by in ['name', 'age', 'child_friendly']:
-            queryset = queryset.order_by(sort_by)
+        # Ключи сортировки; id для однозначного порядка добавляет пагинация
+        self.ordering_keys = ['name']
+        sort_by = self.request.GET.get('sort_by') or 'relevance'
+        if sort_by in ['age', 'child_friendly']:
+            self.ordering_keys = [sort_by]
+
+        profile = self.get_profile()
+        min_score = self.get_min_score()
+        if profile and (sort_by == 'compatibility' or min_score is not None):
+            from .scoring import compatibility_expression
+            queryset = queryset.annotate(compatibility=compatibility_expression(profile))
+            if min_score is not None:
+                queryset = queryset.filter(compatibility__gte=min_score)
+            if sort_by == 'compatibility':
+                self.ordering_keys = ['-compatibility', 'name']
 
         search = self.request.GET.get('search')
         if search:
-            queryset = queryset.filter(Q(name__icontains=search) | Q(breed__icontains=search))
+            queryset = search_animals(queryset, search)
+            if sort_by == 'relevance':
+                self.ordering_keys = ['-search_rank', 'name']
 
         return queryset
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    def get_profile(self):
+        if not hasattr(self, 'profile'):
+            self.profile = user_profile(self.request.user)
+        return self.profile
+
+    def get_min_score(self):
+        try:
+            return float(self.request.GET['min_score'])
+        except (KeyError, ValueError):
+            return None
+
+    async def attach_compatibility(self, profile, animals):
+        # Совместимость для всей страницы считается одним вызовом движка,
+        # а если запрос уже посчитал ее в SQL - берется из аннотации
+        animals = list(animals)
+        missing = [animal for animal in animals if not hasattr(animal, 'compatibility')]
+        if missing:
+            from .scoring import score_animals
+            from .snapshot import snapshot_traits
+
+            with timed('scoring'):
+                traits = await sync_to_async(snapshot_traits)(missing)
+                scores = await run_cpu_bound(score_animals, profile, traits)
+            for animal, score in zip(missing, scores.tolist()):
+                animal.compatibility = score
+        return animals
+
+    def get_total_count(self, profile):
+        # Точное число найденных животных - по желанию и только из кэша версии каталога
+        if not settings.CATALOG_SHOW_TOTAL:
+            return None
+        params = sorted(
+            (key, value) for key, value in self.request.GET.items()
+            if key not in ('cursor', 'sort_by') and value
+        )
+        if profile and self.get_min_score() is not None:
+            params.append(('profile', profile.pk, profile.get_scoring_snapshot()))
+        return catalog_count(self.object_list, params)
+
+    def page_url(self, name, cursor):
+        params = self.request.GET.copy()
+        params['cursor'] = cursor
+        return f'{reverse(name)}?{params.urlencode()}'
+
+    async def aget_context_data(self, **kwargs):
+        context = self.get_context_data(**kwargs)
+        page = await akeyset_paginate(
+            self.object_list, self.ordering_keys, self.request.GET.get('cursor'), self.page_size
+        )
+
+        profile = self.get_profile()
+        context['profile'] = profile
+        context['animals'] = page.object_list
+        if profile:
+            context['animals'] = await self.attach_compatibility(profile, page.object_list)
+
+        if page.has_next:
+            context['next_page_url'] = self.page_url('animal_list', page.next_cursor)
+            context['next_fragment_url'] = self.page_url('animal_cards', page.next_cursor)
+
+        if self.fragment:
+            return context
+
         context['search_form'] = AnimalSearchForm(self.request.GET)
 
-        animals = Animal.objects.filter(is_available=True).values()
-        if animals:
-            df = pd.DataFrame(animals)
-            context['stats'] = {
-                'total_count': len(df),
-                'avg_child_friendly': round(df['child_friendly'].mean(), 1),
-                'avg_activity': round(df['activity_level'].mean(), 1),
-                'cats_count': len(df[df['species'] == 'cat']),
-                'dogs_count': len(df[df['species'] == 'dog']),
-            }
-        else:
-            context['stats'] = {
-                'total_count': 0,
-                'avg_child_friendly': 0,
-                'avg_activity': 0,
-                'cats_count': 0,
-                'dogs_count': 0,
-            }
+        context['stats'] = await sync_to_async(catalog_stats)()
+        if not self.request.GET.get('cursor'):
+            context['total_count'] = await sync_to_async(self.get_total_count)(profile)
 
         return context
 
 
+class AnimalCardsView(AnimalListView):
+    # Только разметка карточек следующей страницы - для бесконечной прокрутки
+    template_name = 'animals/_animal_cards.html'
+    fragment = True
+
+
 class AnimalDetailView(DetailView):
     model = Animal
     template_name = 'animals/animal_detail.html'
     context_object_name = 'animal'
 
+    async def get(self, request, *args, **kwargs):
+        profile = await auser_profile(request)
+        self.object = await aget_object_or_404(self.get_queryset().select_related('shelter'), pk=kwargs['pk'])
+        context = self.get_context_data(object=self.object)
+        # Индекс похожих на NumPy нужен только карточке - грузим лениво
+        from .similar import similar_animals
+
+        with timed('similar'):
+            context['similar_animals'] = await sync_to_async(similar_animals)(self.object)
+
+        if request.user.is_authenticated:
+            from .score_store import ascore_for_animal
+
+            with timed('scoring'):
+                context['user_compatibility'] = await ascore_for_animal(profile, self.object) if profile else None
+
+        return self.render_to_response(context)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        context['chart_url'] = reverse('animal_chart_data', args=[self.object.pk])
+        return context
 
-        if self.request.user.is_authenticated:
-            try:
-                profile = self.request.user.profile
-                context['user_compatibility'] = profile.calculate_compatibility_with_animal(self.object)
-
-                categories = ['Дружелюбие к детям', 'Отношение к животным', 'Активность', 'Размер', 'Опыт']
-                user_prefs = [
-                    profile.pref_child_friendly,
-                    profile.pref_pet_friendly,
-                    profile.pref_activity_level,
-                    7 if profile.pref_size == 'medium' else 5 if profile.pref_size == 'small' else 9,
-                    min(profile.experience_years * 2, 10)
-                ]
-                animal_scores = [
-                    self.object.child_friendly,
-                    self.object.other_pet_friendly,
-                    self.object.activity_level,
-                    5 if self.object.size_category == 'small' else 7 if self.object.size_category == 'medium' else 9,
-                    5
-                ]
-
-                fig = go.Figure()
-                fig.add_trace(go.Bar(
-                    name='Ваши предпочтения',
-                    x=categories,
-                    y=user_prefs,
-                    marker_color='#4361ee'
-                ))
-                fig.add_trace(go.Bar(
-                    name='Характеристики животного',
-                    x=categories,
-                    y=animal_scores,
-                    marker_color='#4cc9f0'
-                ))
-
-                fig.update_layout(
-                    title=f'Совместимость: {context["user_compatibility"]}%',
-                    barmode='group',
-                    yaxis=dict(title='Оценка (1-10)', range=[0, 10]),
-                    height=400
-                )
-
-                context['compatibility_chart'] = fig.to_html(full_html=False, include_plotlyjs='cdn')
 
-            except UserProfile.DoesNotExist:
-                context['user_compatibility'] = None
-                context['compatibility_chart'] = None
-        else:
-            categories = ['Дети', 'Животные', 'Активность']
-            values = [
-                self.object.child_friendly,
-                self.object.other_pet_friendly,
-                self.object.activity_level
-            ]
-
-            fig = go.Figure(data=[
-                go.Bar(x=categories, y=values, marker_color='#4361ee')
-            ])
-            fig.update_layout(
-                title='Характеристики животного',
-                yaxis=dict(title='Оценка (1-10)', range=[0, 10]),
-                height=300
-            )
-            context['compatibility_chart'] = fig.to_html(full_html=False, include_plotlyjs='cdn')
+def animal_chart_data(request, pk):
+    from .charts import animal_chart, chart_response
+    from .score_store import score_for_animal
 
-        return context
+    animal = get_object_or_404(Animal, pk=pk)
+
+    if request.user.is_authenticated:
+        try:
+            profile = request.user.profile
+            with timed('scoring'):
+                compatibility = score_for_animal(profile, animal)
+            with timed('charts'):
+                return chart_response(request, animal_chart(animal, profile, compatibility), private=True)
+        except UserProfile.DoesNotExist:
+            pass
+
+    with timed('charts'):
+        return chart_response(request, animal_chart(animal))
 
 
 def shelter_statistics(request):
-    shelters = Shelter.objects.all()
-    data = []
-
-    for shelter in shelters:
-        animals = shelter.animals.filter(is_available=True)
-        if animals.exists():
-            df = pd.DataFrame(list(animals.values()))
-            data.append({
-                'name': shelter.name,
-                'animal_count': len(animals),
-                'avg_age': round(df['age'].mean(), 1),
-                'avg_child_friendly': round(df['child_friendly'].mean(), 1),
-            })
-
-    chart_html = None
-    if data:
-        df_stats = pd.DataFrame(data)
-        fig = go.Figure(data=[
-            go.Bar(
-                x=df_stats['name'],
-                y=df_stats['animal_count'],
-                text=df_stats['animal_count'],
-                textposition='auto',
-                marker_color='#4361ee'
-            )
-        ])
-        fig.update_layout(
-            title='Количество животных по приютам',
-            xaxis_title='Приюты',
-            yaxis_title='Количество животных',
-            height=500
-        )
-        chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
+    shelters = list(shelter_stats())
+    data = [
+        {
+            'name': shelter.name,
+            'animal_count': shelter.animal_count,
+            'avg_age': round(shelter.avg_age, 1),
+            'avg_child_friendly': round(shelter.avg_child_friendly, 1),
+        }
+        for shelter in shelters
+        if shelter.animal_count
+    ]
 
     return render(request, 'animals/shelter_stats.html', {
         'shelters': shelters,
-        'chart_html': chart_html,
         'stats_data': data
     })
 
 
+def shelter_chart_data(request):
+    from .charts import chart_response, shelter_chart
+
+    data = list(shelter_stats().filter(animal_count__gt=0).values('name', 'animal_count'))
+    with timed('charts'):
+        return chart_response(request, shelter_chart(data))
+
+
+@use_primary
 def submit_adoption_application(request, animal_id):
     animal = get_object_or_404(Animal, id=animal_id)
 
@@ -194,15 +254,19 @@ def submit_adoption_application(request, animal_id):
             application.animal = animal
 
             if request.user.is_authenticated:
+                application.user = request.user
+                from .score_store import score_for_animal
                 try:
                     profile = request.user.profile
-                    application.compatibility_score = profile.calculate_compatibility_with_animal(animal)
+                    with timed('scoring'):
+                        application.compatibility_score = score_for_animal(profile, animal)
                 except UserProfile.DoesNotExist:
                     application.compatibility_score = 50.0
             else:
                 application.compatibility_score = 50.0
 
             application.save()
+            registry.inc('animals_adoption_submissions_total', result='created')
 
             messages.success(
                 request,
@@ -211,6 +275,7 @@ def submit_adoption_application(request, animal_id):
                 'Мы свяжемся с вами в ближайшее время.'
             )
             return redirect('animal_detail', pk=animal_id)
+        registry.inc('animals_adoption_submissions_total', result='invalid')
     else:
         initial_data = {}
         if request.user.is_authenticated:
@@ -232,10 +297,22 @@ def submit_adoption_application(request, animal_id):
     detail_view.object = animal
     detail_view.request = request
     context.update(detail_view.get_context_data(object=animal))
+    from .similar import similar_animals
+
+    with timed('similar'):
+        context['similar_animals'] = similar_animals(animal)
+
+    if request.user.is_authenticated:
+        from .score_store import score_for_animal
+
+        profile = user_profile(request.user)
+        with timed('scoring'):
+            context['user_compatibility'] = score_for_animal(profile, animal) if profile else None
 
     return render(request, 'animals/animal_detail.html', context)
 
 
+@use_primary
 def register(request):
     if request.method == 'POST':
         username = request.POST.get('username', '').strip()
@@ -343,6 +420,7 @@ def custom_logout(request):
         return render(request, 'animals/logout_confirm.html')
 
 
+@use_primary
 @login_required
 def edit_profile(request):
     try:
@@ -366,119 +444,79 @@ def edit_profile(request):
 
 
 @login_required
-def personal_recommendations(request):
-    try:
-        profile = request.user.profile
-    except UserProfile.DoesNotExist:
+async def personal_recommendations(request):
+    profile = await auser_profile(request)
+    if profile is None:
         messages.warning(request, 'Заполните анкету для получения рекомендаций')
         return redirect('edit_profile')
 
-    animals = Animal.objects.filter(is_available=True).select_related('shelter')
+    from .score_store import aensure_profile_scores, available_scores
+
+    with timed('scoring'):
+        await aensure_profile_scores(profile)
+    scores = available_scores(profile)
+    summary = await scores.aaggregate(
+        total=Count('id'),
+        avg_compatibility=Avg('score'),
+        top_compatibility=Max('score'),
+        cats_count=Count('id', filter=Q(animal__species='cat')),
+        dogs_count=Count('id', filter=Q(animal__species='dog')),
+    )
 
-    if not animals.exists():
+    if not summary['total']:
         messages.info(request, 'Нет доступных животных для рекомендаций')
-        return render(request, 'animals/personal_recommendations.html', {
+        return TemplateResponse(request, 'animals/personal_recommendations.html', {
             'recommendations': [],
             'stats': {},
             'profile': profile,
-            'chart_html': None
-        })
-
-    recommendations = []
-    for animal in animals:
-        compatibility = profile.calculate_compatibility_with_animal(animal)
-        recommendations.append({
-            'animal': animal,
-            'compatibility': compatibility
         })
 
-    recommendations.sort(key=lambda x: x['compatibility'], reverse=True)
-
-    df = pd.DataFrame([
+    recommendations = [
         {
-            'name': rec['animal'].name or "Безымянный",
-            'species': rec['animal'].species,
-            'compatibility': rec['compatibility'],
-            'shelter': rec['animal'].shelter.name,
-            'age': rec['animal'].age
-        }
-        for rec in recommendations
-    ])
-
-    stats = {}
-    chart_html = None
-
-    if not df.empty:
-        stats = {
-            'total': len(df),
-            'avg_compatibility': round(df['compatibility'].mean(), 1),
-            'cats_count': len(df[df['species'] == 'cat']),
-            'dogs_count': len(df[df['species'] == 'dog']),
-            'top_compatibility': df['compatibility'].iloc[0] if len(df) > 0 else 0,
+            'animal': score.animal,
+            'compatibility': score.score
         }
+        async for score in scores.select_related('animal__shelter')[:12]
+    ]
 
-        if len(df) >= 3:
-            top_10 = df.head(10)
-            fig = px.bar(
-                top_10,
-                x='name',
-                y='compatibility',
-                title='Топ-10 рекомендаций по совместимости',
-                labels={'name': 'Животное', 'compatibility': 'Совместимость (%)'},
-                color='compatibility',
-                color_continuous_scale='Viridis',
-                text='compatibility'
-            )
-            fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
-            fig.update_layout(
-                xaxis_tickangle=-45,
-                height=500,
-                showlegend=False
-            )
-            chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
+    stats = dict(summary, avg_compatibility=round(summary['avg_compatibility'], 1))
 
-    return render(
+    return TemplateResponse(
         request,
         'animals/personal_recommendations.html',
         {
-            'recommendations': recommendations[:12],
+            'recommendations': recommendations,
             'stats': stats,
             'profile': profile,
-            'chart_html': chart_html
         }
     )
 
 
 @login_required
-def my_applications(request):
-    applications = AdoptionApplication.objects.filter(
-        email=request.user.email
-    ).select_related('animal', 'animal__shelter').order_by('-created_at')
+def recommendations_chart_data(request):
+    from .charts import chart_response, recommendations_chart
+    from .score_store import available_scores, ensure_profile_scores
 
-    status_counts = {}
-    avg_compatibility = 0
+    try:
+        profile = request.user.profile
+    except UserProfile.DoesNotExist:
+        return chart_response(request, recommendations_chart([]), private=True)
 
-    if applications.exists():
-        df = pd.DataFrame(list(applications.values(
-            'status', 'compatibility_score'
-        )))
+    with timed('scoring'):
+        ensure_profile_scores(profile)
+    top_scores = list(available_scores(profile).values_list('animal__name', 'score')[:10])
+    with timed('charts'):
+        return chart_response(request, recommendations_chart(top_scores), private=True)
 
-        status_counts = df['status'].value_counts().to_dict()
-        avg_compatibility = round(df['compatibility_score'].mean(), 1)
 
-        if status_counts:
-            fig = px.pie(
-                values=list(status_counts.values()),
-                names=list(status_counts.keys()),
-                title='Статусы ваших заявок',
-                color=list(status_counts.keys()),
-                color_discrete_sequence=px.colors.sequential.Viridis
-            )
-            chart_html = fig.to_html(full_html=False, include_plotlyjs='cdn')
-        else:
-            chart_html = None
-    else:
-        chart_html = None
+@login_required
+def my_applications(request):
+    applications = AdoptionApplication.objects.filter(
+        user=request.user
+    ).select_related('animal', 'animal__shelter').order_by('-created_at')
+
+    status_counts, avg_compatibility = application_summary(applications)
+    if not status_counts:
         messages.info(request, 'У вас пока нет заявок на усыновление')
 
     return render(
@@ -488,6 +526,32 @@ def my_applications(request):
             'applications': applications,
             'status_counts': status_counts,
             'avg_compatibility': avg_compatibility,
-            'chart_html': chart_html
         }
-    )
\ No newline at end of file
+    )
+
+
+@login_required
+def applications_chart_data(request):
+    from .charts import applications_chart, chart_response
+
+    status_counts = dict(
+        AdoptionApplication.objects.filter(user=request.user)
+        .values_list('status')
+        .annotate(count=Count('id'))
+        .order_by('-count', 'status')
+    )
+    with timed('charts'):
+        return chart_response(request, applications_chart(status_counts), private=True)
+
+
+def metrics(request):
+    # Эндпоинт для Prometheus; с METRICS_TOKEN доступен только с заголовком
+    # Authorization: Bearer, без токена - только в режиме отладки
+    if not settings.METRICS_ENABLED or not (settings.METRICS_TOKEN or settings.DEBUG):
+        raise Http404
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+        return HttpResponse(status=401)
+
+    from .metrics import render as render_metrics
+
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,175 @@
+// Легкая отрисовка графиков в SVG по JSON с эндпоинтов */chart-data/
+(function () {
+    const SVG_NS = 'http://www.w3.org/2000/svg';
+    const VIRIDIS = ['#440154', '#3b528b', '#21918c', '#5ec962', '#fde725'];
+    const PIE_COLORS = ['#440154', '#3b528b', '#21918c', '#5ec962', '#fde725', '#4361ee'];
+    const MARGIN = {top: 50, right: 20, bottom: 60, left: 55};
+
+    function svgElement(name, attrs, parent) {
+        const element = document.createElementNS(SVG_NS, name);
+        Object.entries(attrs || {}).forEach(([key, value]) => element.setAttribute(key, value));
+        if (parent) {
+            parent.appendChild(element);
+        }
+        return element;
+    }
+
+    function text(parent, x, y, content, attrs) {
+        const element = svgElement('text', Object.assign({x: x, y: y, 'font-size': 12, fill: '#333'}, attrs), parent);
+        element.textContent = content;
+        return element;
+    }
+
+    function hexToRgb(hex) {
+        const value = parseInt(hex.slice(1), 16);
+        return [(value >> 16) & 255, (value >> 8) & 255, value & 255];
+    }
+
+    function viridis(ratio) {
+        const position = Math.min(Math.max(ratio, 0), 1) * (VIRIDIS.length - 1);
+        const index = Math.min(Math.floor(position), VIRIDIS.length - 2);
+        const start = hexToRgb(VIRIDIS[index]);
+        const end = hexToRgb(VIRIDIS[index + 1]);
+        const mix = start.map((channel, i) => Math.round(channel + (end[i] - channel) * (position - index)));
+        return `rgb(${mix.join(',')})`;
+    }
+
+    function createSvg(container, chart) {
+        const width = container.clientWidth || 600;
+        const height = chart.height || 400;
+        const svg = svgElement('svg', {
+            width: '100%',
+            height: height,
+            viewBox: `0 0 ${width} ${height}`,
+            role: 'img',
+            'aria-label': chart.title || ''
+        });
+        if (chart.title) {
+            text(svg, width / 2, 24, chart.title, {'text-anchor': 'middle', 'font-size': 16, 'font-weight': 'bold'});
+        }
+        container.replaceChildren(svg);
+        return {svg: svg, width: width, height: height};
+    }
+
+    function renderBar(container, chart) {
+        const {svg, width, height} = createSvg(container, chart);
+        const series = chart.series || [];
+        const labels = chart.labels || [];
+        const bottom = MARGIN.bottom + (chart.rotate_labels ? 40 : 0);
+        const plotWidth = width - MARGIN.left - MARGIN.right;
+        const plotHeight = height - MARGIN.top - bottom;
+        const allValues = series.flatMap(item => item.values);
+        const maxValue = chart.y_max || Math.max(1, ...allValues) * 1.1;
+        const scale = value => plotHeight - (value / maxValue) * plotHeight;
+        const plot = svgElement('g', {transform: `translate(${MARGIN.left},${MARGIN.top})`}, svg);
+
+        for (let i = 0; i <= 5; i++) {
+            const value = maxValue * i / 5;
+            const y = scale(value);
+            svgElement('line', {x1: 0, x2: plotWidth, y1: y, y2: y, stroke: '#e9ecef'}, plot);
+            text(plot, -8, y + 4, Number.isInteger(value) ? value : value.toFixed(1), {'text-anchor': 'end', fill: '#6c757d'});
+        }
+
+        const groupWidth = plotWidth / Math.max(labels.length, 1);
+        const barWidth = groupWidth * 0.8 / Math.max(series.length, 1);
+        series.forEach((item, seriesIndex) => {
+            item.values.forEach((value, index) => {
+                const x = index * groupWidth + groupWidth * 0.1 + seriesIndex * barWidth;
+                const y = scale(value);
+                const color = item.colorscale ? viridis(value / maxValue) : (item.color || '#4361ee');
+                const bar = svgElement('rect', {x: x, y: y, width: barWidth, height: plotHeight - y, fill: color}, plot);
+                const title = svgElement('title', {}, bar);
+                title.textContent = `${labels[index]}: ${value}${chart.value_suffix || ''}`;
+                if (chart.show_values) {
+                    text(plot, x + barWidth / 2, y - 4, `${value}${chart.value_suffix || ''}`, {'text-anchor': 'middle'});
+                }
+            });
+        });
+
+        labels.forEach((label, index) => {
+            const x = index * groupWidth + groupWidth / 2;
+            const attrs = chart.rotate_labels
+                ? {'text-anchor': 'end', transform: `rotate(-45 ${x} ${plotHeight + 16})`}
+                : {'text-anchor': 'middle'};
+            text(plot, x, plotHeight + 16, label, attrs);
+        });
+
+        if (chart.y_title) {
+            text(svg, 14, MARGIN.top + plotHeight / 2, chart.y_title, {
+                'text-anchor': 'middle',
+                transform: `rotate(-90 14 ${MARGIN.top + plotHeight / 2})`
+            });
+        }
+        if (chart.x_title) {
+            text(svg, MARGIN.left + plotWidth / 2, height - 8, chart.x_title, {'text-anchor': 'middle'});
+        }
+
+        const named = series.filter(item => item.name && !item.colorscale);
+        named.forEach((item, index) => {
+            const x = MARGIN.left + index * 200;
+            svgElement('rect', {x: x, y: 34, width: 12, height: 12, fill: item.color}, svg);
+            text(svg, x + 18, 44, item.name);
+        });
+    }
+
+    function renderPie(container, chart) {
+        const {svg, width, height} = createSvg(container, chart);
+        const values = chart.values || [];
+        const total = values.reduce((sum, value) => sum + value, 0);
+        const radius = Math.min(width / 2, height - MARGIN.top) / 2 - 10;
+        const centerX = Math.min(width / 3, radius + 20);
+        const centerY = MARGIN.top + radius;
+        let angle = -Math.PI / 2;
+
+        values.forEach((value, index) => {
+            const color = PIE_COLORS[index % PIE_COLORS.length];
+            const share = total ? value / total : 0;
+            const next = angle + share * 2 * Math.PI;
+            let slice;
+            if (share >= 1) {
+                slice = svgElement('circle', {cx: centerX, cy: centerY, r: radius, fill: color}, svg);
+            } else {
+                const large = next - angle > Math.PI ? 1 : 0;
+                const start = [centerX + radius * Math.cos(angle), centerY + radius * Math.sin(angle)];
+                const end = [centerX + radius * Math.cos(next), centerY + radius * Math.sin(next)];
+                slice = svgElement('path', {
+                    d: `M${centerX},${centerY} L${start} A${radius},${radius} 0 ${large} 1 ${end} Z`,
+                    fill: color,
+                    stroke: '#fff'
+                }, svg);
+            }
+            const title = svgElement('title', {}, slice);
+            title.textContent = `${chart.labels[index]}: ${value}`;
+
+            const legendY = MARGIN.top + index * 22;
+            svgElement('rect', {x: centerX + radius + 30, y: legendY, width: 12, height: 12, fill: color}, svg);
+            text(svg, centerX + radius + 48, legendY + 11, `${chart.labels[index]} — ${value} (${(share * 100).toFixed(1)}%)`);
+            angle = next;
+        });
+    }
+
+    const RENDERERS = {bar: renderBar, pie: renderPie};
+
+    function loadChart(container) {
+        fetch(container.dataset.chartUrl, {credentials: 'same-origin', headers: {Accept: 'application/json'}})
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error(response.statusText);
+                }
+                return response.json();
+            })
+            .then(chart => {
+                const render = RENDERERS[chart.type];
+                if (render) {
+                    render(container, chart);
+                }
+            })
+            .catch(() => {
+                container.textContent = 'Не удалось загрузить график';
+            });
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        document.querySelectorAll('[data-chart-url]').forEach(loadChart);
+    });
+})();